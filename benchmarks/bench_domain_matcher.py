@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark for the blacklist domain matcher.
+
+Builds a trie from N synthetic blacklist rules (default 100k) and compares lookups
+against the linear scan it replaces. Run from the repository root:
+
+    python benchmarks/bench_domain_matcher.py [--domains 100000] [--lookups 100000]
+"""
+import sys
+import time
+import random
+import argparse
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from contest_manager.utils.domain_matcher import build_matcher, is_blocked, save_matcher, load_matcher, source_digest
+
+def synthetic_rules(count, rng):
+    """Generate `count` blacklist rules: mostly plain domains, some wildcard and allow rules."""
+    rules = []
+    for i in range(count):
+        name = f"site{i}.{rng.choice(['com', 'net', 'org', 'io', 'com.bd'])}"
+        roll = rng.random()
+        if roll < 0.1:
+            rules.append(f"*.{name}")
+        elif roll < 0.15:
+            rules.append(f"!static.{name}")
+        else:
+            rules.append(name)
+    return rules
+
+def synthetic_names(rules, count, rng):
+    """Generate lookup names: half under blacklisted domains, half unrelated."""
+    names = []
+    for i in range(count):
+        if i % 2:
+            base = rng.choice(rules).lstrip('!*.')
+            names.append(f"{rng.choice(['www', 'api', 'static', 'a.b'])}.{base}")
+        else:
+            names.append(f"host{i}.example{i % 997}.org")
+    return names
+
+def timed(label, func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    print(f"{label:<32} {time.perf_counter() - started:8.3f}s")
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the blacklist domain matcher")
+    parser.add_argument('--domains', type=int, default=100000, help='Number of blacklist rules (default: 100000)')
+    parser.add_argument('--lookups', type=int, default=100000, help='Number of names to look up (default: 100000)')
+    parser.add_argument('--linear-lookups', type=int, default=200, help='Lookups for the linear-scan baseline (default: 200)')
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    rules = synthetic_rules(args.domains, rng)
+    names = synthetic_names(rules, args.lookups, rng)
+    print(f"{args.domains} rules, {args.lookups} lookups")
+
+    trie = timed("build trie", build_matcher, rules)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "matcher.json"
+        digest = source_digest(rules)
+        timed("save trie", save_matcher, path, trie, digest)
+        print(f"{'compiled size':<32} {path.stat().st_size / 1e6:8.2f}MB")
+        timed("load trie", load_matcher, path, digest)
+
+    started = time.perf_counter()
+    hits = sum(1 for name in names if is_blocked(trie, name))
+    elapsed = time.perf_counter() - started
+    print(f"{'trie lookups':<32} {elapsed:8.3f}s  ({elapsed / len(names) * 1e6:.2f}us/lookup, {hits} blocked)")
+
+    suffixes = [rule.lstrip('!*.') for rule in rules]
+    started = time.perf_counter()
+    for name in names[:args.linear_lookups]:
+        any(name == suffix or name.endswith('.' + suffix) for suffix in suffixes)
+    elapsed = time.perf_counter() - started
+    print(f"{'linear scan lookups':<32} {elapsed:8.3f}s  ({elapsed / args.linear_lookups * 1e6:.2f}us/lookup)")
+
+if __name__ == "__main__":
+    main()
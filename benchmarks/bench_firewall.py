@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+Benchmark for applying, removing and checking internet restrictions, without root.
+
+Fake iptables, ip6tables, iptables-restore, ip6tables-restore, iptables-save,
+ip6tables-save, ipset and nft executables are put first on PATH; they only record
+each invocation. Synthetic blacklists and caches of increasing size are generated
+in a temporary directory, and for every size and backend the benchmark measures wall
+time, the number of firewall subprocesses and the peak Python memory of
+apply_restrictions_from_cache, unrestrict_internet and internet_restriction_check.
+
+Run from the repository root:
+
+    python benchmarks/bench_firewall.py [--sizes 100,1000,10000,50000] [--output bench.json]
+
+Results are printed as a table and written as JSON (one record per size, backend and
+operation) so runs can be compared over time.
+"""
+import io
+import os
+import sys
+import json
+import time
+import getpass
+import argparse
+import platform
+import tempfile
+import tracemalloc
+import contextlib
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from contest_manager.utils import internet_handler
+from contest_manager.utils.cache_handler import new_cache, save_cache
+from contest_manager.utils.stub_resolver_handler import DEFAULT_STUB_PORT
+
+DEFAULT_SIZES = "100,1000,10000,50000"
+DEFAULT_BACKENDS = "iptables-restore,ipset,nftables,iptables"
+# The legacy backend starts one process per rule; beyond this size it is skipped by default
+DEFAULT_LEGACY_MAX = 1000
+FAKE_COMMANDS = (
+    "iptables", "ip6tables", "iptables-restore", "ip6tables-restore",
+    "iptables-save", "ip6tables-save", "ipset", "nft",
+)
+# The iptables tools keep the rules they are given, so save, -S and -C see earlier applies
+STATEFUL_COMMANDS = FAKE_COMMANDS[:6]
+FAKE_SCRIPT = """#!/bin/sh
+echo "$(basename "$0") $*" >> "{log}"
+case "$(basename "$0") $*" in
+  "ipset restore"*|"nft -f"*) cat > /dev/null ;;
+  "nft -j"*) exit 1 ;;
+esac
+exit 0
+"""
+FAKE_IPTABLES_SCRIPT = """#!{python} -S
+import os
+import sys
+
+name = os.path.basename(sys.argv[0])
+args = sys.argv[1:]
+with open({log!r}, "a") as f:
+    f.write(" ".join([name] + args) + "\\n")
+state_path = os.path.join({state!r}, name.split("-")[0])
+
+def load():
+    tables = {{}}
+    if os.path.exists(state_path):
+        with open(state_path) as f:
+            for line in f:
+                table, chain, rule = (line.rstrip("\\n").split("\\t") + [""])[:3]
+                rules = tables.setdefault(table, {{"OUTPUT": []}}).setdefault(chain, [])
+                if rule:
+                    rules.append(rule)
+    return tables
+
+def store(tables):
+    with open(state_path, "w") as f:
+        for table, chains in tables.items():
+            for chain, rules in chains.items():
+                f.write(table + "\\t" + chain + "\\n")
+                f.writelines(table + "\\t" + chain + "\\t" + rule + "\\n" for rule in rules)
+
+def same(rule, tokens):
+    return [token.strip('"') for token in rule.split()] == [token.strip('"') for token in tokens]
+
+def run(chains, tokens):
+    # Apply one -N/-A/-I/-D/-C/-F/-X command to a table's chains; False if iptables would fail
+    op, chain, rest = tokens[0], tokens[1], tokens[2:]
+    if op == "-N":
+        if chain in chains:
+            return False
+        chains[chain] = []
+        return True
+    if chain not in chains:
+        return False
+    if op in ("-A", "-I"):
+        chains[chain].insert(0 if op == "-I" else len(chains[chain]), " ".join(rest))
+    elif op in ("-D", "-C"):
+        match = next((rule for rule in chains[chain] if same(rule, rest)), None)
+        if match is None:
+            return False
+        if op == "-D":
+            chains[chain].remove(match)
+    elif op == "-F":
+        chains[chain] = []
+    elif op == "-X":
+        del chains[chain]
+    return True
+
+def dump(table, chains):
+    print("*" + table)
+    for chain in chains:
+        print(":" + chain + (" ACCEPT" if chain == "OUTPUT" else " -") + " [0:0]")
+    for chain, rules in chains.items():
+        for rule in rules:
+            print("-A " + chain + " " + rule)
+    print("COMMIT")
+
+tables = load()
+if name.endswith("-restore"):
+    chains = {{}}
+    for number, line in enumerate(sys.stdin, 1):
+        line = line.strip()
+        if line.startswith("*"):
+            chains = tables.setdefault(line[1:], {{"OUTPUT": []}})
+        elif line.startswith(":"):
+            chains[line[1:].split()[0]] = []
+        elif line and line != "COMMIT" and not run(chains, line.split()):
+            sys.exit(name + ": line " + str(number) + " failed")
+    if "--test" not in args:
+        store(tables)
+elif name.endswith("-save"):
+    for table, chains in tables.items():
+        if "-t" not in args or args[args.index("-t") + 1] == table:
+            dump(table, chains)
+else:
+    table = "filter"
+    if args[:1] == ["-t"]:
+        table, args = args[1], args[2:]
+    chains = tables.setdefault(table, {{"OUTPUT": []}})
+    if args == ["-S"]:
+        print("-P OUTPUT ACCEPT")
+        print("".join("-N " + chain + "\\n" for chain in chains if chain != "OUTPUT"), end="")
+        print("".join("-A " + chain + " " + rule + "\\n" for chain, rules in chains.items() for rule in rules), end="")
+    elif not run(chains, args):
+        sys.exit(1)
+    elif args[0] != "-C":
+        store(tables)
+"""
+
+def install_fake_commands(bin_dir, log_path, state_dir):
+    """Write the recording fake executables into bin_dir; the stateful ones keep their rules in state_dir."""
+    for name in FAKE_COMMANDS:
+        path = bin_dir / name
+        if name in STATEFUL_COMMANDS:
+            path.write_text(FAKE_IPTABLES_SCRIPT.format(python=sys.executable, log=str(log_path), state=str(state_dir)))
+        else:
+            path.write_text(FAKE_SCRIPT.format(log=log_path))
+        path.chmod(0o755)
+
+def reset_fake_firewall(state_dir):
+    """Forget every rule the fake iptables tools were given."""
+    for path in state_dir.iterdir():
+        path.unlink()
+
+def synthetic_cache(size):
+    """Build a cache with `size` targets; every target has one IPv4 address and every fourth one IPv6 address too."""
+    cache = new_cache()
+    now = int(time.time())
+    for i in range(size):
+        entries = {f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}": {"first_seen": now, "last_seen": now, "ttl": 300}}
+        if i % 4 == 0:
+            entries[f"2001:db8::{i:x}"] = {"first_seen": now, "last_seen": now, "ttl": 300}
+        cache["targets"][f"site{i}.example.com"] = entries
+    return cache
+
+def write_blacklist(path, size):
+    """Write a blacklist with `size` domains."""
+    with open(path, 'w') as f:
+        f.write("".join(f"site{i}.example.com()\n" for i in range(size)))
+
+def count_calls(log_path):
+    """Return the number of recorded fake invocations and reset the log."""
+    if not log_path.exists():
+        return 0
+    with open(log_path) as f:
+        calls = sum(1 for _ in f)
+    log_path.unlink()
+    return calls
+
+def measure(func, log_path, *args, **kwargs):
+    """
+    Run `func` twice: once for wall time and subprocess count, once under tracemalloc for
+    peak memory. Output printed by the function is discarded.
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        started = time.perf_counter()
+        result = func(*args, **kwargs)
+        elapsed = time.perf_counter() - started
+        calls = count_calls(log_path)
+        tracemalloc.start()
+        func(*args, **kwargs)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        count_calls(log_path)
+    return {"seconds": round(elapsed, 6), "subprocesses": calls, "peak_memory_bytes": peak, "result": bool(result)}
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark restriction apply/unrestrict/check without root")
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help=f'Comma-separated cache sizes (default: {DEFAULT_SIZES})')
+    parser.add_argument('--backends', default=DEFAULT_BACKENDS, help=f'Comma-separated firewall backends (default: {DEFAULT_BACKENDS})')
+    parser.add_argument('--legacy-max', type=int, default=DEFAULT_LEGACY_MAX, help=f'Largest size run with the iptables backend (default: {DEFAULT_LEGACY_MAX})')
+    parser.add_argument('--output', help='Write the JSON results to this file (default: stdout)')
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(',') if size]
+    backends = [backend for backend in args.backends.split(',') if backend]
+    user = getpass.getuser()
+    records = []
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        bin_dir = tmp / 'bin'
+        bin_dir.mkdir()
+        log_path = tmp / 'calls.log'
+        state_dir = tmp / 'firewall'
+        state_dir.mkdir()
+        install_fake_commands(bin_dir, log_path, state_dir)
+        os.environ['PATH'] = f"{bin_dir}{os.pathsep}{os.environ.get('PATH', '')}"
+        cache_dir = tmp / 'cache'
+        cache_dir.mkdir()
+        internet_handler.get_cache_dir = lambda: cache_dir
+
+        for size in sizes:
+            blacklist_path = tmp / f'blacklist-{size}.txt'
+            write_blacklist(blacklist_path, size)
+            save_cache(internet_handler.get_user_cache_path(user), synthetic_cache(size))
+            for backend in backends:
+                if backend == "iptables" and size > args.legacy_max:
+                    continue
+                reset_fake_firewall(state_dir)
+                options = {"backend": backend}
+                if backend in internet_handler.STUB_RESOLVER_BACKENDS:
+                    options["stub_port"] = DEFAULT_STUB_PORT
+                operations = (
+                    ("apply", internet_handler.apply_restrictions_from_cache, (user,), options),
+                    ("apply-incremental", internet_handler.apply_restrictions_from_cache, (user,), dict(options, incremental=True)),
+                    ("unrestrict", internet_handler.unrestrict_internet, (user, blacklist_path), {}),
+                    ("check", internet_handler.internet_restriction_check, (user,), {}),
+                )
+                for operation, func, func_args, func_kwargs in operations:
+                    record = {"size": size, "backend": backend, "operation": operation}
+                    record.update(measure(func, log_path, *func_args, **func_kwargs))
+                    records.append(record)
+                    print(f"{size:>7} {backend:<17} {operation:<18} {record['seconds']:9.3f}s "
+                          f"{record['subprocesses']:>7} procs {record['peak_memory_bytes'] / 1e6:9.2f}MB", file=sys.stderr)
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": int(time.time()),
+        "results": records,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+Contest Environment Package Bundle CLI
+"""
+import sys
+import argparse
+from pathlib import Path
+
+from contest_manager.utils.package_bundle_handler import build_package_bundle
+
+CONFIG_DIR = Path(__file__).parent.parent.parent / 'config'
+
+def create_parser():
+    parser = argparse.ArgumentParser(
+        description="Build offline package bundles for `setup --bundle`",
+        prog="contest-bundle"
+    )
+    subparsers = parser.add_subparsers(dest='action', help='Bundle actions')
+
+    build_parser = subparsers.add_parser('build', help='Download every package listed in config/ into a directory')
+    build_parser.add_argument('directory', help='Bundle directory to create or update')
+    build_parser.add_argument('--verbose', '-v', action='store_true', help='Enable verbose output')
+    return parser
+
+def main():
+    parser = create_parser()
+    args = parser.parse_args()
+    if args.action != 'build':
+        parser.print_help()
+        sys.exit(1)
+
+    print(f"\n📦 Building package bundle in {args.directory}\n" + ("="*40))
+    manifest = build_package_bundle(CONFIG_DIR, args.directory, verbose=args.verbose)
+    print(f"\n✅ Bundled {len(manifest['apt'])} apt package(s) with dependencies, {len(manifest['snaps'])} snap(s), "
+          f"{len(manifest['flatpaks'])} flatpak(s) and {len(manifest['vscode'])} VS Code extension(s)")
+    failed = [f"{kind}: {name}" for kind, names in manifest["failed"].items() for name in names]
+    if failed:
+        print("❌ Could not bundle:")
+        for entry in failed:
+            print(f"  - {entry}")
+        sys.exit(1)
+    print(f"Copy {args.directory} to the lab PCs and run: sudo contest-manager setup --bundle {args.directory}")
+    sys.exit(0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Contest Environment IP Cache CLI
+"""
+import sys
+import argparse
+from pathlib import Path
+
+from contest_manager.utils.cache_handler import CACHE_FORMATS, DEFAULT_CACHE_FORMAT, CacheError, convert_cache
+from contest_manager.utils.dns_handler import load_resolvers
+from contest_manager.utils.internet_handler import create_ip_cache, export_cache_bundle, import_cache_bundle
+
+CONFIG_DIR = Path(__file__).parent.parent.parent / 'config'
+BLACKLIST_TXT = CONFIG_DIR / 'blacklist.txt'
+RESOLVERS_TXT = CONFIG_DIR / 'resolvers.txt'
+
+def create_parser():
+    parser = argparse.ArgumentParser(
+        description="Manage stored IP caches",
+        prog="contest-cache"
+    )
+    subparsers = parser.add_subparsers(dest='action', help='Cache actions')
+
+    convert_parser = subparsers.add_parser('convert', help='Convert a cache between the JSON and binary formats')
+    convert_parser.add_argument('source', help='Cache file to read (either format)')
+    convert_parser.add_argument('dest', help='Cache file to write (.bin for binary, JSON otherwise)')
+
+    export_parser = subparsers.add_parser('export', help='Write a checksummed bundle of the IP cache for other lab PCs')
+    export_parser.add_argument('bundle', help='Bundle file to write')
+    export_parser.add_argument('--user', type=str, help='Export this user\'s cache instead of the machine-wide cache')
+    export_parser.add_argument('--resolve', action='store_true', help='Resolve the blacklist into the cache before exporting')
+    export_parser.add_argument('--verbose', '-v', action='store_true', help='Enable verbose output')
+
+    import_parser = subparsers.add_parser('import', help='Install the IP cache from a bundle without DNS resolution')
+    import_parser.add_argument('bundle', help='Bundle file to read')
+    import_parser.add_argument('--user', type=str, help='Install as this user\'s cache instead of the machine-wide cache')
+    import_parser.add_argument('--cache-format', choices=list(CACHE_FORMATS), default=DEFAULT_CACHE_FORMAT, help=f'On-disk IP cache format (default: {DEFAULT_CACHE_FORMAT})')
+    import_parser.add_argument('--verbose', '-v', action='store_true', help='Enable verbose output')
+    return parser
+
+def main():
+    parser = create_parser()
+    args = parser.parse_args()
+    if args.action == 'convert':
+        try:
+            cache = convert_cache(args.source, args.dest)
+        except FileNotFoundError:
+            print(f"❌ Cache file {args.source} not found.")
+            sys.exit(1)
+        except CacheError as e:
+            print(f"❌ {e}")
+            sys.exit(1)
+        addresses = sum(len(entries) for entries in cache["targets"].values())
+        print(f"✅ Wrote {len(cache['targets'])} target(s) and {addresses} address(es) to {args.dest}")
+    elif args.action == 'export':
+        shared = args.user is None
+        if args.resolve:
+            success, _ = create_ip_cache(args.user, BLACKLIST_TXT, verbose=args.verbose, shared=shared,
+                                         resolvers=load_resolvers(RESOLVERS_TXT))
+            if not success:
+                print("❌ Failed to create IP cache.")
+                sys.exit(1)
+        payload = export_cache_bundle(args.user, args.bundle, BLACKLIST_TXT, verbose=args.verbose, shared=shared)
+        if payload is None:
+            sys.exit(1)
+        addresses = sum(len(entries) for entries in payload["cache"]["targets"].values())
+        print(f"✅ Exported {len(payload['cache']['targets'])} target(s) and {addresses} address(es) to {args.bundle}")
+    elif args.action == 'import':
+        success, cache_path = import_cache_bundle(
+            args.user, args.bundle, BLACKLIST_TXT, verbose=args.verbose, cache_format=args.cache_format, shared=args.user is None
+        )
+        if not success:
+            sys.exit(1)
+        print(f"✅ IP cache installed at {cache_path}")
+    else:
+        parser.print_help()
+        sys.exit(1)
+    sys.exit(0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Contest Environment Restriction Daemon CLI
+"""
+import sys
+import json
+import signal
+import argparse
+from pathlib import Path
+
+from contest_manager.utils.utils import check_root
+from contest_manager.utils.dns_handler import DEFAULT_DNS_WORKERS, DEFAULT_DNS_TIMEOUT, DEFAULT_DNS_DEADLINE, resolver_spec, load_resolvers
+from contest_manager.utils.cache_handler import DEFAULT_CACHE_GRACE, DEFAULT_MAX_IPS_PER_TARGET, DEFAULT_NEGATIVE_TTL
+from contest_manager.utils.daemon_handler import DEFAULT_CONTROL_SOCKET, RestrictionDaemon, send_command
+
+CONFIG_DIR = Path(__file__).parent.parent.parent / 'config'
+BLACKLIST_TXT = CONFIG_DIR / 'blacklist.txt'
+PREFIXES_TXT = CONFIG_DIR / 'prefixes.txt'
+RESOLVERS_TXT = CONFIG_DIR / 'resolvers.txt'
+
+def create_parser():
+    parser = argparse.ArgumentParser(
+        description="Keep every recorded restriction up to date from a long-running process",
+        prog="contest-daemon"
+    )
+    parser.add_argument(
+        '--socket', type=str, default=DEFAULT_CONTROL_SOCKET, help=f'Control socket path (default: {DEFAULT_CONTROL_SOCKET})'
+    )
+    parser.add_argument(
+        '--send', choices=['status', 'reload', 'refresh'], help='Send a command to the running daemon and print its answer'
+    )
+    parser.add_argument(
+        '--dns-workers', type=int, default=DEFAULT_DNS_WORKERS, help=f'Maximum concurrent DNS queries (default: {DEFAULT_DNS_WORKERS})'
+    )
+    parser.add_argument(
+        '--dns-timeout', type=float, default=DEFAULT_DNS_TIMEOUT, help=f'Per-query DNS timeout in seconds (default: {DEFAULT_DNS_TIMEOUT})'
+    )
+    parser.add_argument(
+        '--dns-deadline', type=float, default=DEFAULT_DNS_DEADLINE,
+        help=f'Give up on names still unresolved after this many seconds, keeping their cached addresses (0 = no limit, default: {DEFAULT_DNS_DEADLINE:g})'
+    )
+    parser.add_argument(
+        '--dns-resolver', action='append', type=resolver_spec, metavar='ADDRESS',
+        help='Query this resolver ("system", IP or IP:port) instead of those in config/resolvers.txt; repeat to fan out to several'
+    )
+    parser.add_argument(
+        '--cache-grace', type=int, default=DEFAULT_CACHE_GRACE, help=f'Seconds past its DNS TTL before an unseen address is dropped (default: {DEFAULT_CACHE_GRACE})'
+    )
+    parser.add_argument(
+        '--cache-max-ips', type=int, default=DEFAULT_MAX_IPS_PER_TARGET, help=f'Maximum cached addresses per target, 0 for no limit (default: {DEFAULT_MAX_IPS_PER_TARGET})'
+    )
+    parser.add_argument(
+        '--negative-ttl', type=int, default=DEFAULT_NEGATIVE_TTL, help=f'Seconds to skip names that answered NXDOMAIN/NODATA (default: {DEFAULT_NEGATIVE_TTL})'
+    )
+    parser.add_argument(
+        '--verbose', '-v', action='store_true', help='Enable verbose output'
+    )
+    return parser
+
+def main():
+    parser = create_parser()
+    args = parser.parse_args()
+    check_root()
+    if args.send:
+        response = send_command(args.send, socket_path=args.socket)
+        if response is None:
+            print(f"❌ No daemon is listening on {args.socket}.")
+            sys.exit(1)
+        print(json.dumps(response, indent=2))
+        sys.exit(0 if response.get("ok") else 1)
+
+    daemon = RestrictionDaemon(
+        BLACKLIST_TXT, prefix_path=PREFIXES_TXT, socket_path=args.socket, max_workers=args.dns_workers,
+        timeout=args.dns_timeout, grace=args.cache_grace, max_per_target=args.cache_max_ips,
+        negative_ttl=args.negative_ttl, deadline=args.dns_deadline,
+        resolvers=args.dns_resolver or load_resolvers(RESOLVERS_TXT), verbose=args.verbose
+    )
+    signal.signal(signal.SIGTERM, lambda signum, frame: daemon.stop())
+    signal.signal(signal.SIGHUP, lambda signum, frame: daemon.request_reload())
+    try:
+        daemon.run()
+    except KeyboardInterrupt:
+        pass
+    print("🛑 Daemon stopped.")
+    sys.exit(0)
+
+if __name__ == "__main__":
+    main()
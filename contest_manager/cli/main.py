@@ -13,6 +13,33 @@ from contest_manager.cli.unrestrict import main as unrestrict_main
 from contest_manager.cli.status import main as status_main
 from contest_manager.cli.start_restriction import main as start_restriction_main
 from contest_manager.cli.update_restriction import main as update_restriction_main
+from contest_manager.cli.cache import main as cache_main
+from contest_manager.cli.bundle import main as bundle_main
+from contest_manager.cli.stub_resolver import main as stub_resolver_main
+from contest_manager.cli.daemon import main as daemon_main
+from contest_manager.utils.dns_handler import DEFAULT_DNS_WORKERS, DEFAULT_DNS_TIMEOUT, DEFAULT_DNS_DEADLINE, resolver_spec
+from contest_manager.utils.internet_handler import BACKENDS, DEFAULT_BACKEND
+from contest_manager.utils.cidr_handler import DEFAULT_WIDEN_THRESHOLD
+from contest_manager.utils.stub_resolver_handler import DEFAULT_STUB_PORT
+from contest_manager.utils.daemon_handler import DEFAULT_CONTROL_SOCKET
+from contest_manager.utils.cache_handler import (
+    DEFAULT_CACHE_GRACE, DEFAULT_MAX_IPS_PER_TARGET, DEFAULT_NEGATIVE_TTL, CACHE_FORMATS, DEFAULT_CACHE_FORMAT
+)
+
+def dns_args(args):
+    """Forward DNS resolution options to a sub-command."""
+    resolvers = [option for spec in args.dns_resolver or [] for option in ('--dns-resolver', spec)]
+    return ['--dns-workers', str(args.dns_workers), '--dns-timeout', str(args.dns_timeout), '--dns-deadline', str(args.dns_deadline)] + resolvers
+
+def firewall_args(args):
+    """Forward firewall options to a sub-command."""
+    return ['--backend', args.backend, '--widen-threshold', str(args.widen_threshold), '--cache-format', args.cache_format]
+
+def owner_args(args):
+    """Forward group, shared-cache, stub-resolver and bundle options to a sub-command."""
+    return (['--group', args.group] if args.group else []) + (['--shared-cache'] if getattr(args, 'shared_cache', False) else []) + \
+        (['--stub-resolver'] if getattr(args, 'stub_resolver', False) else []) + \
+        (['--bundle', args.bundle] if getattr(args, 'bundle', None) else [])
 
 def main():
     parser = argparse.ArgumentParser(
@@ -23,15 +50,27 @@ def main():
 Examples:
   sudo contest-manager setup                   # Set up lab PC for users in /config/users.txt
   sudo contest-manager restrict                # Restrict default user (participant)
+  sudo contest-manager restrict --group contest  # Restrict all members of group 'contest' with one ruleset
   sudo contest-manager unrestrict              # Remove restrictions for participant
   sudo contest-manager reset                   # Reset participant account to clean state
   sudo contest-manager status                  # Check status for participant
+  sudo contest-manager status --all --json     # Verify every restriction on this PC, as JSON
+  sudo contest-manager restrict --daemon       # Keep rules fresh with the resident daemon instead of a timer
+  sudo contest-manager cache convert a.json a.bin  # Convert an IP cache to the binary format
+  sudo contest-manager cache export --resolve ip-cache.bundle  # Resolve once and bundle the cache for other PCs
+  sudo contest-manager restrict --bundle ip-cache.bundle       # Restrict from a bundle without DNS
+  sudo contest-manager bundle build /media/usb/packages        # Download every configured package once
+  sudo contest-manager setup --bundle /media/usb/packages      # Set up a lab PC without internet access
         """
     )
 
     subparsers = parser.add_subparsers(dest='command', help='Available commands')
 
     setup_parser = subparsers.add_parser('setup', help='Set up lab PC with all required software')
+    setup_parser.add_argument('--bundle', type=str, metavar='DIR', help='Install every package from an offline package bundle')
+    setup_parser.add_argument('--vsix-dir', type=str, metavar='DIR', help='Install VS Code extensions from local .vsix files in DIR')
+    setup_parser.add_argument('--log-dir', type=str, metavar='DIR', help='Write the setup step logs to DIR (default: /var/log/contest-manager/setup)')
+    setup_parser.add_argument('--sequential', action='store_true', help='Run one setup step at a time')
     setup_parser.add_argument('--verbose', '-v', action='store_true', help='Enable verbose output')
 
     reset_parser = subparsers.add_parser('reset', help='Reset user account to clean state')
@@ -40,24 +79,83 @@ Examples:
 
     restrict_parser = subparsers.add_parser('restrict', help='Enable internet restrictions')
     restrict_parser.add_argument('user', nargs='?', default='participant', help='Username (default: participant)')
+    restrict_parser.add_argument('--dns-workers', type=int, default=DEFAULT_DNS_WORKERS, help='Maximum concurrent DNS queries')
+    restrict_parser.add_argument('--dns-timeout', type=float, default=DEFAULT_DNS_TIMEOUT, help='Per-query DNS timeout in seconds')
+    restrict_parser.add_argument('--dns-deadline', type=float, default=DEFAULT_DNS_DEADLINE, help='Seconds before unresolved names fall back to the cache (0 = no limit)')
+    restrict_parser.add_argument('--dns-resolver', action='append', type=resolver_spec, metavar='ADDRESS', help='Resolver to query instead of config/resolvers.txt (repeatable)')
+    restrict_parser.add_argument('--widen-threshold', type=int, default=DEFAULT_WIDEN_THRESHOLD, help='Block a whole /24 or /48 once it holds this many cached entries (0 = off)')
+    restrict_parser.add_argument('--backend', choices=BACKENDS, default=DEFAULT_BACKEND, help='Firewall backend')
+    restrict_parser.add_argument('--group', type=str, help='Restrict every member of this group with one shared ruleset')
+    restrict_parser.add_argument('--shared-cache', action='store_true', help='Use the machine-wide IP cache (implied by --group)')
+    restrict_parser.add_argument('--stub-resolver', action='store_true', help='Redirect DNS to the local blocking stub resolver instead of string-match rules')
+    restrict_parser.add_argument('--daemon', action='store_true', help='Keep the restriction up to date with the resident daemon instead of the 30-minute timer')
+    restrict_parser.add_argument('--bundle', type=str, help='Install the IP cache from a bundle made with cache export')
+    restrict_parser.add_argument('--cache-format', choices=list(CACHE_FORMATS), default=DEFAULT_CACHE_FORMAT, help='On-disk IP cache format')
     restrict_parser.add_argument('--verbose', '-v', action='store_true', help='Enable verbose output')
 
     unrestrict_parser = subparsers.add_parser('unrestrict', help='Disable internet restrictions')
     unrestrict_parser.add_argument('user', nargs='?', default='participant', help='Username (default: participant)')
+    unrestrict_parser.add_argument('--group', type=str, help='Remove the shared restriction of this group')
     unrestrict_parser.add_argument('--verbose', '-v', action='store_true', help='Enable verbose output')
 
     status_parser = subparsers.add_parser('status', help='Show current restriction status')
     status_parser.add_argument('user', nargs='?', default='participant', help='Username (default: participant)')
+    status_parser.add_argument('--all', action='store_true', help='Check every restricted user and group')
+    status_parser.add_argument('--json', action='store_true', help='Print the status as JSON')
     status_parser.add_argument('--verbose', '-v', action='store_true', help='Enable verbose output')
 
     start_restriction_parser = subparsers.add_parser('start-restriction', help='Start restriction system at boot (for persistence)')
     start_restriction_parser.add_argument('user', nargs='?', default='participant', help='Username to restrict (default: participant)')
+    start_restriction_parser.add_argument('--widen-threshold', type=int, default=DEFAULT_WIDEN_THRESHOLD, help='Block a whole /24 or /48 once it holds this many cached entries (0 = off)')
+    start_restriction_parser.add_argument('--backend', choices=BACKENDS, default=DEFAULT_BACKEND, help='Firewall backend')
+    start_restriction_parser.add_argument('--group', type=str, help='Restrict every member of this group with one shared ruleset')
+    start_restriction_parser.add_argument('--shared-cache', action='store_true', help='Use the machine-wide IP cache (implied by --group)')
+    start_restriction_parser.add_argument('--stub-resolver', action='store_true', help='Redirect DNS to the local blocking stub resolver instead of string-match rules')
+    start_restriction_parser.add_argument('--bundle', type=str, help='Install the IP cache from a bundle made with cache export')
+    start_restriction_parser.add_argument('--cache-format', choices=list(CACHE_FORMATS), default=DEFAULT_CACHE_FORMAT, help='On-disk IP cache format')
     start_restriction_parser.add_argument('--verbose', '-v', action='store_true', help='Enable verbose output')
 
     update_restriction_parser = subparsers.add_parser('update-restriction', help='Update internet restrictions (refresh iptables rules)')
     update_restriction_parser.add_argument('user', nargs='?', default='participant', help='Username to update restrictions for (default: participant)')
+    update_restriction_parser.add_argument('--dns-workers', type=int, default=DEFAULT_DNS_WORKERS, help='Maximum concurrent DNS queries')
+    update_restriction_parser.add_argument('--dns-timeout', type=float, default=DEFAULT_DNS_TIMEOUT, help='Per-query DNS timeout in seconds')
+    update_restriction_parser.add_argument('--dns-deadline', type=float, default=DEFAULT_DNS_DEADLINE, help='Seconds before unresolved names fall back to the cache (0 = no limit)')
+    update_restriction_parser.add_argument('--dns-resolver', action='append', type=resolver_spec, metavar='ADDRESS', help='Resolver to query instead of config/resolvers.txt (repeatable)')
+    update_restriction_parser.add_argument('--cache-grace', type=int, default=DEFAULT_CACHE_GRACE, help='Seconds past its DNS TTL before an unseen address is dropped')
+    update_restriction_parser.add_argument('--cache-max-ips', type=int, default=DEFAULT_MAX_IPS_PER_TARGET, help='Maximum cached addresses per target (0 for no limit)')
+    update_restriction_parser.add_argument('--negative-ttl', type=int, default=DEFAULT_NEGATIVE_TTL, help='Seconds to skip names that answered NXDOMAIN/NODATA')
+    update_restriction_parser.add_argument('--widen-threshold', type=int, default=DEFAULT_WIDEN_THRESHOLD, help='Block a whole /24 or /48 once it holds this many cached entries (0 = off)')
+    update_restriction_parser.add_argument('--backend', choices=BACKENDS, default=DEFAULT_BACKEND, help='Firewall backend')
+    update_restriction_parser.add_argument('--group', type=str, help='Restrict every member of this group with one shared ruleset')
+    update_restriction_parser.add_argument('--shared-cache', action='store_true', help='Use the machine-wide IP cache (implied by --group)')
+    update_restriction_parser.add_argument('--stub-resolver', action='store_true', help='Redirect DNS to the local blocking stub resolver instead of string-match rules')
+    update_restriction_parser.add_argument('--bundle', type=str, help='Install the IP cache from a bundle made with cache export')
+    update_restriction_parser.add_argument('--cache-format', choices=list(CACHE_FORMATS), default=DEFAULT_CACHE_FORMAT, help='On-disk IP cache format')
     update_restriction_parser.add_argument('--verbose', '-v', action='store_true', help='Enable verbose output')
 
+    cache_parser = subparsers.add_parser('cache', help='Manage stored IP caches')
+    cache_parser.add_argument('args', nargs=argparse.REMAINDER, help='Cache action and its arguments (see contest-manager cache --help)')
+
+    bundle_parser = subparsers.add_parser('bundle', help='Build offline package bundles for setup --bundle')
+    bundle_parser.add_argument('args', nargs=argparse.REMAINDER, help='Bundle action and its arguments (see contest-manager bundle --help)')
+
+    stub_parser = subparsers.add_parser('stub-resolver', help='Run the local blocking stub resolver')
+    stub_parser.add_argument('--port', type=int, default=DEFAULT_STUB_PORT, help='Loopback port to listen on')
+    stub_parser.add_argument('--upstream', type=str, help='Upstream resolver address')
+    stub_parser.add_argument('--upstream-port', type=int, default=53, help='Upstream resolver port')
+
+    daemon_parser = subparsers.add_parser('daemon', help='Run the resident restriction daemon')
+    daemon_parser.add_argument('--socket', type=str, default=DEFAULT_CONTROL_SOCKET, help='Control socket path')
+    daemon_parser.add_argument('--send', choices=['status', 'reload', 'refresh'], help='Send a command to the running daemon')
+    daemon_parser.add_argument('--dns-workers', type=int, default=DEFAULT_DNS_WORKERS, help='Maximum concurrent DNS queries')
+    daemon_parser.add_argument('--dns-timeout', type=float, default=DEFAULT_DNS_TIMEOUT, help='Per-query DNS timeout in seconds')
+    daemon_parser.add_argument('--dns-deadline', type=float, default=DEFAULT_DNS_DEADLINE, help='Seconds before unresolved names fall back to the cache (0 = no limit)')
+    daemon_parser.add_argument('--dns-resolver', action='append', type=resolver_spec, metavar='ADDRESS', help='Resolver to query instead of config/resolvers.txt (repeatable)')
+    daemon_parser.add_argument('--cache-grace', type=int, default=DEFAULT_CACHE_GRACE, help='Seconds past its DNS TTL before an unseen address is dropped')
+    daemon_parser.add_argument('--cache-max-ips', type=int, default=DEFAULT_MAX_IPS_PER_TARGET, help='Maximum cached addresses per target (0 for no limit)')
+    daemon_parser.add_argument('--negative-ttl', type=int, default=DEFAULT_NEGATIVE_TTL, help='Seconds to skip names that answered NXDOMAIN/NODATA')
+    daemon_parser.add_argument('--verbose', '-v', action='store_true', help='Enable verbose output')
+
     args = parser.parse_args()
 
     if not args.command:
@@ -67,26 +165,50 @@ Examples:
     try:
         check_root()
         if args.command == "setup":
-            sys.argv = [sys.argv[0]] + (['--verbose'] if args.verbose else [])
+            sys.argv = [sys.argv[0]] + (['--bundle', args.bundle] if args.bundle else []) + \
+                (['--vsix-dir', args.vsix_dir] if args.vsix_dir else []) + \
+                (['--log-dir', args.log_dir] if args.log_dir else []) + \
+                (['--sequential'] if args.sequential else []) + (['--verbose'] if args.verbose else [])
             setup_main()
         elif args.command == "reset":
             sys.argv = [sys.argv[0]] + [args.user] + (['--verbose'] if args.verbose else [])
             reset_main()
         elif args.command == "restrict":
-            sys.argv = [sys.argv[0]] + [args.user] + (['--verbose'] if args.verbose else [])
+            sys.argv = [sys.argv[0]] + [args.user] + dns_args(args) + firewall_args(args) + owner_args(args) + \
+                (['--daemon'] if args.daemon else []) + (['--verbose'] if args.verbose else [])
             restrict_main()
         elif args.command == "unrestrict":
-            sys.argv = [sys.argv[0]] + [args.user] + (['--verbose'] if args.verbose else [])
+            sys.argv = [sys.argv[0]] + [args.user] + owner_args(args) + (['--verbose'] if args.verbose else [])
             unrestrict_main()
         elif args.command == "status":
-            sys.argv = [sys.argv[0]] + [args.user] + (['--verbose'] if args.verbose else [])
+            sys.argv = [sys.argv[0]] + [args.user] + (['--all'] if args.all else []) + (['--json'] if args.json else []) + \
+                (['--verbose'] if args.verbose else [])
             status_main()
         elif args.command == "start-restriction":
-            sys.argv = [sys.argv[0]] + [args.user] + (['--verbose'] if getattr(args, 'verbose', False) else [])
+            sys.argv = [sys.argv[0]] + [args.user] + firewall_args(args) + owner_args(args) + (['--verbose'] if getattr(args, 'verbose', False) else [])
             start_restriction_main()
         elif args.command == "update-restriction":
-            sys.argv = [sys.argv[0]] + [args.user] + (['--verbose'] if getattr(args, 'verbose', False) else [])
+            sys.argv = [sys.argv[0]] + [args.user] + dns_args(args) + firewall_args(args) + owner_args(args) + [
+                '--cache-grace', str(args.cache_grace), '--cache-max-ips', str(args.cache_max_ips),
+                '--negative-ttl', str(args.negative_ttl)
+            ] + (['--verbose'] if getattr(args, 'verbose', False) else [])
             update_restriction_main()
+        elif args.command == "stub-resolver":
+            sys.argv = [sys.argv[0], '--port', str(args.port), '--upstream-port', str(args.upstream_port)] + \
+                (['--upstream', args.upstream] if args.upstream else [])
+            stub_resolver_main()
+        elif args.command == "daemon":
+            sys.argv = [sys.argv[0], '--socket', args.socket] + dns_args(args) + [
+                '--cache-grace', str(args.cache_grace), '--cache-max-ips', str(args.cache_max_ips),
+                '--negative-ttl', str(args.negative_ttl)
+            ] + (['--send', args.send] if args.send else []) + (['--verbose'] if args.verbose else [])
+            daemon_main()
+        elif args.command == "cache":
+            sys.argv = [sys.argv[0]] + args.args
+            cache_main()
+        elif args.command == "bundle":
+            sys.argv = [sys.argv[0]] + args.args
+            bundle_main()
         else:
             parser.print_help()
             sys.exit(1)
@@ -8,11 +8,18 @@ from pathlib import Path
 
 from contest_manager.utils.utils import check_root
 from contest_manager.utils.internet_handler import *
+from contest_manager.utils.dns_handler import resolver_spec, load_resolvers
+from contest_manager.utils.cidr_handler import DEFAULT_WIDEN_THRESHOLD
+from contest_manager.utils.stub_resolver_handler import DEFAULT_STUB_PORT
+from contest_manager.utils.cache_handler import CACHE_FORMATS, DEFAULT_CACHE_FORMAT
 from contest_manager.utils.usb_handler import *
-from contest_manager.utils.persistence_handler import start_persistence
+from contest_manager.utils.daemon_handler import send_command
+from contest_manager.utils.persistence_handler import start_persistence, start_stub_resolver_service, start_daemon_service
 
 CONFIG_DIR = Path(__file__).parent.parent.parent / 'config'
 BLACKLIST_TXT = CONFIG_DIR / 'blacklist.txt'
+PREFIXES_TXT = CONFIG_DIR / 'prefixes.txt'
+RESOLVERS_TXT = CONFIG_DIR / 'resolvers.txt'
 
 def create_parser():
     parser = argparse.ArgumentParser(
@@ -25,6 +32,44 @@ def create_parser():
     parser.add_argument(
         '--config-dir', type=str, help='Configuration directory path (default: project root)'
     )
+    parser.add_argument(
+        '--dns-workers', type=int, default=DEFAULT_DNS_WORKERS, help=f'Maximum concurrent DNS queries (default: {DEFAULT_DNS_WORKERS})'
+    )
+    parser.add_argument(
+        '--dns-timeout', type=float, default=DEFAULT_DNS_TIMEOUT, help=f'Per-query DNS timeout in seconds (default: {DEFAULT_DNS_TIMEOUT})'
+    )
+    parser.add_argument(
+        '--dns-deadline', type=float, default=DEFAULT_DNS_DEADLINE,
+        help=f'Give up on names still unresolved after this many seconds, keeping their cached addresses (0 = no limit, default: {DEFAULT_DNS_DEADLINE:g})'
+    )
+    parser.add_argument(
+        '--dns-resolver', action='append', type=resolver_spec, metavar='ADDRESS',
+        help='Query this resolver ("system", IP or IP:port) instead of those in config/resolvers.txt; repeat to fan out to several'
+    )
+    parser.add_argument(
+        '--widen-threshold', type=int, default=DEFAULT_WIDEN_THRESHOLD, help='Block a whole /24 (IPv4) or /48 (IPv6) once it holds this many cached entries (default: 0, off)'
+    )
+    parser.add_argument(
+        '--backend', choices=BACKENDS, default=DEFAULT_BACKEND, help=f'Firewall backend (default: {DEFAULT_BACKEND})'
+    )
+    parser.add_argument(
+        '--group', type=str, help='Restrict every member of this group with one shared ruleset (the user argument is ignored)'
+    )
+    parser.add_argument(
+        '--shared-cache', action='store_true', help='Use the machine-wide IP cache instead of a per-user cache (implied by --group)'
+    )
+    parser.add_argument(
+        '--stub-resolver', action='store_true', help='Redirect the user\'s DNS to the local blocking stub resolver instead of adding per-domain string-match rules'
+    )
+    parser.add_argument(
+        '--cache-format', choices=list(CACHE_FORMATS), default=DEFAULT_CACHE_FORMAT, help=f'On-disk IP cache format (default: {DEFAULT_CACHE_FORMAT})'
+    )
+    parser.add_argument(
+        '--daemon', action='store_true', help='Keep the restriction up to date with the resident contest-manager daemon instead of the 30-minute timer'
+    )
+    parser.add_argument(
+        '--bundle', type=str, help='Install the IP cache from this bundle (see `cache export`) instead of resolving the blacklist'
+    )
     parser.add_argument(
         '--verbose', '-v', action='store_true', help='Enable verbose output'
     )
@@ -33,24 +78,61 @@ def create_parser():
 def main():
     parser = create_parser()
     args = parser.parse_args()
+    if args.backend in STUB_RESOLVER_BACKENDS and not args.stub_resolver:
+        parser.error(f"--backend {args.backend} requires --stub-resolver, it cannot block domain names in DNS/DoH traffic")
     check_root()
+    if args.group:
+        users = get_group_members(args.group)
+        if users is None:
+            print(f"❌ Group {args.group} not found.")
+            sys.exit(1)
+    else:
+        users = [args.user]
     print("\n🧹 STEP 1: Remove Previous Restrictions\n" + ("="*40))
     print("Removing internet restriction...")
-    unrestrict_internet(args.user, BLACKLIST_TXT, verbose=args.verbose)
+    unrestrict_internet(args.user, BLACKLIST_TXT, verbose=args.verbose, group=args.group)
     print("Removing USB restriction...")
-    unrestrict_usb_storage_device(args.user, verbose=args.verbose)
+    for user in users:
+        unrestrict_usb_storage_device(user, verbose=args.verbose)
     print("✅ Previous restrictions removed.\n")
 
     print("\n🌐 STEP 2: Restrict Internet Access\n" + ("="*40))
-    restrict_internet(args.user, BLACKLIST_TXT, verbose=args.verbose)
+    restrict_internet(
+        args.user, BLACKLIST_TXT, verbose=args.verbose, max_workers=args.dns_workers, timeout=args.dns_timeout,
+        backend=args.backend, prefix_path=PREFIXES_TXT, widen_threshold=args.widen_threshold,
+        cache_format=args.cache_format, group=args.group, shared=args.shared_cache,
+        stub_port=DEFAULT_STUB_PORT if args.stub_resolver else None, bundle_path=args.bundle,
+        deadline=args.dns_deadline, resolvers=args.dns_resolver or load_resolvers(RESOLVERS_TXT)
+    )
     print("✅ Internet access restricted.\n")
 
     print("\n🔌 STEP 3: Block USB Storage Devices\n" + ("="*40))
-    restrict_usb_storage_device(args.user, verbose=args.verbose)
+    for user in users:
+        restrict_usb_storage_device(user, verbose=args.verbose)
     print("✅ USB storage devices blocked.\n")
 
     print("\n⏰ STEP 4: Persisting Restrictions\n" + ("="*40))
-    start_persistence(args.user)
+    options = ['--backend', args.backend, '--widen-threshold', str(args.widen_threshold), '--cache-format', args.cache_format]
+    if args.group:
+        options += ['--group', args.group]
+    elif args.shared_cache:
+        options += ['--shared-cache']
+    if args.bundle:
+        options += ['--bundle', str(Path(args.bundle).resolve())]
+    if args.stub_resolver:
+        options += ['--stub-resolver']
+        start_stub_resolver_service(options=['--port', str(DEFAULT_STUB_PORT)])
+    start_persistence(args.user, options=options, name=f"group-{args.group}" if args.group else None,
+                      update_timer=not args.daemon)
+    if send_command("reload") is not None:
+        print("✅ Restriction daemon is reloading the restrictions")
+    elif args.daemon:
+        # Defaults for restrictions whose manifest records no DNS settings (those from older versions)
+        daemon_options = ['--dns-workers', str(args.dns_workers), '--dns-timeout', f"{args.dns_timeout:g}",
+                          '--dns-deadline', f"{args.dns_deadline:g}"]
+        for resolver in args.dns_resolver or []:
+            daemon_options += ['--dns-resolver', resolver]
+        start_daemon_service(options=daemon_options)
     print("✅ Restrictions persisted successfully!\n")
 
     print("\n🎉✅ Restrictions applied successfully!")
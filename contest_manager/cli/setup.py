@@ -3,13 +3,17 @@
 Contest Environment Setup CLI
 """
 
+import os
 import sys
+import argparse
 from pathlib import Path
 from contest_manager.utils.utils import *
 from contest_manager.utils.user_manager import *
 from contest_manager.utils.package_manager_setup import *
 from contest_manager.utils.software_installer import *
 from contest_manager.utils.vscode_extensions_handler import *
+from contest_manager.utils.setup_scheduler import SetupStep, FAILED, DEFAULT_LOG_DIR, run_steps, print_timing_summary
+from contest_manager.utils.package_bundle_handler import PackageBundleError, load_package_bundle, write_bundle_apt_config
 
 
 
@@ -20,36 +24,83 @@ SNAP_TXT = CONFIG_DIR / 'snap.txt'
 FLATPAK_TXT = CONFIG_DIR / 'flatpak.txt'
 VSCODE_EXTENSIONS = CONFIG_DIR / 'vscode-extensions.txt'
 
+def create_parser():
+    parser = argparse.ArgumentParser(
+        description="Set up lab PC with all required software",
+        prog="contest-setup"
+    )
+    parser.add_argument(
+        '--bundle', type=str, metavar='DIR', help='Install every package from an offline bundle made by `bundle build` instead of the network'
+    )
+    parser.add_argument(
+        '--vsix-dir', type=str, metavar='DIR', help='Install VS Code extensions from the <id>.vsix files in DIR when present'
+    )
+    parser.add_argument(
+        '--log-dir', type=str, default=str(DEFAULT_LOG_DIR), metavar='DIR', help=f'Write each setup step\'s log to DIR/<step>.log (default: {DEFAULT_LOG_DIR})'
+    )
+    parser.add_argument(
+        '--sequential', action='store_true', help='Run one setup step at a time instead of independent steps concurrently'
+    )
+    parser.add_argument(
+        '--verbose', '-v', action='store_true', help='Enable verbose output'
+    )
+    return parser
+
+def backup_homes():
+    for username, _ in extract_user_password_pairs(USERS_TXT):
+        create_user_backup(username)
 
+def setup_steps(verbose=False, bundle_dir=None, manifest=None, vsix_dir=None):
+    """
+    Return the setup steps. Package sources need the users in place; apt, snap and flatpak
+    then install concurrently, VS Code extensions follow the `code` snap, and the home
+    backup is taken once everything that writes to the homes has finished.
+    With a package bundle every package comes from bundle_dir instead of the network;
+    VS Code extensions with a VSIX file in vsix_dir (default: the bundle's) are installed from it.
+    """
+    if bundle_dir:
+        sources = setup_bundle_sources
+        vsix_dir = vsix_dir or Path(bundle_dir) / 'vscode'
+    else:
+        sources = lambda: setup_package_sources(APT_TXT)
+    return [
+        SetupStep('users', lambda: setup_users(USERS_TXT)),
+        SetupStep('disable-updates', disable_system_updates),
+        SetupStep('sources', sources, requires=('users',)),
+    ] + software_steps(CONFIG_DIR, verbose=verbose, requires=('sources',), bundle_dir=bundle_dir, manifest=manifest) + [
+        SetupStep('vscode-extensions', lambda: install_vscode_extensions(VSCODE_EXTENSIONS, vsix_dir=vsix_dir), after=('snap',)),
+        SetupStep('cleanup', cleanup_system, after=('apt', 'snap', 'flatpak', 'vscode-extensions')),
+        SetupStep('backup', backup_homes, after=('cleanup',), requires=('users',)),
+    ]
 
 def main():
+    parser = create_parser()
+    args = parser.parse_args()
     check_root()
 
-    print("\n🧑  STEP 1: User Account\n" + ("="*40))
-    setup_users(USERS_TXT)
-
-    print("\n🗂️  STEP 2: System Repositories & Core Tools\n" + ("="*40))
-    setup_package_sources(APT_TXT)
-
-    print("\n💻 STEP 3: Applications\n" + ("="*40))
-    install_all_softwares()
-
-    print("\n🧩 STEP 4: VS Code Extensions\n" + ("="*40))
-    install_vscode_extensions(VSCODE_EXTENSIONS)
-
-    print("\n🚫 STEP 5: Disable System Updates\n" + ("="*40))
-    disable_system_updates()
-
-    print("\n🧹 STEP 6: Cleanup\n" + ("="*40))
-    cleanup_system()
-
-    print("\n🗄️  STEP 7: Backing up home\n" + ("="*40))
-    user_pairs = extract_user_password_pairs(USERS_TXT)
-    for username, _ in user_pairs:
-        create_user_backup(username)
-
+    manifest = None
+    if args.bundle:
+        args.bundle = str(Path(args.bundle).resolve())
+        try:
+            manifest = load_package_bundle(args.bundle)
+        except PackageBundleError as e:
+            print(f"❌ {e}")
+            sys.exit(1)
+        # Every apt-get run by the setup steps reads the bundle's repository only
+        os.environ['APT_CONFIG'] = write_bundle_apt_config(args.bundle)
+        print(f"📦 Installing from package bundle {args.bundle} ({len(manifest['apt'])} apt, {len(manifest['snaps'])} snap, "
+              f"{len(manifest['flatpaks'])} flatpak, {len(manifest['vscode'])} VS Code package(s))")
+
+    print("\n🚀 Running setup steps\n" + ("="*40))
+    results = run_steps(setup_steps(verbose=args.verbose, bundle_dir=args.bundle, manifest=manifest, vsix_dir=args.vsix_dir),
+                        max_parallel=1 if args.sequential else None, log_dir=args.log_dir)
+    print_timing_summary(results)
+
+    if any(result["status"] == FAILED for result in results.values()):
+        print("\n❌ Setup finished with failed steps, see the logs above.")
+        sys.exit(1)
     print("\n🎉✅ Setup complete!")
     sys.exit(0)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
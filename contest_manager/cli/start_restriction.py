@@ -8,11 +8,17 @@ import argparse
 from pathlib import Path
 
 from contest_manager.utils.utils import check_root
-from contest_manager.utils.internet_handler import apply_restrictions_from_cache
+from contest_manager.utils.internet_handler import (
+    apply_restrictions_from_cache, import_cache_bundle, get_group_members, BACKENDS, STUB_RESOLVER_BACKENDS, DEFAULT_BACKEND
+)
 from contest_manager.utils.usb_handler import restrict_usb_storage_device
+from contest_manager.utils.cidr_handler import DEFAULT_WIDEN_THRESHOLD
+from contest_manager.utils.stub_resolver_handler import DEFAULT_STUB_PORT
+from contest_manager.utils.cache_handler import CACHE_FORMATS, DEFAULT_CACHE_FORMAT
 
 CONFIG_DIR = Path(__file__).parent.parent.parent / 'config'
 BLACKLIST_TXT = CONFIG_DIR / 'blacklist.txt'
+PREFIXES_TXT = CONFIG_DIR / 'prefixes.txt'
 
 def create_parser():
     parser = argparse.ArgumentParser(
@@ -22,6 +28,27 @@ def create_parser():
     parser.add_argument(
         'user', nargs='?', default='participant', help='Username to restrict (default: participant)'
     )
+    parser.add_argument(
+        '--widen-threshold', type=int, default=DEFAULT_WIDEN_THRESHOLD, help='Block a whole /24 (IPv4) or /48 (IPv6) once it holds this many cached entries (default: 0, off)'
+    )
+    parser.add_argument(
+        '--backend', choices=BACKENDS, default=DEFAULT_BACKEND, help=f'Firewall backend (default: {DEFAULT_BACKEND})'
+    )
+    parser.add_argument(
+        '--group', type=str, help='Restrict every member of this group with one shared ruleset (the user argument is ignored)'
+    )
+    parser.add_argument(
+        '--shared-cache', action='store_true', help='Use the machine-wide IP cache instead of a per-user cache (implied by --group)'
+    )
+    parser.add_argument(
+        '--stub-resolver', action='store_true', help='Redirect the user\'s DNS to the local blocking stub resolver instead of adding per-domain string-match rules'
+    )
+    parser.add_argument(
+        '--cache-format', choices=list(CACHE_FORMATS), default=DEFAULT_CACHE_FORMAT, help=f'On-disk IP cache format (default: {DEFAULT_CACHE_FORMAT})'
+    )
+    parser.add_argument(
+        '--bundle', type=str, help='Re-import the IP cache from this bundle first; the existing cache is used if it cannot be read'
+    )
     parser.add_argument(
         '--verbose', '-v', action='store_true', help='Enable verbose output'
     )
@@ -30,12 +57,28 @@ def create_parser():
 def main():
     parser = create_parser()
     args = parser.parse_args()
+    if args.backend in STUB_RESOLVER_BACKENDS and not args.stub_resolver:
+        parser.error(f"--backend {args.backend} requires --stub-resolver, it cannot block domain names in DNS/DoH traffic")
     check_root()
     user = args.user
+    users = (get_group_members(args.group) or []) if args.group else [user]
+    if args.bundle:
+        print("\n📦 Importing IP cache bundle\n" + ("="*40))
+        success, _ = import_cache_bundle(
+            user, args.bundle, BLACKLIST_TXT, verbose=args.verbose, cache_format=args.cache_format,
+            shared=args.shared_cache or bool(args.group)
+        )
+        if not success:
+            print("⚠️  Applying the existing IP cache instead.")
     print("\n🌐 Applying internet restrictions from cache\n" + ("="*40))
-    apply_restrictions_from_cache(user, verbose=args.verbose)
+    apply_restrictions_from_cache(
+        user, verbose=args.verbose, backend=args.backend, prefix_path=PREFIXES_TXT, widen_threshold=args.widen_threshold,
+        cache_format=args.cache_format, group=args.group, shared=args.shared_cache,
+        stub_port=DEFAULT_STUB_PORT if args.stub_resolver else None
+    )
     print("\n🔌 Blocking USB storage devices\n" + ("="*40))
-    restrict_usb_storage_device(user, verbose=args.verbose)
+    for member in users:
+        restrict_usb_storage_device(member, verbose=args.verbose)
     print("\n✅ Internet and USB restrictions applied from cache.\n")
     sys.exit(0)
 
@@ -2,14 +2,20 @@
 """
 Contest Environment Status CLI
 """
-#!/usr/bin/env python3
-"""
-Contest Environment Status CLI
-"""
 import sys
+import pwd
+import json
+import time
 import argparse
 from contest_manager.utils.usb_handler import usb_restriction_check
-from contest_manager.utils.internet_handler import internet_restriction_check
+from contest_manager.utils.internet_handler import internet_restriction_check, restriction_reports
+from contest_manager.utils.daemon_handler import send_command
+
+STATUS_LABELS = {
+    "active": "✅ Active",
+    "drifted": "⚠️  Drifted",
+    "missing": "❌ Missing",
+}
 
 def create_parser():
     parser = argparse.ArgumentParser(
@@ -19,20 +25,81 @@ def create_parser():
     parser.add_argument(
         'user', nargs='?', default='participant', help='Username to check (default: participant)'
     )
+    parser.add_argument(
+        '--all', action='store_true', help='Check every restricted user and group on this machine'
+    )
+    parser.add_argument(
+        '--json', action='store_true', help='Print the status as a JSON list with one entry per restriction'
+    )
     parser.add_argument(
         '--verbose', '-v', action='store_true', help='Enable verbose output'
     )
     return parser
 
+def report_users(report):
+    """Return the users a report covers (the members of a group restriction)."""
+    if report["user"]:
+        return [report["user"]]
+    users = []
+    for uid in report["uids"]:
+        try:
+            users.append(pwd.getpwuid(uid).pw_name)
+        except KeyError:
+            pass
+    return users
+
+def print_report(report, verbose=False):
+    label = f"group: {report['group']}" if report["group"] else f"user: {report['user']}"
+    print(f"\n🔎 Restriction Status for {label}\n" + ("="*40))
+    applied = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(report["applied_at"]))
+    print(f"  Internet restrictions: {STATUS_LABELS[report['status']]} "
+          f"({report['backend']}, {report['rule_count']} rule(s), applied {applied})")
+    for problem in report["problems"]:
+        print(f"    - {problem}")
+    print(f"  IP cache: {'✅ Unchanged since apply' if report['cache_current'] else '🔄 Changed since apply (run update-restriction)'}")
+    if report["daemon"]:
+        next_refresh = report["daemon"]["next_refresh"]
+        print(f"  Updates: 🛰️  contest-manager daemon (pid {report['daemon']['pid']}"
+              + (f", next DNS refresh {time.strftime('%H:%M:%S', time.localtime(next_refresh))})" if next_refresh else ")"))
+    if report["stub_port"]:
+        print(f"  DNS: redirected to the local stub resolver on port {report['stub_port']}")
+    for user, restricted in report["usb"].items():
+        print(f"  USB restrictions{f' ({user})' if report['group'] else ''}: {'✅ Active' if restricted else '❌ Inactive'}")
+    if verbose:
+        print(f"  Owner: {report['owner']}, UIDs: {', '.join(str(uid) for uid in report['uids'])}")
+
 def main():
     parser = create_parser()
     args = parser.parse_args()
-    user = args.user
-    print(f"\n🔎 Restriction Status for user: {user}\n" + ("="*40))
-    net_status = internet_restriction_check(user)
-    print(f"  Internet restrictions: {'✅ Active' if net_status else '❌ Inactive'}")
-    usb_status = usb_restriction_check(user)
-    print(f"  USB restrictions: {'✅ Active' if usb_status else '❌ Inactive'}")
+    reports = restriction_reports(None if args.all else args.user)
+    daemon = send_command("status") if reports else None
+    for report in reports:
+        report["usb"] = {user: usb_restriction_check(user) for user in report_users(report)}
+        managed = daemon is not None and report["owner"] in daemon["restrictions"]
+        report["daemon"] = {"pid": daemon["pid"], "next_refresh": daemon["next_refresh"]} if managed else None
+
+    if not reports and not args.all:
+        # Restrictions applied before manifests were recorded are only detected by their jump rule
+        net_status = internet_restriction_check(args.user)
+        usb_status = usb_restriction_check(args.user)
+        if args.json:
+            print(json.dumps([{"user": args.user, "status": "active" if net_status else "inactive",
+                               "manifest": False, "usb": {args.user: usb_status}}], indent=2))
+            return
+        print(f"\n🔎 Restriction Status for user: {args.user}\n" + ("="*40))
+        print(f"  Internet restrictions: {'✅ Active' if net_status else '❌ Inactive'}")
+        print(f"  USB restrictions: {'✅ Active' if usb_status else '❌ Inactive'}")
+        print("\nStatus check complete.\n")
+        return
+
+    if args.json:
+        print(json.dumps(reports, indent=2))
+        return
+    if not reports:
+        print("No restrictions are recorded on this machine.")
+        return
+    for report in reports:
+        print_report(report, verbose=args.verbose)
     print("\nStatus check complete.\n")
 
 if __name__ == "__main__":
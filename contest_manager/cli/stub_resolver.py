@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Contest Environment Stub Resolver CLI
+"""
+import sys
+import signal
+import argparse
+import threading
+from pathlib import Path
+
+from contest_manager.utils.utils import check_root
+from contest_manager.utils.internet_handler import get_blacklist_matcher
+from contest_manager.utils.domain_matcher import count_rules
+from contest_manager.utils.stub_resolver_handler import (
+    DEFAULT_STUB_PORT, default_upstream, start_stub_resolver, stop_stub_resolver
+)
+
+CONFIG_DIR = Path(__file__).parent.parent.parent / 'config'
+BLACKLIST_TXT = CONFIG_DIR / 'blacklist.txt'
+
+def create_parser():
+    parser = argparse.ArgumentParser(
+        description="Run the local blocking stub resolver (NXDOMAIN for blacklisted names, forwards the rest)",
+        prog="contest-stub-resolver"
+    )
+    parser.add_argument(
+        '--port', type=int, default=DEFAULT_STUB_PORT, help=f'Loopback port to listen on (default: {DEFAULT_STUB_PORT})'
+    )
+    parser.add_argument(
+        '--upstream', type=str, help='Upstream resolver address (default: first nameserver in /etc/resolv.conf)'
+    )
+    parser.add_argument(
+        '--upstream-port', type=int, default=53, help='Upstream resolver port (default: 53)'
+    )
+    parser.add_argument(
+        '--blacklist', type=str, default=str(BLACKLIST_TXT), help='Blacklist file (default: config/blacklist.txt)'
+    )
+    return parser
+
+def main():
+    parser = create_parser()
+    args = parser.parse_args()
+    if args.port < 1024:
+        check_root()
+    upstream = args.upstream or default_upstream()
+    matcher = get_blacklist_matcher(args.blacklist)
+    servers = start_stub_resolver(matcher, upstream, upstream_port=args.upstream_port, port=args.port)
+    if not servers:
+        print("❌ Stub resolver could not listen on any loopback address.")
+        sys.exit(1)
+    print(f"🧭 Stub resolver on port {args.port}: {count_rules(matcher)} blacklist rule(s), forwarding to {upstream}:{args.upstream_port}")
+
+    def reload(signum, frame):
+        reloaded = get_blacklist_matcher(args.blacklist)
+        for server in servers:
+            server.matcher = reloaded
+        print(f"🔄 Reloaded blacklist: {count_rules(reloaded)} rule(s)")
+
+    stopped = threading.Event()
+    signal.signal(signal.SIGHUP, reload)
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopped.set())
+    try:
+        while not stopped.wait(1):
+            pass
+    except KeyboardInterrupt:
+        pass
+    stop_stub_resolver(servers)
+    sys.exit(0)
+
+if __name__ == "__main__":
+    main()
@@ -9,7 +9,9 @@ from pathlib import Path
 from contest_manager.utils.utils import check_root
 from contest_manager.utils.internet_handler import *
 from contest_manager.utils.usb_handler import *
-from contest_manager.utils.persistence_handler import remove_persistence
+from contest_manager.utils.manifest_handler import load_manifests
+from contest_manager.utils.daemon_handler import send_command
+from contest_manager.utils.persistence_handler import remove_persistence, remove_stub_resolver_service, remove_daemon_service
 
 CONFIG_DIR = Path(__file__).parent.parent.parent / 'config'
 BLACKLIST_TXT = CONFIG_DIR / 'blacklist.txt'
@@ -25,23 +27,50 @@ def create_parser():
     parser.add_argument(
         '--config-dir', type=str, help='Configuration directory path (default: project root)'
     )
+    parser.add_argument(
+        '--group', type=str, help='Remove the shared restriction of this group and unrestrict its members (the user argument is ignored)'
+    )
     parser.add_argument(
         '--verbose', '-v', action='store_true', help='Enable verbose output'
     )
     return parser
 
+def release_daemon():
+    """Tell a running daemon to forget removed restrictions, and remove it once none are left."""
+    if not load_manifests(get_manifest_dir()):
+        remove_daemon_service()
+    else:
+        send_command("reload")
+
 def main():
     parser = create_parser()
     args = parser.parse_args()
     check_root()
 
     print("\n🧹 Unrestricting Contest Environment\n" + ("="*40))
+    if args.group:
+        users = get_group_members(args.group) or []
+        print(f"Removing persistence for group: {args.group} ...")
+        remove_persistence(f"group-{args.group}")
+        print(f"Removing internet restriction for group: {args.group} ...")
+        unrestrict_internet(args.user, BLACKLIST_TXT, verbose=args.verbose, group=args.group)
+        for user in users:
+            print(f"Removing USB restriction for user: {user} ...")
+            unrestrict_usb_storage_device(user, verbose=args.verbose)
+        if not stub_resolver_in_use():
+            remove_stub_resolver_service()
+        release_daemon()
+        print("✅ All restrictions removed for group: {}\n".format(args.group))
+        sys.exit(0)
     print(f"Removing persistence for user: {args.user} ...")
     remove_persistence(args.user)
     print(f"Removing internet restriction for user: {args.user} ...")
     unrestrict_internet(args.user, BLACKLIST_TXT, verbose=args.verbose)
     print(f"Removing USB restriction for user: {args.user} ...")
     unrestrict_usb_storage_device(args.user, verbose=args.verbose)
+    if not stub_resolver_in_use():
+        remove_stub_resolver_service()
+    release_daemon()
     print("✅ All restrictions removed for user: {}\n".format(args.user))
     sys.exit(0)
 
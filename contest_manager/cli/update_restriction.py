@@ -7,10 +7,20 @@ import argparse
 from pathlib import Path
 
 from contest_manager.utils.utils import check_root
-from contest_manager.utils.internet_handler import update_ip_cache, apply_restrictions_from_cache
+from contest_manager.utils.internet_handler import (
+    update_ip_cache, import_cache_bundle, apply_restrictions_from_cache, BACKENDS, STUB_RESOLVER_BACKENDS, DEFAULT_BACKEND
+)
+from contest_manager.utils.dns_handler import DEFAULT_DNS_WORKERS, DEFAULT_DNS_TIMEOUT, DEFAULT_DNS_DEADLINE, resolver_spec, load_resolvers
+from contest_manager.utils.cidr_handler import DEFAULT_WIDEN_THRESHOLD
+from contest_manager.utils.stub_resolver_handler import DEFAULT_STUB_PORT
+from contest_manager.utils.cache_handler import (
+    DEFAULT_CACHE_GRACE, DEFAULT_MAX_IPS_PER_TARGET, DEFAULT_NEGATIVE_TTL, CACHE_FORMATS, DEFAULT_CACHE_FORMAT
+)
 
 CONFIG_DIR = Path(__file__).parent.parent.parent / 'config'
 BLACKLIST_TXT = CONFIG_DIR / 'blacklist.txt'
+PREFIXES_TXT = CONFIG_DIR / 'prefixes.txt'
+RESOLVERS_TXT = CONFIG_DIR / 'resolvers.txt'
 
 def create_parser():
     parser = argparse.ArgumentParser(
@@ -20,6 +30,50 @@ def create_parser():
     parser.add_argument(
         'user', nargs='?', default='participant', help='Username to update restrictions for (default: participant)'
     )
+    parser.add_argument(
+        '--dns-workers', type=int, default=DEFAULT_DNS_WORKERS, help=f'Maximum concurrent DNS queries (default: {DEFAULT_DNS_WORKERS})'
+    )
+    parser.add_argument(
+        '--dns-timeout', type=float, default=DEFAULT_DNS_TIMEOUT, help=f'Per-query DNS timeout in seconds (default: {DEFAULT_DNS_TIMEOUT})'
+    )
+    parser.add_argument(
+        '--dns-deadline', type=float, default=DEFAULT_DNS_DEADLINE,
+        help=f'Give up on names still unresolved after this many seconds, keeping their cached addresses (0 = no limit, default: {DEFAULT_DNS_DEADLINE:g})'
+    )
+    parser.add_argument(
+        '--dns-resolver', action='append', type=resolver_spec, metavar='ADDRESS',
+        help='Query this resolver ("system", IP or IP:port) instead of those in config/resolvers.txt; repeat to fan out to several'
+    )
+    parser.add_argument(
+        '--cache-grace', type=int, default=DEFAULT_CACHE_GRACE, help=f'Seconds past its DNS TTL before an unseen address is dropped (default: {DEFAULT_CACHE_GRACE})'
+    )
+    parser.add_argument(
+        '--cache-max-ips', type=int, default=DEFAULT_MAX_IPS_PER_TARGET, help=f'Maximum cached addresses per target, 0 for no limit (default: {DEFAULT_MAX_IPS_PER_TARGET})'
+    )
+    parser.add_argument(
+        '--negative-ttl', type=int, default=DEFAULT_NEGATIVE_TTL, help=f'Seconds to skip names that answered NXDOMAIN/NODATA (default: {DEFAULT_NEGATIVE_TTL})'
+    )
+    parser.add_argument(
+        '--widen-threshold', type=int, default=DEFAULT_WIDEN_THRESHOLD, help='Block a whole /24 (IPv4) or /48 (IPv6) once it holds this many cached entries (default: 0, off)'
+    )
+    parser.add_argument(
+        '--backend', choices=BACKENDS, default=DEFAULT_BACKEND, help=f'Firewall backend (default: {DEFAULT_BACKEND})'
+    )
+    parser.add_argument(
+        '--group', type=str, help='Restrict every member of this group with one shared ruleset (the user argument is ignored)'
+    )
+    parser.add_argument(
+        '--shared-cache', action='store_true', help='Use the machine-wide IP cache instead of a per-user cache (implied by --group)'
+    )
+    parser.add_argument(
+        '--stub-resolver', action='store_true', help='Redirect the user\'s DNS to the local blocking stub resolver instead of adding per-domain string-match rules'
+    )
+    parser.add_argument(
+        '--cache-format', choices=list(CACHE_FORMATS), default=DEFAULT_CACHE_FORMAT, help=f'On-disk IP cache format (default: {DEFAULT_CACHE_FORMAT})'
+    )
+    parser.add_argument(
+        '--bundle', type=str, help='Re-import the IP cache from this bundle instead of resolving the blacklist'
+    )
     parser.add_argument(
         '--verbose', '-v', action='store_true', help='Enable verbose output'
     )
@@ -28,14 +82,31 @@ def create_parser():
 def main():
     parser = create_parser()
     args = parser.parse_args()
+    if args.backend in STUB_RESOLVER_BACKENDS and not args.stub_resolver:
+        parser.error(f"--backend {args.backend} requires --stub-resolver, it cannot block domain names in DNS/DoH traffic")
     check_root()
     user = args.user
     print("\n🌐 Updating stored IP cache\n" + ("="*40))
-    success, cache_path = update_ip_cache(user, BLACKLIST_TXT, verbose=args.verbose)
+    if args.bundle:
+        success, cache_path = import_cache_bundle(
+            user, args.bundle, BLACKLIST_TXT, verbose=args.verbose, cache_format=args.cache_format,
+            shared=args.shared_cache or bool(args.group)
+        )
+    else:
+        success, cache_path = update_ip_cache(
+            user, BLACKLIST_TXT, verbose=args.verbose, max_workers=args.dns_workers, timeout=args.dns_timeout,
+            grace=args.cache_grace, max_per_target=args.cache_max_ips, negative_ttl=args.negative_ttl,
+            cache_format=args.cache_format, shared=args.shared_cache or bool(args.group), deadline=args.dns_deadline,
+            resolvers=args.dns_resolver or load_resolvers(RESOLVERS_TXT)
+        )
     if success:
         print(f"\n✅ IP cache updated at {cache_path}\n")
         print("\n🌐 Re-applying internet restrictions from updated cache\n" + ("="*40))
-        apply_restrictions_from_cache(user, verbose=args.verbose)
+        apply_restrictions_from_cache(
+            user, verbose=args.verbose, backend=args.backend, incremental=True,
+            prefix_path=PREFIXES_TXT, widen_threshold=args.widen_threshold, cache_format=args.cache_format,
+            group=args.group, shared=args.shared_cache, stub_port=DEFAULT_STUB_PORT if args.stub_resolver else None
+        )
         print("\n✅ Internet restrictions updated and applied from cache.\n")
     else:
         print("\n❌ Failed to update IP cache.\n")
@@ -0,0 +1,169 @@
+"""
+Compact binary IP cache format for contest-manager
+
+Layout (little endian):
+
+    header   magic "CMIC", format version (u16), cache schema version (u16),
+             SHA-256 of the body (32 bytes), body length (u64)
+    body     string table:  count (u32), then per string: length (u16) + UTF-8 bytes
+             targets:       count (u32), then per target: name index (u32), IPv4 count (u32),
+                            IPv6 count (u32), packed IPv4 entries, packed IPv6 entries
+             negative:      count (u32), then per name: name index (u32), status (u8), checked (u32)
+
+Every address entry is the packed address followed by first_seen, last_seen and ttl (u32 each).
+Target and negative-cache names are interned once in the string table. Files are read through
+mmap and written to a temporary file that is renamed over the old one, so readers never see a
+partially written cache.
+"""
+
+import os
+import mmap
+import socket
+import stat
+import struct
+import hashlib
+import tempfile
+from pathlib import Path
+
+MAGIC = b"CMIC"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<4sHH32sQ")
+COUNT = struct.Struct("<I")
+STRING_LENGTH = struct.Struct("<H")
+TARGET = struct.Struct("<III")
+ENTRY_V4 = struct.Struct("<4sIII")
+ENTRY_V6 = struct.Struct("<16sIII")
+NEGATIVE = struct.Struct("<IBI")
+STATUS_CODES = {'nxdomain': 1, 'nodata': 2}
+STATUS_NAMES = {code: status for status, code in STATUS_CODES.items()}
+# Mode of files write_atomic creates (mkstemp alone would leave them 0600)
+DEFAULT_FILE_MODE = 0o644
+
+def is_binary_cache(path):
+    """Return True if the file at `path` starts with the binary cache magic."""
+    try:
+        with open(path, 'rb') as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+def encode_cache(cache):
+    """Serialize a cache dict (see cache_handler) to bytes."""
+    names = list(cache["targets"])
+    index = {name: i for i, name in enumerate(names)}
+    for name in cache["negative"]:
+        if name not in index:
+            index[name] = len(names)
+            names.append(name)
+
+    body = bytearray(COUNT.pack(len(names)))
+    for name in names:
+        encoded = name.encode('utf-8')
+        body += STRING_LENGTH.pack(len(encoded)) + encoded
+
+    body += COUNT.pack(len(cache["targets"]))
+    for target, entries in cache["targets"].items():
+        v4 = bytearray()
+        v6 = bytearray()
+        for ip, entry in entries.items():
+            fields = (entry["first_seen"], entry["last_seen"], entry["ttl"])
+            if ':' in ip:
+                v6 += ENTRY_V6.pack(socket.inet_pton(socket.AF_INET6, ip), *fields)
+            else:
+                v4 += ENTRY_V4.pack(socket.inet_pton(socket.AF_INET, ip), *fields)
+        body += TARGET.pack(index[target], len(v4) // ENTRY_V4.size, len(v6) // ENTRY_V6.size) + v4 + v6
+
+    body += COUNT.pack(len(cache["negative"]))
+    for name, entry in cache["negative"].items():
+        body += NEGATIVE.pack(index[name], STATUS_CODES[entry["status"]], entry["checked"])
+
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, cache["version"], hashlib.sha256(body).digest(), len(body))
+    return header + bytes(body)
+
+def decode_cache(buf):
+    """Parse bytes (or an mmap) produced by encode_cache back into a cache dict."""
+    if len(buf) < HEADER.size:
+        raise ValueError("binary cache is truncated")
+    magic, version, schema, digest, length = HEADER.unpack_from(buf, 0)
+    if magic != MAGIC or version != FORMAT_VERSION:
+        raise ValueError("not a supported binary cache")
+    view = memoryview(buf)
+    try:
+        body = view[HEADER.size:HEADER.size + length]
+        try:
+            intact = len(body) == length and hashlib.sha256(body).digest() == digest
+        finally:
+            # A slice still exported would keep the mmap from closing and hide this error
+            body.release()
+        if not intact:
+            raise ValueError("binary cache checksum mismatch")
+        offset = HEADER.size
+
+        (count,) = COUNT.unpack_from(buf, offset)
+        offset += COUNT.size
+        names = []
+        for _ in range(count):
+            (size,) = STRING_LENGTH.unpack_from(buf, offset)
+            offset += STRING_LENGTH.size
+            names.append(bytes(view[offset:offset + size]).decode('utf-8'))
+            offset += size
+
+        targets = {}
+        (count,) = COUNT.unpack_from(buf, offset)
+        offset += COUNT.size
+        for _ in range(count):
+            name_index, v4_count, v6_count = TARGET.unpack_from(buf, offset)
+            offset += TARGET.size
+            entries = {}
+            for family, layout, n in ((socket.AF_INET, ENTRY_V4, v4_count), (socket.AF_INET6, ENTRY_V6, v6_count)):
+                end = offset + layout.size * n
+                for packed, first_seen, last_seen, ttl in layout.iter_unpack(view[offset:end]):
+                    entries[socket.inet_ntop(family, packed)] = {"first_seen": first_seen, "last_seen": last_seen, "ttl": ttl}
+                offset = end
+            targets[names[name_index]] = entries
+
+        negative = {}
+        (count,) = COUNT.unpack_from(buf, offset)
+        offset += COUNT.size
+        for name_index, status, checked in NEGATIVE.iter_unpack(view[offset:offset + NEGATIVE.size * count]):
+            negative[names[name_index]] = {"status": STATUS_NAMES[status], "checked": checked}
+    finally:
+        view.release()
+    return {"version": schema, "targets": targets, "negative": negative}
+
+def load_binary_cache(path):
+    """Load a binary cache file through mmap."""
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise ValueError("binary cache is empty")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            return decode_cache(buf)
+
+def write_atomic(path, data):
+    """
+    Write bytes to `path` via a temporary file in the same directory and an atomic rename.
+    The file keeps the mode of the file it replaces, or gets DEFAULT_FILE_MODE if it is new.
+    """
+    path = Path(path)
+    try:
+        mode = stat.S_IMODE(path.stat().st_mode)
+    except FileNotFoundError:
+        mode = DEFAULT_FILE_MODE
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{path.name}.", dir=str(path.parent))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            os.fchmod(f.fileno(), mode)
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, str(path))
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+def save_binary_cache(path, cache):
+    """Write a cache dict to `path` in the binary format."""
+    write_atomic(path, encode_cache(cache))
@@ -0,0 +1,76 @@
+"""
+IP cache bundles for contest-manager
+
+A bundle carries a resolved IP cache together with the targets and the compiled domain
+matcher it was built from, so one machine can resolve the blacklist and every other
+lab PC can apply the same restrictions without any DNS traffic. The file is gzip
+compressed and holds a one-line JSON header followed by the JSON payload:
+
+    {"format": "contest-manager-bundle", "version": 1, "sha256": "<payload hash>", "size": <payload bytes>}
+    {"created_at": ..., "host": ..., "blacklist": "<rule digest>", "cache": {...}, "targets": [...], "matcher": {...}}
+
+The header's sha256 covers the exact payload bytes and is checked before anything is installed.
+"""
+
+import gzip
+import json
+import time
+import socket
+import hashlib
+
+from contest_manager.utils.binary_cache_handler import write_atomic
+from contest_manager.utils.cache_handler import CACHE_VERSION
+
+BUNDLE_FORMAT = "contest-manager-bundle"
+BUNDLE_VERSION = 1
+
+class BundleError(ValueError):
+    """Raised when a bundle is not a contest-manager bundle, has another version or fails its checksum."""
+
+def build_bundle(cache, target_groups, matcher, blacklist_digest):
+    """Return the payload of a bundle for a cache and the targets and matcher compiled from the blacklist."""
+    return {
+        "created_at": int(time.time()),
+        "host": socket.gethostname(),
+        "blacklist": blacklist_digest,
+        "cache": cache,
+        "targets": [[domain, list(names)] for domain, names in target_groups],
+        "matcher": matcher,
+    }
+
+def encode_bundle(payload):
+    """Serialize a bundle payload with its checksummed header. Returns the gzip-compressed bytes."""
+    body = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    header = {"format": BUNDLE_FORMAT, "version": BUNDLE_VERSION, "sha256": hashlib.sha256(body).hexdigest(), "size": len(body)}
+    return gzip.compress(json.dumps(header).encode('utf-8') + b"\n" + body)
+
+def decode_bundle(data):
+    """Verify and parse the bytes of a bundle file. Returns the payload; raises BundleError if it is invalid."""
+    try:
+        raw = gzip.decompress(data)
+    except (OSError, EOFError):
+        raise BundleError("not a gzip-compressed bundle")
+    header_line, _, body = raw.partition(b"\n")
+    try:
+        header = json.loads(header_line.decode('utf-8'))
+    except ValueError:
+        raise BundleError("unreadable bundle header")
+    if not isinstance(header, dict) or header.get("format") != BUNDLE_FORMAT:
+        raise BundleError("not a contest-manager bundle")
+    if header.get("version") != BUNDLE_VERSION:
+        raise BundleError(f"unsupported bundle version {header.get('version')} (expected {BUNDLE_VERSION})")
+    if len(body) != header.get("size") or hashlib.sha256(body).hexdigest() != header.get("sha256"):
+        raise BundleError("checksum mismatch, the bundle is truncated or corrupted")
+    payload = json.loads(body.decode('utf-8'))
+    if payload.get("cache", {}).get("version") != CACHE_VERSION:
+        raise BundleError(f"bundle cache has schema version {payload.get('cache', {}).get('version')} (expected {CACHE_VERSION})")
+    return payload
+
+def save_bundle(path, payload):
+    """Atomically write a bundle file."""
+    write_atomic(path, encode_bundle(payload))
+
+def load_bundle(path):
+    """Read and verify a bundle file. Raises FileNotFoundError if it is missing and BundleError if it is invalid."""
+    with open(path, 'rb') as f:
+        return decode_bundle(f.read())
@@ -0,0 +1,173 @@
+"""
+IP cache utilities for contest-manager
+
+The cache maps every blacklist target to the addresses it resolved to, along with
+when each address was first and last seen and the DNS TTL it was served with.
+Names that answered NXDOMAIN or NODATA are kept in a separate negative cache:
+
+    {"version": 2,
+     "targets": {"example.com": {"93.184.216.34": {"first_seen": ..., "last_seen": ..., "ttl": 300}}},
+     "negative": {"dev.example.com": {"status": "nxdomain", "checked": ...}}}
+
+Caches written by older versions ({"example.com": ["93.184.216.34", ...]}) are migrated on load.
+A cache file that exists but cannot be read or has an unknown schema raises CacheError rather than
+reading as empty, since applying an empty cache would lift every restriction.
+The same data can also be stored in the compact binary format of binary_cache_handler;
+files ending in .bin are written in that format and either format is detected on load.
+"""
+
+import json
+import time
+from pathlib import Path
+from contest_manager.utils.binary_cache_handler import is_binary_cache, load_binary_cache, save_binary_cache, write_atomic
+
+CACHE_VERSION = 2
+DEFAULT_CACHE_GRACE = 12 * 3600
+DEFAULT_MAX_IPS_PER_TARGET = 64
+DEFAULT_NEGATIVE_TTL = 6 * 3600
+NEGATIVE_STATUSES = ('nxdomain', 'nodata')
+CACHE_FORMATS = {"json": ".json", "binary": ".bin"}
+DEFAULT_CACHE_FORMAT = "json"
+
+class CacheError(ValueError):
+    """Raised when a cache file exists but is corrupted, unreadable or has an unknown schema."""
+
+def new_cache():
+    """Return an empty cache."""
+    return {"version": CACHE_VERSION, "targets": {}, "negative": {}}
+
+def migrate_cache(data, now=None):
+    """Convert a legacy {target: [ips]} cache to the current schema."""
+    now = int(now if now is not None else time.time())
+    cache = new_cache()
+    for target, ips in data.items():
+        if not isinstance(ips, list):
+            raise TypeError(f"{target}: expected a list of addresses")
+        cache["targets"][target] = {ip: {"first_seen": now, "last_seen": now, "ttl": 0} for ip in ips}
+    return cache
+
+def find_cache_file(cache_path):
+    """
+    Return the cache file to read for `cache_path`: the path itself if it exists, otherwise
+    the same cache stored in the other format (so switching formats keeps the cached data).
+    """
+    cache_path = Path(cache_path)
+    if cache_path.exists():
+        return cache_path
+    for suffix in CACHE_FORMATS.values():
+        candidate = cache_path.with_suffix(suffix)
+        if candidate.exists():
+            return candidate
+    return cache_path
+
+def load_cache(cache_path):
+    """
+    Load a cache file in either format, migrating old schemas. Returns an empty cache if the
+    file is missing and raises CacheError if it is corrupted, unreadable or has an unknown schema.
+    """
+    cache_path = find_cache_file(cache_path)
+    if not cache_path.exists():
+        return new_cache()
+    if is_binary_cache(cache_path):
+        try:
+            data = load_binary_cache(cache_path)
+        except Exception as e:
+            raise CacheError(f"IP cache {cache_path} is corrupted ({e})")
+    else:
+        try:
+            with open(cache_path) as f:
+                data = json.load(f)
+        except OSError as e:
+            raise CacheError(f"IP cache {cache_path} cannot be read ({e.strerror})")
+        except ValueError:
+            raise CacheError(f"IP cache {cache_path} is not valid JSON")
+        if not isinstance(data, dict):
+            raise CacheError(f"IP cache {cache_path} is not a cache in any known schema")
+    if "version" not in data:
+        try:
+            return migrate_cache(data, now=Path(cache_path).stat().st_mtime)
+        except TypeError:
+            raise CacheError(f"IP cache {cache_path} is not a cache in any known schema")
+    if data["version"] != CACHE_VERSION:
+        raise CacheError(f"IP cache {cache_path} has unknown schema version {data['version']!r} (expected {CACHE_VERSION})")
+    data.setdefault("negative", {})
+    if not isinstance(data.get("targets"), dict) or not isinstance(data["negative"], dict):
+        raise CacheError(f"IP cache {cache_path} is not a valid version {CACHE_VERSION} cache")
+    return data
+
+def save_cache(cache_path, cache):
+    """Atomically write a cache file, in the binary format if the path ends in .bin and as JSON otherwise."""
+    if Path(cache_path).suffix == CACHE_FORMATS["binary"]:
+        save_binary_cache(cache_path, cache)
+    else:
+        write_atomic(cache_path, json.dumps(cache, indent=2).encode('utf-8'))
+
+def convert_cache(source_path, dest_path):
+    """Copy a cache from one file to another, converting between the JSON and binary formats by extension."""
+    if not Path(source_path).exists():
+        raise FileNotFoundError(source_path)
+    cache = load_cache(source_path)
+    save_cache(dest_path, cache)
+    return cache
+
+def merge_resolved(cache, resolved, now=None):
+    """
+    Record a resolution pass ({target: {ip: ttl}}) in the cache.
+    New addresses get a first-seen time; addresses seen again have last-seen and TTL refreshed.
+    """
+    now = int(now if now is not None else time.time())
+    for target, answers in resolved.items():
+        entries = cache["targets"].setdefault(target, {})
+        for ip, ttl in answers.items():
+            entry = entries.setdefault(ip, {"first_seen": now, "last_seen": now, "ttl": ttl})
+            entry["last_seen"] = now
+            entry["ttl"] = ttl
+    return cache
+
+def record_statuses(cache, statuses, now=None):
+    """
+    Store NXDOMAIN/NODATA results in the negative cache and forget names that resolved again.
+    Timeouts and other errors are not cached.
+    """
+    now = int(now if now is not None else time.time())
+    negative = cache["negative"]
+    for name, status in statuses.items():
+        if status in NEGATIVE_STATUSES:
+            negative[name] = {"status": status, "checked": now}
+        elif status == 'ok':
+            negative.pop(name, None)
+    return cache
+
+def known_missing(cache, negative_ttl=DEFAULT_NEGATIVE_TTL, now=None):
+    """Return the names whose negative answer is younger than `negative_ttl` seconds."""
+    now = int(now if now is not None else time.time())
+    return {name for name, entry in cache["negative"].items() if now - entry["checked"] < negative_ttl}
+
+def expire_cache(cache, resolved, grace=DEFAULT_CACHE_GRACE, max_per_target=DEFAULT_MAX_IPS_PER_TARGET, now=None):
+    """
+    Drop stale addresses and enforce the per-target size limit.
+    An address is stale once it has not been seen for its TTL plus `grace` seconds.
+    Only targets that resolved in this pass are pruned, so a DNS outage never empties the cache.
+    Returns the number of addresses removed.
+    """
+    now = int(now if now is not None else time.time())
+    removed = 0
+    for target, answers in resolved.items():
+        entries = cache["targets"].get(target)
+        if not answers or not entries:
+            continue
+        for ip in list(entries):
+            entry = entries[ip]
+            if now - entry["last_seen"] > entry["ttl"] + grace:
+                del entries[ip]
+                removed += 1
+        if max_per_target and len(entries) > max_per_target:
+            newest = sorted(entries, key=lambda ip: entries[ip]["last_seen"], reverse=True)
+            for ip in newest[max_per_target:]:
+                del entries[ip]
+                removed += 1
+    return removed
+
+def cache_to_ip_map(cache):
+    """Return the {target: [ips]} view of a cache used to build firewall rules."""
+    return {target: list(entries) for target, entries in cache["targets"].items()}
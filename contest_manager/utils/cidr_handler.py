@@ -0,0 +1,72 @@
+"""
+CIDR aggregation utilities for contest-manager
+"""
+
+import ipaddress
+from pathlib import Path
+from collections import defaultdict
+
+DEFAULT_WIDEN_THRESHOLD = 0
+WIDEN_PREFIXES = {4: 24, 6: 48}
+
+def load_prefixes(prefix_path):
+    """Read static CIDR prefixes (one per line, # comments) from a config file."""
+    prefixes = []
+    if not prefix_path or not Path(prefix_path).exists():
+        return prefixes
+    with open(prefix_path) as f:
+        for line in f:
+            line = line.split('#', 1)[0].strip()
+            if not line:
+                continue
+            try:
+                prefixes.append(str(ipaddress.ip_network(line, strict=False)))
+            except ValueError:
+                print(f"⚠️  Ignoring invalid prefix in {prefix_path}: {line}")
+    return prefixes
+
+def format_network(network):
+    """Print host networks as a bare address so single-IP rules look the same as before."""
+    if network.num_addresses == 1:
+        return str(network.network_address)
+    return str(network)
+
+def aggregate_networks(addresses, widen_threshold=DEFAULT_WIDEN_THRESHOLD):
+    """
+    Collapse addresses and prefixes into the smallest equivalent list of CIDR blocks.
+    With widen_threshold > 0, any /24 (IPv4) or /48 (IPv6) holding at least that many
+    cached entries is blocked as a whole.
+    """
+    by_version = defaultdict(list)
+    for address in addresses:
+        network = ipaddress.ip_network(address, strict=False)
+        by_version[network.version].append(network)
+    blocks = []
+    for version in sorted(by_version):
+        networks = by_version[version]
+        if widen_threshold:
+            buckets = defaultdict(set)
+            for network in networks:
+                if network.prefixlen >= WIDEN_PREFIXES[version]:
+                    buckets[network.supernet(new_prefix=WIDEN_PREFIXES[version])].add(network)
+            networks = networks + [bucket for bucket, members in buckets.items() if len(members) >= widen_threshold]
+        blocks.extend(format_network(network) for network in ipaddress.collapse_addresses(networks))
+    return blocks
+
+def compact_ip_map(ip_map, prefixes=(), widen_threshold=DEFAULT_WIDEN_THRESHOLD):
+    """
+    Build the address blocklist for a cache: every cached IP plus the static prefixes, aggregated.
+    Returns (blocks, stats) where stats holds the input and output sizes and the compression ratio.
+    """
+    addresses = set()
+    for ips in ip_map.values():
+        addresses.update(ips)
+    entries = len(addresses) + len(prefixes)
+    blocks = aggregate_networks(list(addresses) + list(prefixes), widen_threshold=widen_threshold)
+    stats = {
+        "addresses": len(addresses),
+        "prefixes": len(prefixes),
+        "blocks": len(blocks),
+        "ratio": entries / len(blocks) if blocks else 1.0,
+    }
+    return blocks, stats
@@ -0,0 +1,585 @@
+"""
+Resident restriction daemon for contest-manager
+
+Instead of a timer starting a fresh `update-restriction` every 30 minutes, the daemon
+keeps the blacklist targets and the IP caches in memory and re-resolves each name when
+its cached answers reach their DNS TTL (clamped to MIN_REFRESH..MAX_REFRESH seconds).
+The restrictions it maintains are the ones recorded in the manifests (see
+manifest_handler), so anything applied with `restrict` is picked up after a reload.
+Changes to blacklist.txt are noticed through inotify (or by polling its mtime where
+inotify is unavailable), and only the added or removed targets are resolved or dropped.
+Every change is applied incrementally. Caches another command rewrote (restrict,
+cache import, update-restriction) are re-read before the daemon changes them, and the
+daemon only writes back the caches it changed.
+
+Names are resolved the same way as by update-restriction (see
+internet_handler.resolve_cache_targets: negative cache, wildcard probe, generated
+subdomains), with the DNS settings each restriction's manifest recorded; restrictions
+recording none use the daemon's own. Restrictions made from a bundle are never resolved:
+their bundle is re-imported whenever the file changes.
+
+DNS passes run in a worker thread while the main loop keeps serving the control socket;
+the answers are merged into the caches and applied on the main loop once the pass ends.
+A Unix control socket accepts one JSON request per connection and answers with one
+JSON line: {"command": "status"}, {"command": "reload"} (re-read manifests and the
+blacklist) and {"command": "refresh"} (re-resolve every name now). A reload can take a
+full resolution and apply, so it is only queued for the main loop and answered at once.
+"""
+
+import os
+import json
+import time
+import heapq
+import select
+import socket
+import struct
+import ctypes
+import threading
+import ctypes.util
+import subprocess
+from pathlib import Path
+
+from contest_manager.utils.dns_handler import DEFAULT_DNS_WORKERS, DEFAULT_DNS_TIMEOUT, DEFAULT_DNS_DEADLINE, FAILED_STATUSES
+from contest_manager.utils.cache_handler import (
+    DEFAULT_CACHE_GRACE, DEFAULT_MAX_IPS_PER_TARGET, DEFAULT_NEGATIVE_TTL, CacheError, find_cache_file, load_cache, save_cache
+)
+from contest_manager.utils.manifest_handler import load_manifests
+from contest_manager.utils.internet_handler import (
+    get_manifest_dir, get_target_groups, get_generated_targets, targets_from_groups, apply_restrictions_from_cache,
+    resolve_cache_targets, refresh_cache, import_cache_bundle
+)
+
+DEFAULT_CONTROL_SOCKET = "/run/contest-manager.sock"
+MIN_REFRESH = 60
+MAX_REFRESH = 30 * 60
+# Names that failed to resolve (timeouts, SERVFAIL, cut off by the deadline) are retried after this many seconds
+FAILED_RETRY = 5 * 60
+# Names falling due within this many seconds of each other are resolved in one batch
+BATCH_WINDOW = 15
+# Without inotify the blacklist's mtime is checked this often
+POLL_INTERVAL = 5
+REQUEST_TIMEOUT = 2.0
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+INOTIFY_EVENT = struct.Struct("iIII")
+
+def inotify_watch(directory):
+    """
+    Watch a directory for files being written, created or moved in (editors usually replace
+    files by renaming). Returns the inotify file descriptor, or None if inotify is unavailable.
+    """
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+    except (OSError, AttributeError):
+        return None
+    if fd < 0:
+        return None
+    if libc.inotify_add_watch(fd, str(directory).encode(), IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE) < 0:
+        os.close(fd)
+        return None
+    return fd
+
+def read_inotify_names(fd):
+    """Drain pending inotify events and return the file names they refer to."""
+    names = set()
+    while True:
+        try:
+            data = os.read(fd, 65536)
+        except BlockingIOError:
+            return names
+        offset = 0
+        while offset + INOTIFY_EVENT.size <= len(data):
+            _, _, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+            offset += INOTIFY_EVENT.size
+            names.add(data[offset:offset + length].rstrip(b"\0").decode(errors='replace'))
+            offset += length
+
+def refresh_due(entries, negative, now, negative_ttl=DEFAULT_NEGATIVE_TTL):
+    """
+    Return when a name should be resolved again: when its first cached address reaches its TTL
+    (within MIN_REFRESH..MAX_REFRESH), when its negative answer expires, or now if it was never resolved.
+    """
+    if entries:
+        return min(entry["last_seen"] + min(max(entry["ttl"], MIN_REFRESH), MAX_REFRESH) for entry in entries.values())
+    if negative:
+        return negative["checked"] + negative_ttl
+    return now
+
+def file_signature(path):
+    """
+    Return what identifies the current contents of a file, or None if there is none.
+    Caches and bundles are replaced atomically, so any write changes the inode and mtime.
+    """
+    try:
+        st = Path(path).stat()
+    except OSError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+def cache_signature(path):
+    """Return the file_signature of a cache, in whichever format it is stored."""
+    return file_signature(find_cache_file(path))
+
+def send_command(command, socket_path=DEFAULT_CONTROL_SOCKET, timeout=REQUEST_TIMEOUT):
+    """Send a request to a running daemon. Returns its JSON response, or None if no daemon is listening."""
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.settimeout(timeout)
+            client.connect(socket_path)
+            client.sendall(json.dumps({"command": command}).encode('utf-8') + b"\n")
+            response = b""
+            while not response.endswith(b"\n"):
+                chunk = client.recv(65536)
+                if not chunk:
+                    break
+                response += chunk
+    except OSError:
+        return None
+    try:
+        return json.loads(response.decode('utf-8'))
+    except ValueError:
+        return None
+
+class RestrictionDaemon:
+    """
+    Keeps the restrictions recorded in the manifests up to date. Call run() to serve until stop().
+    """
+
+    def __init__(self, blacklist_path, prefix_path=None, socket_path=DEFAULT_CONTROL_SOCKET,
+                 max_workers=DEFAULT_DNS_WORKERS, timeout=DEFAULT_DNS_TIMEOUT, grace=DEFAULT_CACHE_GRACE,
+                 max_per_target=DEFAULT_MAX_IPS_PER_TARGET, negative_ttl=DEFAULT_NEGATIVE_TTL,
+                 deadline=DEFAULT_DNS_DEADLINE, resolvers=None, verbose=False):
+        self.blacklist_path = Path(blacklist_path)
+        self.prefix_path = prefix_path
+        self.socket_path = socket_path
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.grace = grace
+        self.max_per_target = max_per_target
+        self.negative_ttl = negative_ttl
+        self.deadline = deadline
+        self.resolvers = resolvers
+        self.verbose = verbose
+        self.running = False
+        self.started_at = int(time.time())
+        self.manifests = []
+        self.caches = {}
+        # Signature (see cache_signature) of each cache file when the daemon last loaded or saved it
+        self.cache_signatures = {}
+        # Caches changed in memory and not saved yet
+        self.dirty = set()
+        self.groups = []
+        self.generated = set()
+        self.targets = set()
+        # Signature (see file_signature) of each (bundle, cache) pair when the bundle was last imported
+        self.bundle_signatures = {}
+        self.schedule = []
+        self.due = {}
+        self.blacklist_mtime = None
+        self.watch = None
+        self.wakeup = os.pipe()
+        for fd in self.wakeup:
+            os.set_blocking(fd, False)
+        self.reload_requested = False
+        # Names of the DNS pass running in the worker thread, and its result once it finished
+        self.resolving = []
+        self.worker = None
+        self.finished = None
+        self.stats = {"resolutions": 0, "names_resolved": 0, "applies": 0, "blacklist_reloads": 0, "last_resolution": None}
+
+    # --- state -----------------------------------------------------------------------------
+
+    def load_manifests(self):
+        """Re-read the manifests and load the cache of every restriction, see sync_caches."""
+        self.manifests = load_manifests(get_manifest_dir())
+        paths = {manifest["cache_path"] for manifest in self.manifests}
+        self.caches = {path: cache for path, cache in self.caches.items() if path in paths}
+        self.cache_signatures = {path: sig for path, sig in self.cache_signatures.items() if path in paths}
+        self.dirty &= paths
+        self.sync_caches()
+
+    def sync_caches(self):
+        """
+        Load the caches not held in memory yet, and re-read those another command (restrict,
+        cache import, update-restriction) rewrote since the daemon last loaded or saved them.
+        A cache that cannot be read is left out until it changes again.
+        """
+        for path in {manifest["cache_path"] for manifest in self.manifests}:
+            signature = cache_signature(path)
+            if path in self.cache_signatures and signature == self.cache_signatures[path]:
+                continue
+            if path in self.caches:
+                print(f"♻️  {path} changed on disk, reloading it")
+            self.cache_signatures[path] = signature
+            self.dirty.discard(path)
+            try:
+                self.caches[path] = load_cache(path)
+            except CacheError as e:
+                # Its restrictions keep their installed rules until the file is fixed
+                self.caches.pop(path, None)
+                print(f"❌ {e}. Not refreshing the restrictions using it.")
+
+    def load_blacklist(self):
+        """
+        Re-read the blacklist. New targets are scheduled immediately; targets that were removed are
+        dropped from the caches. Returns True if any cache changed.
+        """
+        self.blacklist_mtime = self.mtime()
+        self.groups = get_target_groups(self.blacklist_path)
+        self.generated = get_generated_targets(self.blacklist_path)
+        targets = set(targets_from_groups(self.groups))
+        removed = self.targets - targets if self.targets else set()
+        added = targets - self.targets
+        self.targets = targets
+        changed = False
+        for path, cache in self.caches.items():
+            dropped = False
+            for target in removed:
+                dropped = cache["targets"].pop(target, None) is not None or dropped
+                cache["negative"].pop(target, None)
+            if dropped:
+                self.dirty.add(path)
+                changed = True
+        now = time.time()
+        for name in sorted(added):
+            self.plan(name, self.next_refresh(name, now))
+        self.stats["blacklist_reloads"] += 1
+        print(f"📝 Blacklist loaded: {len(targets)} target(s), {len(added)} new, {len(removed)} removed")
+        return changed
+
+    def mtime(self):
+        try:
+            return self.blacklist_path.stat().st_mtime
+        except OSError:
+            return None
+
+    def next_refresh(self, name, now):
+        """Return when `name` is next due, from the earliest answer over all caches."""
+        due = [
+            refresh_due(cache["targets"].get(name), cache["negative"].get(name), now, self.negative_ttl)
+            for cache in self.caches.values()
+        ]
+        return min(due) if due else now
+
+    def plan(self, name, when):
+        """Schedule `name` to be resolved at `when`, replacing any earlier schedule for it."""
+        self.due[name] = when
+        heapq.heappush(self.schedule, (when, name))
+
+    def next_due(self):
+        """Return the time the next scheduled name is due, dropping stale heap entries."""
+        while self.schedule:
+            when, name = self.schedule[0]
+            if name in self.targets and self.due.get(name) == when:
+                return when
+            heapq.heappop(self.schedule)
+        return None
+
+    def pop_due(self, now):
+        """Remove and return every name due before now + BATCH_WINDOW."""
+        names = []
+        while True:
+            when = self.next_due()
+            if when is None or when > now + BATCH_WINDOW:
+                return names
+            _, name = heapq.heappop(self.schedule)
+            del self.due[name]
+            names.append(name)
+
+    # --- work ------------------------------------------------------------------------------
+
+    def dns_settings(self, manifest):
+        """Return the (workers, timeout, deadline, resolvers) a restriction recorded, with the daemon's own as defaults."""
+        options = manifest.get("options", {})
+        resolvers = options["resolvers"] if "resolvers" in options else self.resolvers
+        return (options.get("dns_workers", self.max_workers), options.get("dns_timeout", self.timeout),
+                options.get("dns_deadline", self.deadline), tuple(resolvers or ()))
+
+    def resolution_passes(self):
+        """
+        Group the caches refreshed over DNS by the DNS settings of their restrictions.
+        Caches of restrictions made from a bundle are left out. Returns {settings: [cache paths]}.
+        """
+        bundled = {manifest["cache_path"] for manifest in self.manifests if manifest.get("options", {}).get("bundle")}
+        passes = {}
+        for manifest in self.manifests:
+            path = manifest["cache_path"]
+            if path in bundled or path not in self.caches:
+                continue
+            paths = passes.setdefault(self.dns_settings(manifest), [])
+            if path not in paths:
+                paths.append(path)
+        return passes
+
+    def start_resolution(self, names):
+        """Resolve names in the worker thread; finish_resolution merges the result on the main loop."""
+        self.sync_caches()
+        passes = []
+        for settings, paths in self.resolution_passes().items():
+            # The worker only reads the negative answers; it gets its own copy of them
+            caches = [{"negative": dict(self.caches[path]["negative"])} for path in paths]
+            passes.append((settings, paths, caches))
+        self.resolving = names
+        self.worker = threading.Thread(target=self.resolve_worker, args=(names, passes, self.groups, self.generated),
+                                       name="dns", daemon=True)
+        self.worker.start()
+
+    def resolve_worker(self, names, passes, groups, generated):
+        """Worker thread body: run one DNS pass per group of DNS settings and wake the main loop with the results."""
+        results = []
+        for (workers, timeout, deadline, resolvers), paths, caches in passes:
+            run = {}
+            try:
+                resolved, statuses = resolve_cache_targets(
+                    groups, generated, names=names, caches=caches, negative_ttl=self.negative_ttl, max_workers=workers,
+                    timeout=timeout, deadline=deadline, stats=run, resolvers=list(resolvers) or None, quiet=True
+                )
+            except Exception as e:
+                print(f"❌ DNS resolution failed: {e}")
+                resolved, statuses = {}, {name: 'error' for name in names}
+            results.append((paths, resolved, statuses, run))
+        self.finished = (names, results)
+        try:
+            os.write(self.wakeup[1], b"\0")
+        except OSError:
+            pass
+
+    def finish_resolution(self):
+        """Merge the finished DNS passes into the caches. Returns True if any cache changed."""
+        self.worker.join()
+        names, results = self.finished
+        self.worker = None
+        self.finished = None
+        self.resolving = []
+        return self.resolve(names, results)
+
+    def resolve(self, names, results):
+        """
+        Merge the answers of each DNS pass into the caches it was run for and reschedule the names.
+        `results` holds one (cache paths, resolved, statuses, run stats) per pass. Returns True if any cache changed.
+        """
+        # Targets removed from the blacklist while the passes ran are not added back
+        names = [name for name in names if name in self.targets]
+        changed = False
+        failed = set()
+        self.sync_caches()
+        for paths, resolved, statuses, run in results:
+            answered = {name: answers for name, answers in resolved.items() if answers and name in self.targets}
+            statuses = {name: status for name, status in statuses.items() if name in self.targets}
+            failed.update(name for name, status in statuses.items() if status in FAILED_STATUSES)
+            for path in paths:
+                cache = self.caches.get(path)
+                if cache is None:
+                    continue
+                before = {name: set(cache["targets"].get(name, {})) for name in names}
+                refresh_cache(cache, answered, statuses, grace=self.grace, max_per_target=self.max_per_target)
+                if any(set(cache["targets"].get(name, {})) != ips for name, ips in before.items()):
+                    self.dirty.add(path)
+                    changed = True
+        now = time.time()
+        for name in names:
+            self.plan(name, now + FAILED_RETRY if name in failed else self.next_refresh(name, now))
+        runs = [run for _, _, _, run in results]
+        self.stats["resolutions"] += 1
+        self.stats["names_resolved"] += len(names)
+        self.stats["last_resolution"] = {"at": int(now), "names": len(names), "changed": changed, "passes": runs}
+        for run in runs:
+            if run.get("unreachable"):
+                print(f"⛔ DNS resolver unreachable, {run['skipped']} name(s) keep their cached addresses until the retry")
+            elif self.verbose or changed:
+                print(f"🔍 Resolved {len(names)} name(s) in {run.get('elapsed', 0.0):.1f}s{', addresses changed' if changed else ''}")
+        return changed
+
+    def refresh_bundles(self):
+        """
+        Re-import the bundle of every restriction made from one, on start and whenever the bundle
+        file changes (e.g. on a file share). Returns True if any bundle was imported.
+        """
+        imported = False
+        for manifest in self.manifests:
+            options = manifest.get("options", {})
+            path = options.get("bundle")
+            if not path:
+                continue
+            key = (path, manifest["cache_path"])
+            signature = file_signature(path)
+            if key in self.bundle_signatures and self.bundle_signatures[key] == signature:
+                continue
+            self.bundle_signatures[key] = signature
+            if signature is None:
+                print(f"⚠️  Bundle {path} not found, keeping the cached addresses")
+                continue
+            success, _ = import_cache_bundle(
+                manifest["user"], path, self.blacklist_path, verbose=self.verbose,
+                cache_format=options.get("cache_format", "json"), shared=options.get("shared", False)
+            )
+            imported = success or imported
+        return imported
+
+    def apply(self):
+        """Save the caches the daemon changed and re-apply every restriction incrementally from memory."""
+        for path in self.dirty:
+            save_cache(path, self.caches[path])
+            self.cache_signatures[path] = cache_signature(path)
+        self.dirty.clear()
+        for manifest in self.manifests:
+            cache = self.caches.get(manifest["cache_path"])
+            if cache is None:
+                continue
+            options = manifest.get("options", {})
+            apply_restrictions_from_cache(
+                manifest["user"], verbose=self.verbose, backend=manifest["backend"], incremental=True, prefix_path=self.prefix_path,
+                widen_threshold=options.get("widen_threshold", 0), cache_format=options.get("cache_format", "json"),
+                group=manifest["group"], shared=options.get("shared", False), stub_port=manifest.get("stub_port"),
+                cache=cache
+            )
+        self.stats["applies"] += 1
+        self.load_manifests()
+
+    def reload(self):
+        """Re-read the manifests and the blacklist, and apply the result."""
+        self.load_manifests()
+        if self.load_blacklist():
+            self.apply()
+
+    def blacklist_changed(self):
+        """Reload the blacklist, tell the stub resolver, and apply the result."""
+        self.sync_caches()
+        if self.load_blacklist():
+            self.apply()
+        if any(manifest.get("stub_port") for manifest in self.manifests):
+            subprocess.run(['systemctl', 'kill', '--signal=HUP', 'contest-stub-resolver.service'], check=False,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    # --- control socket --------------------------------------------------------------------
+
+    def status(self):
+        return {
+            "pid": os.getpid(),
+            "started_at": self.started_at,
+            "blacklist": str(self.blacklist_path),
+            "watching": "inotify" if self.watch is not None else "polling",
+            "restrictions": [manifest["owner"] for manifest in self.manifests],
+            "targets": len(self.targets),
+            "next_refresh": self.next_due(),
+            "resolving": len(self.resolving),
+            "reload_pending": self.reload_requested,
+            "stats": self.stats,
+        }
+
+    def handle_command(self, request):
+        """Run one control request and return the response."""
+        command = request.get("command") if isinstance(request, dict) else None
+        if command == "status":
+            return dict(self.status(), ok=True)
+        if command == "reload":
+            self.request_reload()
+            return {"ok": True, "accepted": True}
+        if command == "refresh":
+            now = time.time()
+            for name in self.targets:
+                self.plan(name, now)
+            return {"ok": True, "scheduled": len(self.targets)}
+        return {"ok": False, "error": f"unknown command {command!r}"}
+
+    def serve_client(self, server):
+        connection, _ = server.accept()
+        with connection:
+            connection.settimeout(REQUEST_TIMEOUT)
+            request = b""
+            try:
+                while not request.endswith(b"\n"):
+                    chunk = connection.recv(65536)
+                    if not chunk:
+                        break
+                    request += chunk
+                response = self.handle_command(json.loads(request.decode('utf-8')))
+            except (OSError, ValueError) as e:
+                response = {"ok": False, "error": str(e)}
+            try:
+                connection.sendall(json.dumps(response).encode('utf-8') + b"\n")
+            except OSError:
+                pass
+
+    def open_socket(self):
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(self.socket_path)
+        # Only root may control the daemon
+        os.chmod(self.socket_path, 0o600)
+        server.listen(8)
+        return server
+
+    # --- main loop -------------------------------------------------------------------------
+
+    def stop(self):
+        """Stop the main loop (safe to call from a signal handler)."""
+        self.running = False
+        os.write(self.wakeup[1], b"\0")
+
+    def request_reload(self):
+        """Reload manifests and the blacklist from the main loop (safe to call from a signal handler)."""
+        self.reload_requested = True
+        os.write(self.wakeup[1], b"\0")
+
+    def run(self):
+        """Load the state, then resolve, apply and answer requests until stop() is called."""
+        self.load_manifests()
+        self.load_blacklist()
+        self.watch = inotify_watch(self.blacklist_path.parent)
+        server = self.open_socket()
+        print(f"🛰️  Daemon watching {len(self.manifests)} restriction(s) and {len(self.targets)} target(s) "
+              f"({'inotify' if self.watch is not None else 'polling'}), control socket {self.socket_path}")
+        self.running = True
+        try:
+            while self.running:
+                if self.finished is not None and self.finish_resolution():
+                    self.apply()
+                if self.refresh_bundles():
+                    self.sync_caches()
+                    self.apply()
+                now = time.time()
+                names = self.pop_due(now) if self.worker is None else []
+                if names and self.resolution_passes():
+                    self.start_resolution(names)
+                elif names:
+                    # Nothing is refreshed over DNS: keep the names scheduled without resolving them
+                    for name in names:
+                        self.plan(name, now + MAX_REFRESH)
+                when = self.next_due()
+                if self.worker is not None:
+                    # The worker wakes the loop when the pass is done
+                    wait = MAX_REFRESH
+                else:
+                    wait = MAX_REFRESH if when is None else max(0, when - time.time())
+                if self.watch is None or any(m.get("options", {}).get("bundle") for m in self.manifests):
+                    # Bundles may live on a file share, so they are always polled
+                    wait = min(wait, POLL_INTERVAL)
+                sources = [server, self.wakeup[0]] + ([self.watch] if self.watch is not None else [])
+                readable, _, _ = select.select(sources, [], [], wait)
+                if self.wakeup[0] in readable:
+                    os.read(self.wakeup[0], 512)
+                if self.reload_requested:
+                    self.reload_requested = False
+                    self.reload()
+                if server in readable:
+                    self.serve_client(server)
+                if self.watch is not None and self.watch in readable:
+                    if self.blacklist_path.name in read_inotify_names(self.watch):
+                        self.blacklist_changed()
+                elif self.watch is None and self.mtime() != self.blacklist_mtime:
+                    self.blacklist_changed()
+        finally:
+            server.close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+            if self.watch is not None:
+                os.close(self.watch)
+            for fd in self.wakeup:
+                os.close(fd)
@@ -0,0 +1,327 @@
+"""
+DNS resolution utilities for contest-manager
+"""
+
+import time
+import secrets
+import threading
+import ipaddress
+import dns.exception
+import dns.resolver
+from pathlib import Path
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+DEFAULT_DNS_WORKERS = 64
+DEFAULT_DNS_TIMEOUT = 3.0
+# Upper bound in seconds for a whole resolution pass (0 = no limit)
+DEFAULT_DNS_DEADLINE = 120.0
+# Consecutive timed-out queries, with no answer in between, after which the resolver is considered unreachable
+DEFAULT_BREAKER_THRESHOLD = 16
+RECORD_TYPES = ('A', 'AAAA')
+# Statuses meaning the name was not answered; its cached addresses are kept and it is retried later
+FAILED_STATUSES = ('timeout', 'error', 'skipped')
+
+# Resolver list entry meaning the resolvers configured in /etc/resolv.conf
+SYSTEM_RESOLVER = "system"
+
+def parse_resolver(spec):
+    """
+    Parse a resolver list entry: 'system', an IP address, 'IPv4:port' or '[IPv6]:port'.
+    Returns (address, port), with address None for the system resolver; raises ValueError if invalid.
+    """
+    spec = spec.strip()
+    if spec == SYSTEM_RESOLVER:
+        return None, 53
+    address, port = spec, 53
+    if spec.startswith('['):
+        address, _, rest = spec[1:].partition(']')
+        if rest:
+            if not rest.startswith(':'):
+                raise ValueError(f"invalid resolver {spec!r}")
+            port = int(rest[1:])
+    elif spec.count(':') == 1:
+        address, port = spec.split(':')
+        port = int(port)
+    ipaddress.ip_address(address)
+    if not 0 < port < 65536:
+        raise ValueError(f"invalid port in resolver {spec!r}")
+    return address, port
+
+def resolver_spec(spec):
+    """Validate a resolver list entry given on the command line (argparse type)."""
+    parse_resolver(spec)
+    return spec.strip()
+
+def load_resolvers(resolver_path):
+    """
+    Read the resolver list (one entry per line, # comments, see parse_resolver) from a config file.
+    Returns an empty list if the file is missing or lists nothing, meaning the system resolver.
+    """
+    resolvers = []
+    if not resolver_path or not Path(resolver_path).exists():
+        return resolvers
+    with open(resolver_path) as f:
+        for line in f:
+            line = line.split('#', 1)[0].strip()
+            if not line:
+                continue
+            try:
+                parse_resolver(line)
+            except ValueError:
+                print(f"⚠️  Ignoring invalid resolver in {resolver_path}: {line}")
+                continue
+            if line not in resolvers:
+                resolvers.append(line)
+    return resolvers
+
+def make_resolver(timeout=DEFAULT_DNS_TIMEOUT, spec=SYSTEM_RESOLVER):
+    """Return a resolver for a resolver list entry whose queries give up after `timeout` seconds."""
+    address, port = parse_resolver(spec)
+    if address is None:
+        resolver = dns.resolver.Resolver()
+    else:
+        resolver = dns.resolver.Resolver(configure=False)
+        resolver.nameservers = [address]
+        resolver.port = port
+    resolver.timeout = timeout
+    resolver.lifetime = timeout
+    return resolver
+
+def is_network_failure(error):
+    """Return True if every nameserver behind a NoNameservers error failed at the network level."""
+    errors = error.kwargs.get('errors') or []
+    return bool(errors) and all(
+        len(item) > 3 and isinstance(item[3], (OSError, dns.exception.Timeout)) for item in errors
+    )
+
+def query_ips(resolver, domain, rdtype, lifetime=None):
+    """
+    Run a single A or AAAA query, following any CNAME chain. `lifetime` overrides the resolver's limit.
+    Returns ({ip: ttl}, status, canonical) where status is 'ok', 'nxdomain', 'nodata', 'timeout'
+    (no nameserver could be reached in time) or 'error', and canonical is the name at the end
+    of the CNAME chain (the queried name if unknown).
+    """
+    try:
+        answers = resolver.resolve(domain, rdtype, lifetime=lifetime)
+    except dns.resolver.NXDOMAIN:
+        return {}, 'nxdomain', domain
+    except dns.resolver.NoAnswer:
+        return {}, 'nodata', domain
+    except dns.exception.Timeout:
+        return {}, 'timeout', domain
+    except dns.resolver.NoNameservers as e:
+        return {}, 'timeout' if is_network_failure(e) else 'error', domain
+    except Exception:
+        return {}, 'error', domain
+    canonical = answers.canonical_name.to_text(omit_final_dot=True)
+    return {str(rdata): answers.rrset.ttl for rdata in answers}, 'ok', canonical
+
+def combine_statuses(statuses):
+    """Reduce the per-record-type statuses of a name to one status."""
+    if 'ok' in statuses:
+        return 'ok'
+    if 'nxdomain' in statuses:
+        return 'nxdomain'
+    if all(status == 'nodata' for status in statuses):
+        return 'nodata'
+    for status in ('timeout', 'skipped'):
+        if status in statuses:
+            return status
+    return 'error'
+
+def summarize_statuses(statuses):
+    """Count the names of a resolution pass per status."""
+    counts = Counter(statuses.values())
+    return {status: counts.get(status, 0) for status in ('ok', 'nxdomain', 'nodata', 'timeout', 'error', 'skipped')}
+
+def resolve_ips(domain, resolver=None):
+    """Resolve all IPv4 and IPv6 addresses for a domain and its subdomains."""
+    resolver = resolver or make_resolver()
+    ips = set()
+    for rdtype in RECORD_TYPES:
+        ips.update(query_ips(resolver, domain, rdtype)[0])
+    return ips
+
+def resolve_names(names, max_workers=DEFAULT_DNS_WORKERS, timeout=DEFAULT_DNS_TIMEOUT, progress=None,
+                  deadline=DEFAULT_DNS_DEADLINE, breaker_threshold=DEFAULT_BREAKER_THRESHOLD, stats=None, resolvers=None,
+                  wildcards=None):
+    """
+    Resolve A and AAAA records for every name concurrently.
+    At most `max_workers` queries are in flight at once and each query is bounded by `timeout`.
+
+    Every name is queried through each of `resolvers` (entries as in parse_resolver, the
+    system resolver if none are given) and their answers are merged, so CDN names that
+    answer differently per resolver contribute the addresses seen by all of them.
+
+    The whole pass is bounded by `deadline` seconds (0 for no limit): queries are cut short
+    when it runs out and names not queried by then get the status 'skipped'. After
+    `breaker_threshold` consecutive timeouts from one resolver with no answer in between
+    (0 to disable) that resolver is considered unreachable and is not queried any more.
+
+    The A query follows CNAME chains and names that end at the same canonical name share a
+    single AAAA query for it. Every name gets its AAAA query, even when its A query timed
+    out or failed, except names the A query found not to exist: NXDOMAIN holds for every
+    record type, so the results are the same as querying A and AAAA for each name.
+
+    `wildcards` maps names that a wildcard record may answer to that wildcard's probe, as
+    returned by probe_wildcards. Such a name takes the probe's entry, and skips its AAAA
+    query, only if its A query ends at the probe's canonical name or returns only addresses
+    the probe returned; a name with records of its own is resolved like any other.
+
+    Returns (results, statuses, canonical): results maps each distinct name to {ip: ttl},
+    statuses maps it to 'ok', 'nxdomain', 'nodata' (the name exists without addresses),
+    'timeout', 'error' or 'skipped' (the best status over all resolvers), and canonical maps
+    every name that is a CNAME alias to its canonical name. `progress(done, total)` is called
+    whenever a name has been fully resolved.
+    If `stats` (a dict) is given it is filled with the per-status counts (see summarize_statuses),
+    'elapsed' seconds, whether every resolver was found 'unreachable' or the 'deadline_hit', the
+    number of names that took a 'wildcard' answer, and
+    'resolvers': per resolver, its 'queries', 'answers', 'timeouts', 'errors', mean 'latency_ms',
+    the addresses it returned ('ips'), those no other resolver returned ('unique_ips') and whether
+    it was found 'unreachable'.
+    """
+    unique_names = list(dict.fromkeys(names))
+    resolvers = list(dict.fromkeys(resolvers or [SYSTEM_RESOLVER]))
+    results = {name: {} for name in unique_names}
+    statuses = {}
+    canonical = {}
+    started = time.monotonic()
+    ends = started + deadline if deadline else None
+    clients = {spec: make_resolver(timeout, spec) for spec in resolvers}
+    unreachable = {spec: threading.Event() for spec in resolvers}
+    consecutive_timeouts = dict.fromkeys(resolvers, 0)
+    usage = {spec: {"queries": 0, "answers": 0, "timeouts": 0, "errors": 0, "seconds": 0.0} for spec in resolvers}
+    seen = {spec: set() for spec in resolvers}
+    name_statuses = {name: [] for name in unique_names}
+    wildcards = wildcards or {}
+    wildcard_names = set()
+    done = 0
+
+    def query(spec, name, rdtype):
+        # Runs in the pool: skip at once if the pass is already over or the resolver is down
+        remaining = ends - time.monotonic() if ends else timeout
+        if unreachable[spec].is_set() or remaining <= 0:
+            return {}, 'skipped', name, 0.0
+        began = time.monotonic()
+        answers, status, target = query_ips(clients[spec], name, rdtype, lifetime=min(timeout, remaining))
+        return answers, status, target, time.monotonic() - began
+
+    def observe(spec, answers, status, elapsed):
+        if status == 'skipped':
+            return
+        counters = usage[spec]
+        counters["queries"] += 1
+        counters["seconds"] += elapsed
+        counters["answers"] += status == 'ok'
+        counters["timeouts"] += status == 'timeout'
+        counters["errors"] += status == 'error'
+        seen[spec].update(answers)
+        consecutive_timeouts[spec] = consecutive_timeouts[spec] + 1 if status == 'timeout' else 0
+        if breaker_threshold and consecutive_timeouts[spec] >= breaker_threshold:
+            unreachable[spec].set()
+
+    def wildcard_answer(name, answers, target):
+        # The probe's entry if the A query shows the wildcard answered the name, else None
+        if name not in wildcards or not answers:
+            return None
+        probe_canonical, probe_answers = wildcards[name]
+        if target == probe_canonical or set(answers) <= set(probe_answers):
+            return probe_answers
+        return None
+
+    def merge(name, answers):
+        found = results[name]
+        for ip, ttl in answers.items():
+            found[ip] = max(ttl, found.get(ip, 0))
+
+    def finish(name, status):
+        nonlocal done
+        name_statuses[name].append(status)
+        if len(name_statuses[name]) < len(resolvers):
+            return
+        statuses[name] = combine_statuses(name_statuses[name])
+        done += 1
+        if progress:
+            progress(done, len(unique_names))
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        a_futures = {
+            pool.submit(query, spec, name, 'A'): (spec, name) for name in unique_names for spec in resolvers
+        }
+        a_statuses = {}
+        aaaa_futures = {}
+        waiting = {}
+        for future in as_completed(a_futures):
+            spec, name = a_futures[future]
+            answers, status, target, elapsed = future.result()
+            observe(spec, answers, status, elapsed)
+            merge(name, answers)
+            if status == 'nxdomain':
+                finish(name, status)
+                continue
+            if target != name:
+                canonical.setdefault(name, target)
+            shared = wildcard_answer(name, answers, target)
+            if shared is not None:
+                merge(name, shared)
+                wildcard_names.add(name)
+                finish(name, status)
+                continue
+            a_statuses[spec, name] = status
+            if (spec, target) not in waiting:
+                waiting[spec, target] = []
+                aaaa_futures[pool.submit(query, spec, target, 'AAAA')] = (spec, target)
+            waiting[spec, target].append(name)
+        for future in as_completed(aaaa_futures):
+            spec, target = aaaa_futures[future]
+            answers, status, _, elapsed = future.result()
+            observe(spec, answers, status, elapsed)
+            for name in waiting[spec, target]:
+                merge(name, answers)
+                finish(name, combine_statuses([a_statuses[spec, name], status]))
+    if stats is not None:
+        stats.update(summarize_statuses(statuses))
+        down = all(event.is_set() for event in unreachable.values())
+        stats.update({
+            "elapsed": round(time.monotonic() - started, 3),
+            "unreachable": down,
+            "deadline_hit": bool(ends) and 'skipped' in statuses.values() and not down,
+            "wildcard": len(wildcard_names),
+            "resolvers": resolver_stats(usage, seen, unreachable),
+        })
+    return results, statuses, canonical
+
+def resolver_stats(usage, seen, unreachable):
+    """Summarize the per-resolver counters of a resolution pass, including the addresses only it returned."""
+    report = {}
+    for spec, counters in usage.items():
+        others = set().union(*(ips for other, ips in seen.items() if other != spec))
+        report[spec] = {
+            "queries": counters["queries"],
+            "answers": counters["answers"],
+            "timeouts": counters["timeouts"],
+            "errors": counters["errors"],
+            "latency_ms": round(1000 * counters["seconds"] / counters["queries"], 1) if counters["queries"] else None,
+            "ips": len(seen[spec]),
+            "unique_ips": len(seen[spec] - others),
+            "unreachable": unreachable[spec].is_set(),
+        }
+    return report
+
+def probe_wildcards(domains, max_workers=DEFAULT_DNS_WORKERS, timeout=DEFAULT_DNS_TIMEOUT,
+                    deadline=DEFAULT_DNS_DEADLINE, stats=None, resolvers=None):
+    """
+    Detect wildcard DNS by resolving one random label under each domain.
+    Returns {domain: (canonical, {ip: ttl})} for the domains whose random label resolved, where
+    canonical is the name the label's CNAME chain ended at (the label itself if there was none).
+    `deadline`, `stats` and `resolvers` are passed on to resolve_names.
+    """
+    label = f"contest-probe-{secrets.token_hex(6)}"
+    probes = {f"{label}.{domain}": domain for domain in dict.fromkeys(domains)}
+    results, statuses, canonical = resolve_names(list(probes), max_workers=max_workers, timeout=timeout, deadline=deadline,
+                                                 stats=stats, resolvers=resolvers)
+    return {
+        probes[name]: (canonical.get(name, name), results[name])
+        for name, status in statuses.items() if status == 'ok' and results[name]
+    }
@@ -0,0 +1,109 @@
+"""
+Reverse-label suffix trie for blacklist lookups
+
+Rules are stored in a trie keyed by domain labels from right to left, so finding
+the rule for a name costs one dict lookup per label regardless of the number of
+rules. Rule syntax (one per blacklist entry):
+
+    example.com      block the name and every subdomain
+    *.example.com    block the subdomains only
+    !cdn.example.com allow the name and its subdomains, overriding a block on a parent
+
+The most specific matching rule wins. A compiled trie is plain nested dicts and can
+be saved as JSON and loaded without re-reading the blacklist.
+"""
+
+import json
+import hashlib
+from pathlib import Path
+
+from contest_manager.utils.binary_cache_handler import write_atomic
+
+RULE_KEY = "$"
+BLOCK = "block"
+BLOCK_SUBDOMAINS = "subdomains"
+ALLOW = "allow"
+MATCHER_VERSION = 1
+
+def parse_rule(entry):
+    """Split a rule entry into (name, rule)."""
+    entry = entry.strip().lower().rstrip('.')
+    if entry.startswith('!'):
+        return entry[1:], ALLOW
+    if entry.startswith('*.'):
+        return entry[2:], BLOCK_SUBDOMAINS
+    return entry, BLOCK
+
+def add_rule(trie, name, rule):
+    """Insert a rule for `name`. An allow rule for the same name takes precedence over a block."""
+    node = trie
+    for label in reversed(name.split('.')):
+        node = node.setdefault(label, {})
+    if node.get(RULE_KEY) != ALLOW:
+        node[RULE_KEY] = rule
+    return trie
+
+def build_matcher(entries):
+    """Compile an iterable of rule entries into a trie."""
+    trie = {}
+    for entry in entries:
+        name, rule = parse_rule(entry)
+        if name:
+            add_rule(trie, name, rule)
+    return trie
+
+def match(trie, name):
+    """Return the most specific rule (BLOCK, BLOCK_SUBDOMAINS or ALLOW) that applies to `name`, or None."""
+    labels = name.lower().rstrip('.').split('.')
+    node = trie
+    found = None
+    last = len(labels) - 1
+    for depth, label in enumerate(reversed(labels)):
+        node = node.get(label)
+        if node is None:
+            break
+        rule = node.get(RULE_KEY)
+        if rule is None or (rule == BLOCK_SUBDOMAINS and depth == last):
+            continue
+        found = rule
+    return found
+
+def is_blocked(trie, name):
+    """Return True if `name` is blocked by the trie."""
+    rule = match(trie, name)
+    return rule is not None and rule != ALLOW
+
+def count_rules(trie):
+    """Return the number of rules stored in a trie."""
+    total = 0
+    stack = [trie]
+    while stack:
+        node = stack.pop()
+        for label, child in node.items():
+            if label == RULE_KEY:
+                total += 1
+            else:
+                stack.append(child)
+    return total
+
+def source_digest(entries):
+    """Return a digest identifying the rule entries a trie was compiled from."""
+    return hashlib.sha256("\n".join(entries).encode('utf-8')).hexdigest()
+
+def save_matcher(path, trie, digest):
+    """Atomically write a compiled trie and the digest of its source entries as JSON."""
+    data = {"version": MATCHER_VERSION, "source": digest, "trie": trie}
+    write_atomic(path, json.dumps(data, separators=(',', ':')).encode('utf-8'))
+
+def load_matcher(path, digest=None):
+    """Load a compiled trie. Returns None if it is missing, unreadable or (with `digest`) out of date."""
+    if not Path(path).exists():
+        return None
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except Exception:
+        return None
+    if data.get("version") != MATCHER_VERSION or (digest is not None and data.get("source") != digest):
+        return None
+    return data["trie"]
@@ -2,230 +2,764 @@
 Internet restriction utilities for contest-manager
 """
 
+import os
+import grp
 import pwd
-import json
+import time
 import shlex
 import subprocess
-import dns.resolver
 from pathlib import Path
+from contest_manager.utils.dns_handler import (
+    DEFAULT_DNS_WORKERS, DEFAULT_DNS_TIMEOUT, DEFAULT_DNS_DEADLINE, FAILED_STATUSES,
+    resolve_ips, resolve_names, probe_wildcards, summarize_statuses
+)
+from contest_manager.utils.iptables_handler import (
+    FAMILIES, group_owner, user_chain, build_ruleset, restore_ruleset, restore_ruleset_delta,
+    compute_ruleset_delta, delta_totals, ensure_chain_individually, remove_user_rules, restore_redirect, list_rules,
+    build_jump_rule, read_saved_tables
+)
+from contest_manager.utils.ipset_handler import user_set_names, swap_ip_sets, destroy_ip_sets
+from contest_manager.utils.nftables_handler import (
+    apply_ruleset as nft_apply_ruleset, remove_ruleset as nft_remove_ruleset, restricted_uids as nft_restricted_uids
+)
+from contest_manager.utils.manifest_handler import (
+    build_manifest, save_manifest, load_manifest, remove_manifest, load_manifests, read_installed_state, verify_manifest
+)
+from contest_manager.utils.bundle_handler import BundleError, build_bundle, save_bundle, load_bundle
+from contest_manager.utils.domain_matcher import (
+    ALLOW, parse_rule, build_matcher, is_blocked, source_digest, save_matcher, load_matcher
+)
+from contest_manager.utils.cidr_handler import DEFAULT_WIDEN_THRESHOLD, load_prefixes, compact_ip_map
+from contest_manager.utils.cache_handler import (
+    DEFAULT_CACHE_GRACE, DEFAULT_MAX_IPS_PER_TARGET, DEFAULT_NEGATIVE_TTL, CACHE_FORMATS, DEFAULT_CACHE_FORMAT,
+    CacheError, new_cache, find_cache_file, load_cache, save_cache, merge_resolved, record_statuses, known_missing, expire_cache, cache_to_ip_map
+)
 
-def get_user_cache_path(user):
-    """Return the cache path for a user."""
+DEFAULT_BACKEND = "iptables-restore"
+# Blacklist entries starting with these prefixes are never blocked
+ALLOW_PATTERNS = ['static.', 'cdn.', 'fonts.']
+DEFAULT_SUBDOMAINS = ["www", "mail", "drive", "chat", "api", "blog", "m", "app", "cdn", "static", "dev", "test"]
+# A shared cache written less than this many seconds ago is reused instead of resolving again,
+# so restricting or updating several users in a row resolves the blacklist only once.
+SHARED_CACHE_MAX_AGE = 10 * 60
+# Manifest options describing where a restriction's cache comes from (see resolution_options)
+RESOLUTION_OPTIONS = ("bundle", "dns_workers", "dns_timeout", "dns_deadline", "resolvers")
+
+def get_cache_dir():
+    """Return the directory holding the IP caches."""
     cache_dir = Path(__file__).parent.parent.parent / 'cache'
     cache_dir.mkdir(parents=True, exist_ok=True)
-    return cache_dir / f"ip_cache_{user}.json"
+    return cache_dir
 
-def get_targets_from_blacklist(blacklist_path):
-    """Read blacklist, filter domains, and generate targets."""
+def get_user_cache_path(user, cache_format=DEFAULT_CACHE_FORMAT):
+    """Return the cache path for a user in the given cache format ("json" or "binary")."""
+    return get_cache_dir() / f"ip_cache_{user}{CACHE_FORMATS[cache_format]}"
+
+def get_shared_cache_path(cache_format=DEFAULT_CACHE_FORMAT):
+    """Return the path of the machine-wide cache shared by all users and groups."""
+    return get_cache_dir() / f"ip_cache{CACHE_FORMATS[cache_format]}"
+
+def get_cache_path(user, cache_format=DEFAULT_CACHE_FORMAT, shared=False):
+    """Return the shared cache path if `shared` is set, otherwise the user's own cache path."""
+    return get_shared_cache_path(cache_format) if shared else get_user_cache_path(user, cache_format)
+
+def get_manifest_dir():
+    """Return the directory holding the restriction manifests."""
+    return get_cache_dir() / 'manifests'
+
+def get_manifest_path(owner):
+    """Return the path of the restriction manifest for a UID or group owner."""
+    return get_manifest_dir() / f"{owner}.json"
+
+def shared_cache_is_fresh(cache_path, max_age=SHARED_CACHE_MAX_AGE):
+    """Return True if the shared cache (in either format) was written less than `max_age` seconds ago."""
+    cache_path = find_cache_file(cache_path)
+    return cache_path.exists() and time.time() - cache_path.stat().st_mtime < max_age
+
+def get_group_members(group):
+    """Return the members of a group, including users whose primary group it is, or None if it does not exist."""
+    try:
+        entry = grp.getgrnam(group)
+    except KeyError:
+        return None
+    members = list(entry.gr_mem)
+    members.extend(user.pw_name for user in pwd.getpwall() if user.pw_gid == entry.gr_gid and user.pw_name not in members)
+    return members
+
+def owner_uids(uid, group=None):
+    """Return the UIDs whose traffic an owner's ruleset covers: the group's members, or the UID itself."""
+    if not group:
+        return [uid]
+    uids = []
+    for member in get_group_members(group) or []:
+        try:
+            uids.append(pwd.getpwnam(member).pw_uid)
+        except KeyError:
+            pass
+    return uids
+
+def get_owner(user, group=None):
+    """
+    Return the firewall owner to restrict: the group owner of `group` if given, otherwise the user's UID.
+    Returns None if the user or group does not exist.
+    """
+    if group:
+        try:
+            return group_owner(grp.getgrnam(group).gr_gid)
+        except KeyError:
+            print(f"❌ Group {group} not found.")
+            return None
+    try:
+        return pwd.getpwnam(user).pw_uid
+    except Exception:
+        print(f"❌ User {user} not found.")
+        return None
+
+def parse_blacklist_entry(line):
+    """
+    Split a blacklist line into (domain, subdomains).
+    `domain(sub1,sub2)` lists the subdomains to expand for that domain, `domain()` expands none,
+    and a bare `domain` gets the default subdomain list (subdomains is None).
+    """
+    if '(' in line and line.endswith(')'):
+        domain, subs = line[:-1].split('(', 1)
+        return domain.strip(), [sub.strip() for sub in subs.split(',') if sub.strip()]
+    return line, None
+
+def read_blacklist(blacklist_path):
+    """
+    Read the blacklist into a list of (rule, subdomains) entries, see parse_blacklist_entry.
+    Block entries whose domain starts with an allowed prefix (static., cdn., fonts.) are skipped.
+    Returns None if the file does not exist.
+    """
     if not Path(blacklist_path).exists():
         print(f"❌ Blacklist file {blacklist_path} not found.")
-        return []
-    domains = []
+        return None
+    entries = []
     with open(blacklist_path) as f:
         for line in f:
             line = line.strip()
             if line and not line.startswith('#'):
-                domains.append(line)
-    if not domains:
+                entries.append(parse_blacklist_entry(line))
+    return [
+        (rule, subs) for rule, subs in entries
+        if parse_rule(rule)[1] == ALLOW or not any(parse_rule(rule)[0].startswith(p) for p in ALLOW_PATTERNS)
+    ]
+
+def get_blacklist_matcher(blacklist_path, entries=None):
+    """
+    Return the compiled domain matcher (see domain_matcher) for the blacklist rules.
+    The compiled trie is stored next to the IP caches and reused while the blacklist is unchanged.
+    """
+    if entries is None:
+        entries = read_blacklist(blacklist_path) or []
+    rules = [rule for rule, _ in entries]
+    digest = source_digest(rules)
+    compiled_path = get_cache_dir() / 'blacklist_matcher.json'
+    trie = load_matcher(compiled_path, digest)
+    if trie is None:
+        trie = build_matcher(rules)
+        save_matcher(compiled_path, trie, digest)
+    return trie
+
+def get_target_groups(blacklist_path):
+    """
+    Read blacklist, filter domains, and generate targets grouped by blacklist domain.
+    Returns [(domain, [targets])] where targets are the domain itself (unless only its
+    subdomains are blocked) and its subdomains, minus any name an allow rule exempts.
+    """
+    entries = read_blacklist(blacklist_path)
+    if entries is None:
+        return []
+    blocked = [(rule, subs) for rule, subs in entries if parse_rule(rule)[1] != ALLOW]
+    if not blocked:
         print("⚠️  No domains found in blacklist. Skipping IP cache.")
         return []
-    allow_patterns = ['static.', 'cdn.', 'fonts.']
+    matcher = get_blacklist_matcher(blacklist_path, entries)
+    groups = []
+    for rule, subs in blocked:
+        domain = parse_rule(rule)[0]
+        names = [domain] + get_subdomains(domain, subs)
+        groups.append((domain, [name for name in names if is_blocked(matcher, name)]))
+    return groups
+
+def get_generated_targets(blacklist_path):
+    """
+    Return the targets that only come from expanding the default subdomain list, i.e. that are
+    neither a blacklist domain themselves nor listed in parentheses after one.
+    """
+    listed = set()
+    generated = set()
+    for rule, subs in read_blacklist(blacklist_path) or []:
+        domain = parse_rule(rule)[0]
+        listed.add(domain)
+        if subs is None:
+            generated.update(get_subdomains(domain))
+        else:
+            listed.update(get_subdomains(domain, subs))
+    return generated - listed
+
+def targets_from_groups(groups):
+    """Flatten target groups into the list of targets."""
     targets = []
-    for domain in domains:
-        if any(domain.startswith(p) for p in allow_patterns):
-            continue
-        targets.append(domain)
-        targets.extend(get_subdomains(domain))
+    for _, names in groups:
+        targets.extend(names)
     return targets
 
-def resolve_targets_to_ip_map(targets, existing_ip_map=None):
-    """Resolve IPs for each target, optionally merging with an existing map."""
+def get_targets_from_blacklist(blacklist_path):
+    """Read blacklist, filter domains, and generate targets."""
+    return targets_from_groups(get_target_groups(blacklist_path))
+
+def resolve_targets(targets, max_workers=DEFAULT_DNS_WORKERS, timeout=DEFAULT_DNS_TIMEOUT, skip=(), groups=None,
+                    deadline=DEFAULT_DNS_DEADLINE, stats=None, resolvers=None, generated=(), quiet=False):
+    """
+    Resolve every target concurrently, except names in `skip`.
+    With `groups` (see get_target_groups) each domain is probed once for wildcard DNS. The
+    `generated` targets (see get_generated_targets) of wildcard domains are still queried for
+    their A records, following CNAMEs, but take the wildcard answer instead of an AAAA query
+    when their A answer shows the wildcard answered them (see resolve_names). Names the
+    blacklist lists are always resolved in full, since they may have records of their own.
+    Returns (resolved, statuses): {target: {ip: ttl}} and {target: status} for the resolved names.
+    `max_workers` bounds the number of in-flight queries, `timeout` bounds each query and
+    `deadline` the whole run, wildcard probe included. If the probe finds the resolver
+    unreachable no other name is queried. `resolvers` lists the resolvers every name is
+    queried through (see resolve_names). `stats` (a dict) receives the run's statistics.
+    With quiet=True only problems are printed (for the daemon's log).
+    """
+    stats = {} if stats is None else stats
+    started = time.monotonic()
+    names = [target for target in targets if target not in skip]
+    if len(names) < len(targets) and not quiet:
+        print(f"  ⏭️  Skipping {len(targets) - len(names)} name(s) known not to exist")
+    covered = {}
+    if groups:
+        probe_stats = {}
+        wildcards = probe_wildcards([domain for domain, _ in groups if domain not in skip], max_workers=max_workers,
+                                    timeout=timeout, deadline=deadline, stats=probe_stats, resolvers=resolvers)
+        if probe_stats["unreachable"]:
+            print(f"  ⛔ DNS resolver unreachable ({probe_stats['timeout']} probe(s) timed out), skipping {len(names)} name(s)")
+            stats.update(summarize_statuses({name: 'skipped' for name in names}))
+            stats.update({"elapsed": round(time.monotonic() - started, 3), "unreachable": True, "deadline_hit": False,
+                          "resolvers": probe_stats["resolvers"]})
+            return {name: {} for name in names}, {name: 'skipped' for name in names}
+        for domain, members in groups:
+            if domain in wildcards:
+                covered.update((name, wildcards[domain]) for name in members if name in generated and name not in skip)
+        if wildcards and not quiet:
+            print(f"  🃏 {len(wildcards)} wildcard domain(s) found")
+    total = len(names)
+
+    def report(done, unique_total):
+        print(f"  🔍 Analyzed {done}/{unique_total} targets...", end='\r')
+
+    remaining = max(deadline - (time.monotonic() - started), 0.001) if deadline else 0
+    resolved, statuses, canonical = resolve_names(
+        names, max_workers=max_workers, timeout=timeout, progress=None if quiet else report, deadline=remaining,
+        stats=stats, resolvers=resolvers, wildcards=covered
+    )
+    stats["elapsed"] = round(time.monotonic() - started, 3)
+    if quiet:
+        return resolved, statuses
+    print(f"  ✅ Analyzed all {total} targets in {stats['elapsed']:.1f}s{' ' * 30}")
+    print(f"  📊 ok: {stats['ok']}, nxdomain: {stats['nxdomain']}, nodata: {stats['nodata']}, "
+          f"timeouts: {stats['timeout']}, errors: {stats['error']}, skipped: {stats['skipped']}")
+    if len(stats["resolvers"]) > 1:
+        print_resolver_stats(stats["resolvers"])
+    if stats["unreachable"]:
+        print(f"  ⛔ DNS resolver stopped answering, {stats['skipped']} name(s) skipped")
+    elif stats["deadline_hit"]:
+        print(f"  ⏱️  Resolution deadline of {deadline:g}s reached, {stats['skipped']} name(s) skipped")
+    if covered:
+        print(f"  🃏 {stats['wildcard']}/{len(covered)} generated subdomain(s) of wildcard domains answered by the wildcard")
+    if canonical:
+        print(f"  🔗 {len(canonical)} CNAME alias(es) collapsed onto {len(set(canonical.values()))} canonical name(s)")
+    return resolved, statuses
+
+def print_resolver_stats(resolvers):
+    """Print how much each resolver of a multi-resolver run cost and how many addresses only it found."""
+    for spec, usage in resolvers.items():
+        latency = f"{usage['latency_ms']:.0f} ms" if usage["latency_ms"] is not None else "n/a"
+        line = (f"  🛰️  {spec}: {usage['queries']} queries, {latency} avg, {usage['timeouts']} timeout(s), "
+                f"{usage['ips']} address(es), {usage['unique_ips']} found by no other resolver")
+        if usage["unreachable"]:
+            line += " (unreachable)"
+        elif usage["queries"] and not usage["unique_ips"]:
+            line += " (adds no coverage)"
+        print(line)
+
+def resolve_targets_to_ip_map(targets, existing_ip_map=None, max_workers=DEFAULT_DNS_WORKERS, timeout=DEFAULT_DNS_TIMEOUT):
+    """Resolve IPs for each target concurrently, optionally merging with an existing map."""
     ip_map = existing_ip_map if existing_ip_map else {}
-    total = len(targets)
-    for idx, target in enumerate(targets, 1):
-        print(f"  🔍 Analyzing {idx}/{total}: {target}...", end='\r')
-        new_ips = set(resolve_ips(target))
+    resolved, _ = resolve_targets(targets, max_workers=max_workers, timeout=timeout)
+    for target in targets:
         old_ips = set(ip_map.get(target, []))
-        ip_map[target] = list(old_ips.union(new_ips))
-    print(f"  ✅ Analyzed all {total} targets{' ' * 30}")
+        ip_map[target] = list(old_ips.union(resolved[target]))
     return ip_map
 
-def get_subdomains(domain):
-    """Generate common subdomain names for a domain."""
-    common_subs = ["www", "mail", "drive", "chat", "api", "blog", "m", "app", "cdn", "static", "dev", "test"]
-    return [f"{sub}.{domain}" for sub in common_subs]
+def resolution_options(max_workers=DEFAULT_DNS_WORKERS, timeout=DEFAULT_DNS_TIMEOUT, deadline=DEFAULT_DNS_DEADLINE,
+                       resolvers=None, bundle_path=None):
+    """
+    Return the manifest options (RESOLUTION_OPTIONS) recording how a restriction's cache is
+    refreshed: from `bundle_path`, or over DNS with these settings (see daemon_handler).
+    """
+    return {
+        "bundle": str(Path(bundle_path).resolve()) if bundle_path else None,
+        "dns_workers": max_workers,
+        "dns_timeout": timeout,
+        "dns_deadline": deadline,
+        "resolvers": list(resolvers or []),
+    }
 
-def resolve_ips(domain):
-    """Resolve all IPv4 and IPv6 addresses for a domain and its subdomains."""
-    ips = set()
-    try:
-        answers = dns.resolver.resolve(domain, 'A')
-        for rdata in answers:
-            ips.add(str(rdata))
-    except Exception:
-        pass
-    try:
-        answers = dns.resolver.resolve(domain, 'AAAA')
-        for rdata in answers:
-            ips.add(str(rdata))
-    except Exception:
-        pass
-    return ips
+def get_subdomains(domain, subs=None):
+    """Generate subdomain names for a domain, using the common list unless `subs` is given."""
+    subs = DEFAULT_SUBDOMAINS if subs is None else subs
+    return [f"{sub}.{domain}" for sub in subs]
 
-def update_ip_cache(user, blacklist_path, verbose=False):
+def resolve_cache_targets(groups, generated=(), names=None, caches=(), negative_ttl=DEFAULT_NEGATIVE_TTL,
+                          max_workers=DEFAULT_DNS_WORKERS, timeout=DEFAULT_DNS_TIMEOUT, deadline=DEFAULT_DNS_DEADLINE,
+                          stats=None, resolvers=None, quiet=False):
+    """
+    Resolve blacklist targets for a cache refresh, as update-restriction and the daemon do.
+    `groups` and `generated` come from get_target_groups and get_generated_targets; `names`
+    limits the pass to some of their targets (all by default), and only the domains of those
+    names are probed for wildcard DNS. Names that answered NXDOMAIN/NODATA less than
+    `negative_ttl` seconds ago in every one of `caches` are not queried.
+    Returns resolve_targets' (resolved, statuses).
+    """
+    targets = targets_from_groups(groups) if names is None else list(names)
+    wanted = set(targets)
+    groups = [(domain, [name for name in members if name in wanted]) for domain, members in groups]
+    skip = set.intersection(*(known_missing(cache, negative_ttl) for cache in caches)) if caches else set()
+    return resolve_targets(targets, max_workers=max_workers, timeout=timeout, skip=skip,
+                           groups=[(domain, members) for domain, members in groups if members], deadline=deadline,
+                           stats=stats, resolvers=resolvers, generated=generated, quiet=quiet)
+
+def refresh_cache(cache, resolved, statuses, grace=DEFAULT_CACHE_GRACE, max_per_target=DEFAULT_MAX_IPS_PER_TARGET):
+    """Merge a resolution pass into a cache and expire stale addresses. Returns the number of addresses evicted."""
+    merge_resolved(cache, resolved)
+    record_statuses(cache, statuses)
+    return expire_cache(cache, resolved, grace=grace, max_per_target=max_per_target)
+
+def update_ip_cache(user, blacklist_path, verbose=False, max_workers=DEFAULT_DNS_WORKERS, timeout=DEFAULT_DNS_TIMEOUT,
+                    grace=DEFAULT_CACHE_GRACE, max_per_target=DEFAULT_MAX_IPS_PER_TARGET, negative_ttl=DEFAULT_NEGATIVE_TTL,
+                    cache_format=DEFAULT_CACHE_FORMAT, shared=False, deadline=DEFAULT_DNS_DEADLINE, resolvers=None):
     """
     Update the stored IP cache for the user by merging new IPs for all domains and subdomains.
-    Preserves old entries and adds new ones.
+    With shared=True the machine-wide cache is updated instead, unless another run refreshed it
+    less than SHARED_CACHE_MAX_AGE seconds ago.
+    Addresses not seen again within their DNS TTL plus `grace` seconds are dropped, and each
+    target keeps at most `max_per_target` of its most recently seen addresses.
+    Names that answered NXDOMAIN/NODATA less than `negative_ttl` seconds ago are not queried again.
+    A cache stored in the other format is read and rewritten in `cache_format`.
+    Resolution stops after `deadline` seconds; names that were not answered keep their cached
+    addresses, and if the resolver is unreachable the existing cache is kept as it is.
+    Every name is queried through each of `resolvers` (the system resolver if none).
+    A cache that cannot be read (see CacheError) is left alone and (False, None) returned.
     """
-    cache_path = get_user_cache_path(user)
+    cache_path = get_cache_path(user, cache_format, shared)
+    if shared and shared_cache_is_fresh(cache_path):
+        print(f"♻️  Shared IP cache {find_cache_file(cache_path)} is up to date, skipping DNS resolution")
+        return True, str(find_cache_file(cache_path))
     if verbose:
         print(f"[update_ip_cache] Updating IP cache from {blacklist_path} to {cache_path}")
-    ip_map = {}
-    if cache_path.exists():
-        with open(cache_path) as f:
-            try:
-                ip_map = json.load(f)
-            except Exception:
-                ip_map = {}
-    targets = get_targets_from_blacklist(blacklist_path)
+    try:
+        cache = load_cache(cache_path)
+    except CacheError as e:
+        print(f"❌ {e}. Fix or remove it; the installed rules are kept.")
+        return False, None
+    groups = get_target_groups(blacklist_path)
+    targets = targets_from_groups(groups)
     if not targets:
         return False, None
-    ip_map = resolve_targets_to_ip_map(targets, ip_map)
-    with open(cache_path, 'w') as f:
-        json.dump(ip_map, f, indent=2)
+    stats = {}
+    resolved, statuses = resolve_cache_targets(
+        groups, get_generated_targets(blacklist_path), caches=[cache], negative_ttl=negative_ttl, max_workers=max_workers,
+        timeout=timeout, deadline=deadline, stats=stats, resolvers=resolvers
+    )
+    stale_path = find_cache_file(cache_path)
+    if stats["unreachable"] and stale_path.exists():
+        print(f"⚠️  DNS resolver unreachable, keeping the existing IP cache {stale_path}")
+        return True, str(stale_path)
+    removed = refresh_cache(cache, resolved, statuses, grace=grace, max_per_target=max_per_target)
+    for target in targets:
+        cache["targets"].setdefault(target, {})
+    save_cache(cache_path, cache)
+    if stale_path != cache_path:
+        stale_path.unlink()
+    if removed:
+        print(f"  🧹 Evicted {removed} stale address(es) from the cache")
     if verbose:
         print(f"IP cache updated and saved to {cache_path}")
     return True, str(cache_path)
 
-def create_ip_cache(user, blacklist_path, verbose=False):
+def create_ip_cache(user, blacklist_path, verbose=False, max_workers=DEFAULT_DNS_WORKERS, timeout=DEFAULT_DNS_TIMEOUT,
+                    max_per_target=DEFAULT_MAX_IPS_PER_TARGET, cache_format=DEFAULT_CACHE_FORMAT, shared=False,
+                    deadline=DEFAULT_DNS_DEADLINE, resolvers=None):
     """
-    Create a fresh IP cache for the user. Overwrites any previous cache.
+    Create a fresh IP cache for the user. Overwrites any previous cache, in either format.
+    With shared=True the machine-wide cache is created instead; one written less than
+    SHARED_CACHE_MAX_AGE seconds ago (e.g. while restricting the previous user) is reused.
+    Resolution stops after `deadline` seconds. Names that were not answered in time take their
+    addresses from the previous cache, and if the resolver is unreachable the previous cache
+    is reused unchanged. Every name is queried through each of `resolvers` (the system resolver if none).
     """
-    cache_path = get_user_cache_path(user)
+    cache_path = get_cache_path(user, cache_format, shared)
+    if shared and shared_cache_is_fresh(cache_path):
+        print(f"♻️  Reusing shared IP cache {find_cache_file(cache_path)}")
+        return True, str(find_cache_file(cache_path))
     if verbose:
         print(f"[create_ip_cache] Reading blacklist from {blacklist_path}")
     
     print("📝 Reading blacklist domains...")
-    targets = get_targets_from_blacklist(blacklist_path)
+    groups = get_target_groups(blacklist_path)
+    targets = targets_from_groups(groups)
     if not targets:
         return False, None
     
     print(f"🌐 Resolving {len(targets)} domain(s) to IP addresses (this may take a moment)...")
-    ip_map = resolve_targets_to_ip_map(targets)
-    with open(cache_path, 'w') as f:
-        json.dump(ip_map, f, indent=2)
+    stats = {}
+    resolved, statuses = resolve_targets(targets, max_workers=max_workers, timeout=timeout, groups=groups,
+                                         deadline=deadline, stats=stats, resolvers=resolvers,
+                                         generated=get_generated_targets(blacklist_path))
+    previous_path = find_cache_file(cache_path)
+    if stats["unreachable"] and previous_path.exists():
+        print(f"⚠️  DNS resolver unreachable, reusing the existing IP cache {previous_path}")
+        return True, str(previous_path)
+    cache = record_statuses(merge_resolved(new_cache(), resolved), statuses)
+    expire_cache(cache, resolved, max_per_target=max_per_target)
+    failed = [name for name, status in statuses.items() if status in FAILED_STATUSES]
+    if failed and previous_path.exists():
+        try:
+            previous = load_cache(previous_path)["targets"]
+        except CacheError as e:
+            print(f"⚠️  {e}, not keeping addresses from it")
+            previous = {}
+        kept = {name: previous[name] for name in failed if previous.get(name)}
+        cache["targets"].update(kept)
+        if kept:
+            print(f"  ♻️  Kept the cached addresses of {len(kept)} unanswered name(s)")
+    save_cache(cache_path, cache)
+    for suffix in CACHE_FORMATS.values():
+        other = cache_path.with_suffix(suffix)
+        if other != cache_path and other.exists():
+            other.unlink()
     if verbose:
         print(f"IP cache created at {cache_path}")
     return True, str(cache_path)
 
-def apply_restrictions_from_cache(user, verbose=False):
+def export_cache_bundle(user, bundle_path, blacklist_path, verbose=False, cache_format=DEFAULT_CACHE_FORMAT, shared=False):
+    """
+    Write a bundle (see bundle_handler) of the user's cache, or of the machine-wide cache with
+    shared=True, together with the targets and compiled matcher of the blacklist.
+    Returns the bundle payload, or None if there is no cache or blacklist to export.
+    """
+    cache_path = find_cache_file(get_cache_path(user, cache_format, shared))
+    if not cache_path.exists():
+        print(f"❌ IP cache file {cache_path} not found. Restrict once or export with --resolve.")
+        return None
+    entries = read_blacklist(blacklist_path)
+    if entries is None:
+        return None
+    try:
+        cache = load_cache(cache_path)
+    except CacheError as e:
+        print(f"❌ {e}")
+        return None
+    payload = build_bundle(
+        cache, get_target_groups(blacklist_path), get_blacklist_matcher(blacklist_path, entries),
+        source_digest([rule for rule, _ in entries])
+    )
+    save_bundle(bundle_path, payload)
+    if verbose:
+        print(f"Exported IP cache {cache_path} to bundle {bundle_path}")
+    return payload
+
+def import_cache_bundle(user, bundle_path, blacklist_path, verbose=False, cache_format=DEFAULT_CACHE_FORMAT, shared=False):
+    """
+    Verify a bundle and install its cache as the user's cache (or the machine-wide cache with
+    shared=True) and its compiled matcher, without any DNS resolution.
+    Warns if the bundle was built from a different blacklist than `blacklist_path`.
+    Returns (success, cache_path).
+    """
+    try:
+        payload = load_bundle(bundle_path)
+    except FileNotFoundError:
+        print(f"❌ Bundle {bundle_path} not found.")
+        return False, None
+    except BundleError as e:
+        print(f"❌ Bundle {bundle_path} rejected: {e}")
+        return False, None
+    entries = read_blacklist(blacklist_path)
+    if entries is not None and source_digest([rule for rule, _ in entries]) != payload["blacklist"]:
+        print(f"⚠️  Bundle was built from a different blacklist than {blacklist_path}; applying the bundle's targets.")
+    cache_path = get_cache_path(user, cache_format, shared)
+    save_cache(cache_path, payload["cache"])
+    for suffix in CACHE_FORMATS.values():
+        other = cache_path.with_suffix(suffix)
+        if other != cache_path and other.exists():
+            other.unlink()
+    save_matcher(get_cache_dir() / 'blacklist_matcher.json', payload["matcher"], payload["blacklist"])
+    targets = targets_from_groups(payload["targets"])
+    resolved = sum(1 for target in targets if payload["cache"]["targets"].get(target))
+    created = time.strftime("%Y-%m-%d %H:%M", time.localtime(payload["created_at"]))
+    print(f"📦 Imported bundle from {payload['host']} ({created}): {resolved}/{len(targets)} target(s) resolved")
+    if verbose:
+        print(f"IP cache installed at {cache_path}")
+    return True, str(cache_path)
+
+def apply_with_iptables(uid, uids, ip_map, blocks, incremental, verbose, name_rules=True):
+    """Legacy backend: add the rules one iptables/ip6tables process at a time."""
+    stats = None
+    ruleset = build_ruleset(uid, ip_map, blocks=blocks, name_rules=name_rules)
+    delta = compute_ruleset_delta(uid, ruleset) if incremental else None
+    if delta is None:
+        for family in FAMILIES:
+            try:
+                ensure_chain_individually(family, uid)
+            except Exception:
+                pass
+        for family in FAMILIES:
+            for idx, (args, target) in enumerate(ruleset[family], 1):
+                print(f"  🛡️  [{family}] Blocking {idx}/{len(ruleset[family])}: {target}...", end='\r')
+                try:
+                    subprocess.run([family] + args, check=True)
+                except Exception:
+                    pass
+    else:
+        for family in FAMILIES:
+            for args, _ in delta[family][0]:
+                try:
+                    subprocess.run([family] + args, check=True)
+                except Exception:
+                    pass
+        stats = delta_totals(delta)
+    return True, stats
+
+def apply_with_restore(uid, uids, ip_map, blocks, incremental, verbose, name_rules=True, set_names=None):
+    """Commit the ruleset with one iptables-restore and one ip6tables-restore call."""
+    ruleset = build_ruleset(uid, ip_map, set_names=set_names, blocks=blocks, name_rules=name_rules)
+    if incremental:
+        stats = restore_ruleset_delta(uid, ruleset, verbose=verbose)
+        return stats is not None, stats
+    return restore_ruleset(uid, ruleset, verbose=verbose), None
+
+def apply_with_ipset(uid, uids, ip_map, blocks, incremental, verbose, name_rules=True):
+    """Swap the blocks into the owner's ipsets, then commit the set-matching ruleset."""
+    set_names = user_set_names(uid)
+    if not swap_ip_sets(set_names, blocks, verbose=verbose):
+        return False, None
+    return apply_with_restore(uid, uids, ip_map, blocks, incremental, verbose, name_rules=name_rules, set_names=set_names)
+
+def apply_with_nftables(uid, uids, ip_map, blocks, incremental, verbose, name_rules=True):
+    """Load the blocks into the owner's nftables interval sets in one nft transaction (names are left to the stub resolver)."""
+    stats = nft_apply_ruleset(uid, uids, blocks, verbose=verbose)
+    return stats is not None, stats
+
+# Every backend takes (uid, uids, ip_map, blocks, incremental, verbose, name_rules) and returns
+# (applied, stats), where stats is (added, removed, unchanged) or None.
+# "iptables-restore" commits the whole ruleset atomically; "iptables" appends one rule per process;
+# "ipset" keeps the IPs in per-user sets matched by a single rule per address family;
+# "nftables" keeps them in interval sets of one inet table, replaced in a single nft transaction.
+FIREWALL_BACKENDS = {
+    "iptables-restore": apply_with_restore,
+    "iptables": apply_with_iptables,
+    "ipset": apply_with_ipset,
+    "nftables": apply_with_nftables,
+}
+BACKENDS = tuple(FIREWALL_BACKENDS)
+# Backends that cannot install the per-domain DNS/DoH string-match rules (nftables has no
+# string match), so they only run with the stub resolver blocking the names instead
+STUB_RESOLVER_BACKENDS = ("nftables",)
+
+def expected_ruleset(backend, uid, ip_map, blocks, name_rules=True):
+    """
+    Return the chain ruleset a backend installs for the owner (see build_ruleset), or None
+    for the nftables backend, whose blocks live in set elements instead of rules.
+    """
+    if backend == "nftables":
+        return None
+    set_names = user_set_names(uid) if backend == "ipset" else None
+    return build_ruleset(uid, ip_map, set_names=set_names, blocks=blocks, name_rules=name_rules)
+
+def apply_restrictions_from_cache(user, verbose=False, backend=DEFAULT_BACKEND, incremental=False,
+                                  prefix_path=None, widen_threshold=DEFAULT_WIDEN_THRESHOLD, cache_format=DEFAULT_CACHE_FORMAT,
+                                  group=None, shared=False, stub_port=None, cache=None, resolution=None):
     """
     Apply iptables/ip6tables rules for all cached IPs for the user.
+    Cached IPs and the static prefixes in `prefix_path` are first aggregated into the
+    smallest set of CIDR blocks; with widen_threshold > 0, dense /24 and /48 ranges are
+    blocked as a whole.
+    The default backend builds the ruleset in memory and commits it with one
+    iptables-restore and one ip6tables-restore call.
+    With incremental=True the installed chain is read once with iptables-save and
+    only the rules that differ from the cache are added or removed.
+    The cache is read in whichever format it was stored; if it cannot be read (see CacheError)
+    nothing is applied and the installed rules are kept.
+    With `group`, one ruleset matching the group's members (--gid-owner) is applied from the
+    shared cache instead of the user's own; shared=True uses the shared cache for a single user.
+    With `stub_port`, the owner's DNS is redirected to the local stub resolver on that port and
+    the per-domain DNS/DoH string-match rules are left out; otherwise any such redirect is removed.
+    The backends in STUB_RESOLVER_BACKENDS cannot install those rules and refuse to run without `stub_port`.
+    On success the owner's manifest (see manifest_handler) is rewritten for `status`.
+    With `cache`, that in-memory cache (already saved to the cache file) is applied instead of reading the file.
+    `resolution` (see resolution_options) is recorded in the manifest; if None, the options the
+    owner's previous manifest recorded are kept.
     """
-    cache_path = get_user_cache_path(user)
-    if not Path(cache_path).exists():
+    if backend in STUB_RESOLVER_BACKENDS and stub_port is None:
+        print(f"❌ The {backend} backend cannot block domain names in DNS/DoH traffic; use it with --stub-resolver.")
+        return False
+    cache_path = find_cache_file(get_cache_path(user, cache_format, shared or bool(group)))
+    if cache is None and not Path(cache_path).exists():
         print(f"❌ IP cache file {cache_path} not found.")
         return False
-    try:
-        uid = pwd.getpwnam(user).pw_uid
-    except Exception:
-        print(f"❌ User {user} not found.")
+    uid = get_owner(user, group)
+    if uid is None:
         return False
+    uids = owner_uids(uid, group)
     
-    with open(cache_path) as f:
-        ip_map = json.load(f)
+    if cache is None:
+        try:
+            cache = load_cache(cache_path)
+        except CacheError as e:
+            # An empty ruleset would lift every restriction: keep the installed one instead
+            print(f"❌ {e}. Firewall rules were not changed.")
+            return False
+    ip_map = cache_to_ip_map(cache)
+    blocks, compaction = compact_ip_map(ip_map, load_prefixes(prefix_path), widen_threshold=widen_threshold)
+    print(f"📦 Compacted {compaction['addresses']} address(es) and {compaction['prefixes']} prefix(es) "
+          f"into {compaction['blocks']} block(s) (ratio {compaction['ratio']:.1f}x)")
     
     total_rules = len(ip_map)
     print(f"🔒 Applying firewall rules for {total_rules} domain(s)...")
-    for idx, (target, ips) in enumerate(ip_map.items(), 1):
-        print(f"  🛡️  Blocking {idx}/{total_rules}: {target}...", end='\r')
-        for ip in ips:
-            try:
-                if ':' in ip:
-                    subprocess.run(["ip6tables", "-A", "OUTPUT", "-d", ip, "-m", "owner", "--uid-owner", str(uid), "-j", "DROP"], check=True)
-                else:
-                    subprocess.run(["iptables", "-A", "OUTPUT", "-d", ip, "-m", "owner", "--uid-owner", str(uid), "-j", "DROP"], check=True)
-            except Exception:
-                pass
-        # Block DNS requests for the domain/subdomain
-        try:
-            subprocess.run(["iptables", "-A", "OUTPUT", "-p", "udp", "--dport", "53", "-m", "string", "--string", target, "--algo", "bm", "-m", "owner", "--uid-owner", str(uid), "-j", "DROP"], check=True)
-        except Exception:
-            pass
-        # Block DNS over HTTPS (DoH) for the domain/subdomain (TCP 443)
-        try:
-            subprocess.run(["iptables", "-A", "OUTPUT", "-p", "tcp", "--dport", "443", "-m", "string", "--string", target, "--algo", "bm", "-m", "owner", "--uid-owner", str(uid), "-j", "DROP"], check=True)
-            subprocess.run(["ip6tables", "-A", "OUTPUT", "-p", "tcp", "--dport", "443", "-m", "string", "--string", target, "--algo", "bm", "-m", "owner", "--uid-owner", str(uid), "-j", "DROP"], check=True)
-        except Exception:
-            pass
+    started = time.monotonic()
+    applied, stats = FIREWALL_BACKENDS[backend](
+        uid, uids, ip_map, blocks, incremental, verbose, name_rules=stub_port is None
+    )
+    if not applied:
+        print("❌ Firewall rules were not applied.")
+        return False
+    if stub_port:
+        if not restore_redirect(uid, stub_port, verbose=verbose):
+            print("❌ DNS redirect to the stub resolver was not applied.")
+            return False
+        print(f"  🧭 DNS redirected to the local stub resolver on port {stub_port}")
+    else:
+        for family in FAMILIES:
+            remove_user_rules(family, uid, verbose=verbose, table="nat")
+    elapsed = time.monotonic() - started
+    rules = expected_ruleset(backend, uid, ip_map, blocks, name_rules=stub_port is None)
+    if resolution is None:
+        previous = (load_manifest(get_manifest_path(uid)) or {}).get("options", {})
+        resolution = {key: previous[key] for key in RESOLUTION_OPTIONS if key in previous}
+    save_manifest(get_manifest_path(uid), build_manifest(
+        uid, None if group else user, group, uids, backend, rules, blocks, cache_path, stub_port,
+        options=dict(resolution, widen_threshold=widen_threshold, cache_format=cache_format, shared=shared or bool(group))
+    ))
     
-    print(f"  ✅ All {total_rules} firewall rules applied{' ' * 30}")
+    print(f"  ✅ All {total_rules} firewall rules applied in {elapsed:.2f}s{' ' * 30}")
+    if stats:
+        added, removed, unchanged = stats
+        print(f"  📊 Rules added: {added}, removed: {removed}, unchanged: {unchanged}")
     if verbose:
-        print(f"Applied restrictions for user {user} from cache {cache_path}")
+        print(f"Applied restrictions for {f'group {group}' if group else f'user {user}'} from cache {cache_path} using {backend}")
     return True
 
-def restrict_internet(user, blacklist_path, verbose=False):
+def restrict_internet(user, blacklist_path, verbose=False, max_workers=DEFAULT_DNS_WORKERS, timeout=DEFAULT_DNS_TIMEOUT, backend=DEFAULT_BACKEND,
+                      prefix_path=None, widen_threshold=DEFAULT_WIDEN_THRESHOLD, cache_format=DEFAULT_CACHE_FORMAT,
+                      group=None, shared=False, stub_port=None, bundle_path=None, deadline=DEFAULT_DNS_DEADLINE,
+                      resolvers=None):
     """
-    Restrict internet access for the given user based on blacklist file.
+    Restrict internet access for the given user (or every member of `group`) based on blacklist file.
     Uses create_ip_cache and apply_restrictions_from_cache.
+    With `bundle_path` the cache is imported from a bundle (see import_cache_bundle) instead of resolved.
+    The bundle path or the DNS settings are recorded in the manifest for later refreshes.
     """
-    success, _ = create_ip_cache(user, blacklist_path, verbose=verbose)
+    shared = shared or bool(group)
+    if bundle_path:
+        success, _ = import_cache_bundle(user, bundle_path, blacklist_path, verbose=verbose, cache_format=cache_format, shared=shared)
+    else:
+        success, _ = create_ip_cache(user, blacklist_path, verbose=verbose, max_workers=max_workers, timeout=timeout,
+                                     cache_format=cache_format, shared=shared, deadline=deadline, resolvers=resolvers)
     if not success:
         print("Failed to create IP cache. No restrictions applied.")
         return False
-    return apply_restrictions_from_cache(user, verbose=verbose)
+    return apply_restrictions_from_cache(
+        user, verbose=verbose, backend=backend, prefix_path=prefix_path, widen_threshold=widen_threshold,
+        cache_format=cache_format, group=group, shared=shared, stub_port=stub_port,
+        resolution=resolution_options(max_workers, timeout, deadline, resolvers, bundle_path)
+    )
 
-def unrestrict_internet(user, blacklist_path, verbose=False):
+def unrestrict_internet(user, blacklist_path, verbose=False, group=None):
     """
-    Remove all iptables/ip6tables OUTPUT rules for the given user UID.
+    Remove the user's CONTEST-<uid> chain and every iptables/ip6tables OUTPUT rule for the user UID.
     This flushes any network restrictions for the user, regardless of origin or type.
+    With `group`, the group's CONTEST-G<gid> chain and its --gid-owner rule are removed instead.
     """
-    print(f"🔓 Flushing all iptables/ip6tables OUTPUT rules for user: {user}")
-    try:
-        uid = pwd.getpwnam(user).pw_uid
-    except Exception:
-        print(f"❌ User {user} not found.")
+    print(f"🔓 Flushing all iptables/ip6tables OUTPUT rules for {f'group: {group}' if group else f'user: {user}'}")
+    uid = get_owner(user, group)
+    if uid is None:
         return
-    tables = ["iptables", "ip6tables"]
-    for table in tables:
-        # List all rules in OUTPUT chain
-        result = subprocess.run([table, "-L", "OUTPUT", "--line-numbers", "-n", "-v"], capture_output=True, text=True)
-        lines = result.stdout.splitlines()
-        # Find line numbers for rules with --uid-owner <uid>
-        rule_lines = []
-        for line in lines:
-            if f"--uid-owner {uid}" in line:
-                parts = line.strip().split()
-                if parts and parts[0].isdigit():
-                    rule_lines.append(int(parts[0]))
-        # Delete rules from bottom to top
-        for line_num in sorted(rule_lines, reverse=True):
-            del_cmd = [table, "-D", "OUTPUT", str(line_num)]
-            del_result = subprocess.run(del_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            if del_result.returncode == 0:
-                print(f"[{table}] Deleted OUTPUT rule at line {line_num} for UID {uid}")
-        if not rule_lines:
-            print(f"[{table}] No OUTPUT rules for UID {uid} found.")
-    print(f"✅ All iptables/ip6tables OUTPUT rules for user UID {uid} fully removed.")
+    label = f"group {group}" if group else f"UID {uid}"
+    for table in FAMILIES:
+        removed = remove_user_rules(table, uid, verbose=verbose)
+        if removed is None:
+            print(f"[{table}] No OUTPUT rules for {label} found.")
+        else:
+            print(f"[{table}] Removed chain {user_chain(uid)} and {removed} OUTPUT rule(s) for {label}")
+    for family in FAMILIES:
+        if remove_user_rules(family, uid, verbose=verbose, table="nat") is not None:
+            print(f"[{family}] Removed DNS redirect for {label}")
+    unmapped = nft_remove_ruleset(uid, verbose=verbose)
+    if unmapped is not None:
+        print(f"[nftables] Removed chain {user_chain(uid)} and {unmapped} owner entr{'y' if unmapped == 1 else 'ies'} for {label}")
+    destroy_ip_sets(user_set_names(uid), verbose=verbose)
+    remove_manifest(get_manifest_path(uid))
+    print(f"✅ All iptables/ip6tables OUTPUT rules for {label} fully removed.")
+
+
+def stub_resolver_in_use():
+    """Return True if any user's or group's DNS is still redirected to the stub resolver."""
+    return any(line.startswith("-N CONTEST-") for family in FAMILIES for line in list_rules(family, table="nat"))
 
 
 def internet_restriction_check(user):
     """
-    Check if internet restriction is applied for the given user (any iptables/ip6tables OUTPUT DROP rules for UID).
-    Returns True if any such rule exists, False otherwise.
+    Check if internet restriction is applied for the given user: OUTPUT jumps to the user's
+    CONTEST-<uid> chain, or to the CONTEST-G<gid> chain of a group the user belongs to,
+    or the nftables owner map sends the user's UID to a restriction chain.
+    The filter table is read with one `<family>-save` call per address family and the
+    nftables table is only listed if neither holds a jump.
+    Returns True if the jump exists for either address family, False otherwise.
     """
     try:
-        uid = pwd.getpwnam(user).pw_uid
+        entry = pwd.getpwnam(user)
     except Exception:
         print(f"❌ User {user} not found.")
         return False
-    for table in ["iptables", "ip6tables"]:
+    jumps = [build_jump_rule(owner) for owner in [entry.pw_uid] + [group_owner(gid) for gid in os.getgrouplist(user, entry.pw_gid)]]
+    for family in FAMILIES:
+        output = read_saved_tables(family, "filter").get("filter", {}).get("OUTPUT", [])
+        if any(jump in output for jump in jumps):
+            return True
+    return entry.pw_uid in nft_restricted_uids()
+
+
+def restriction_reports(user=None):
+    """
+    Verify the restriction manifests of `user` (its own and those of its groups), or of every
+    restricted owner if `user` is None, against the firewall state read once for all of them.
+    Returns a list of reports (see manifest_handler.verify_manifest); empty if none are recorded.
+    """
+    manifests = load_manifests(get_manifest_dir())
+    if user is not None:
         try:
-            result = subprocess.run([table, "-S", "OUTPUT"], capture_output=True, text=True)
-            rules = result.stdout.splitlines()
-            for rule in rules:
-                if f"-m owner --uid-owner {uid}" in rule and "-j DROP" in rule:
-                    return True
-        except Exception:
-            pass
-    return False
\ No newline at end of file
+            entry = pwd.getpwnam(user)
+        except KeyError:
+            print(f"❌ User {user} not found.")
+            return []
+        owners = {str(entry.pw_uid)} | {group_owner(gid) for gid in os.getgrouplist(user, entry.pw_gid)}
+        manifests = [manifest for manifest in manifests if manifest["owner"] in owners]
+    if not manifests:
+        return []
+    state = read_installed_state(manifests)
+    return [verify_manifest(manifest, state) for manifest in manifests]
@@ -0,0 +1,97 @@
+"""
+ipset blocklist utilities for contest-manager
+"""
+
+import subprocess
+
+SET_TYPE = "hash:net"
+SET_FAMILIES = {"iptables": "inet", "ip6tables": "inet6"}
+MIN_MAXELEM = 65536
+
+def user_set_names(uid):
+    """Return the live set name for each address family of a UID."""
+    return {"iptables": f"contest-{uid}-v4", "ip6tables": f"contest-{uid}-v6"}
+
+def split_by_family(addresses):
+    """Sort addresses and CIDR blocks into one sorted list per address family."""
+    entries = {family: set() for family in SET_FAMILIES}
+    for address in addresses:
+        entries["ip6tables" if ':' in address else "iptables"].add(address)
+    return {family: sorted(items) for family, items in entries.items()}
+
+def list_ip_sets():
+    """Return the names of all existing ipsets."""
+    try:
+        result = subprocess.run(["ipset", "list", "-n"], capture_output=True, text=True)
+    except FileNotFoundError:
+        return set()
+    return set(result.stdout.split())
+
+def read_ip_sets():
+    """
+    Read every ipset with a single `ipset save` call.
+    Returns {set name: [entries]}, with an empty list for sets that hold nothing.
+    """
+    try:
+        result = subprocess.run(["ipset", "save"], capture_output=True, text=True)
+    except FileNotFoundError:
+        return {}
+    sets = {}
+    for line in result.stdout.splitlines():
+        tokens = line.split()
+        if len(tokens) >= 2 and tokens[0] == "create":
+            sets.setdefault(tokens[1], [])
+        elif len(tokens) >= 3 and tokens[0] == "add":
+            sets.setdefault(tokens[1], []).append(tokens[2])
+    return sets
+
+def render_swap_payload(set_names, entries, existing=()):
+    """
+    Render an `ipset restore` input that fills a fresh set per family and swaps it in.
+    The live sets are created if missing so the swap also works on the first run;
+    a staging set left behind by an interrupted run is dropped first.
+    """
+    lines = []
+    for family, name in set_names.items():
+        staging = f"{name}-new"
+        create = f"{SET_TYPE} family {SET_FAMILIES[family]} maxelem {max(MIN_MAXELEM, len(entries[family]))}"
+        if name not in existing:
+            lines.append(f"create {name} {create}")
+        if staging in existing:
+            lines.append(f"destroy {staging}")
+        lines.append(f"create {staging} {create}")
+        lines.extend(f"add {staging} {ip}" for ip in entries[family])
+        lines.append(f"swap {staging} {name}")
+        lines.append(f"destroy {staging}")
+    return "\n".join(lines) + "\n"
+
+def swap_ip_sets(set_names, addresses, verbose=False):
+    """
+    Load all blocked addresses and CIDR blocks into the user's sets with a single `ipset restore` call.
+    Packets keep matching the old contents until the swap, so a refresh never unblocks anything.
+    """
+    entries = split_by_family(addresses)
+    payload = render_swap_payload(set_names, entries, existing=list_ip_sets())
+    if verbose:
+        for family, name in set_names.items():
+            print(f"[ipset] Swapping {len(entries[family])} address(es) into {name}")
+    try:
+        result = subprocess.run(["ipset", "restore"], input=payload, capture_output=True, text=True)
+    except FileNotFoundError:
+        print("❌ ipset not found. Install it with: sudo apt-get install ipset")
+        return False
+    if result.returncode != 0:
+        print(f"❌ [ipset] Failed to load blocklist sets: {result.stderr.strip()}")
+        return False
+    return True
+
+def destroy_ip_sets(set_names, verbose=False):
+    """Destroy the user's sets. Sets still referenced by a rule are left in place."""
+    for name in set_names.values():
+        for set_name in (f"{name}-new", name):
+            try:
+                result = subprocess.run(["ipset", "destroy", set_name], capture_output=True, text=True)
+            except FileNotFoundError:
+                return
+            if result.returncode == 0 and verbose:
+                print(f"[ipset] Destroyed set {set_name}")
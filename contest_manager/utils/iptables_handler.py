@@ -0,0 +1,398 @@
+"""
+iptables/ip6tables ruleset utilities for contest-manager
+
+Every restriction for a user lives in a dedicated chain (CONTEST-<uid>) that is
+reached through a single owner-matching jump rule from OUTPUT.
+
+Functions taking a `uid` also accept a group owner from group_owner(gid): its chain
+(CONTEST-G<gid>) is reached through one --gid-owner jump that covers every member of
+the group, so a lab of many contest users needs a single ruleset.
+"""
+
+import re
+import ipaddress
+import subprocess
+from collections import Counter
+
+FAMILIES = ("iptables", "ip6tables")
+RESTORE_LINE_RE = re.compile(r"line:?\s+(\d+)")
+
+def group_owner(gid):
+    """Return the owner key used in place of a UID to restrict all members of a group."""
+    return f"g{gid}"
+
+def owner_match(uid):
+    """Return the owner-match arguments for a UID or a group owner."""
+    owner = str(uid)
+    if owner.startswith("g"):
+        # --suppl-groups also matches members for whom the group is not the primary group
+        return ["--gid-owner", owner[1:], "--suppl-groups"]
+    return ["--uid-owner", owner]
+
+def user_chain(uid):
+    """Return the name of the chain holding a UID's (or group owner's) restrictions."""
+    return f"CONTEST-{str(uid).upper()}"
+
+def build_jump_rule(uid):
+    """Return the OUTPUT rule that sends a UID's traffic through its chain."""
+    return ["-A", "OUTPUT", "-m", "owner"] + owner_match(uid) + ["-j", user_chain(uid)]
+
+def build_redirect_rules(uid, port):
+    """
+    Return the nat-table (family, args) rules that send a UID's DNS queries (UDP and TCP 53)
+    to the local stub resolver listening on `port`.
+    """
+    chain = user_chain(uid)
+    return [
+        (family, ["-A", chain, "-p", protocol, "--dport", "53", "-j", "REDIRECT", "--to-ports", str(port)])
+        for family in FAMILIES for protocol in ("udp", "tcp")
+    ]
+
+def build_address_rule(uid, address):
+    """Return the (family, args) rule that drops traffic from a UID to an address or CIDR block."""
+    family = "ip6tables" if ':' in address else "iptables"
+    return family, ["-A", user_chain(uid), "-d", address, "-j", "DROP"]
+
+def build_target_rules(uid, target, ips):
+    """
+    Return the (family, args) rules that block a single blacklist target for a UID.
+    Covers every cached IP plus DNS (UDP 53) and DoH (TCP 443) string matches for the name.
+    """
+    chain = user_chain(uid)
+    rules = [build_address_rule(uid, ip) for ip in ips]
+    # Block DNS requests for the domain/subdomain
+    rules.append(("iptables", ["-A", chain, "-p", "udp", "--dport", "53", "-m", "string", "--string", target, "--algo", "bm", "-j", "DROP"]))
+    # Block DNS over HTTPS (DoH) for the domain/subdomain (TCP 443)
+    rules.append(("iptables", ["-A", chain, "-p", "tcp", "--dport", "443", "-m", "string", "--string", target, "--algo", "bm", "-j", "DROP"]))
+    rules.append(("ip6tables", ["-A", chain, "-p", "tcp", "--dport", "443", "-m", "string", "--string", target, "--algo", "bm", "-j", "DROP"]))
+    return rules
+
+def build_set_rule(uid, set_name):
+    """Return the single rule that drops traffic from a UID to any address in an ipset."""
+    return ["-A", user_chain(uid), "-m", "set", "--match-set", set_name, "dst", "-j", "DROP"]
+
+def build_ruleset(uid, ip_map, set_names=None, blocks=None, name_rules=True):
+    """
+    Build the full ruleset for a UID's chain in memory.
+    With set_names ({family: ipset name}) the per-IP rules are replaced by one set match per family.
+    With blocks (aggregated CIDR blocks, see cidr_handler) one rule per block replaces the per-IP rules.
+    Otherwise an address shared by several targets is blocked by a single rule.
+    With name_rules=False the DNS/DoH string-match rules are left out (the stub resolver blocks names).
+    Returns {family: [(args, target), ...]} with rules in cache order.
+    """
+    ruleset = {family: [] for family in FAMILIES}
+    if set_names:
+        for family in FAMILIES:
+            ruleset[family].append((build_set_rule(uid, set_names[family]), set_names[family]))
+    elif blocks is not None:
+        for block in blocks:
+            family, args = build_address_rule(uid, block)
+            ruleset[family].append((args, block))
+    blocked = set()
+    for target, ips in ip_map.items():
+        # Targets that share addresses (CNAME aliases, wildcard subdomains) get each IP rule once
+        ips = [] if set_names or blocks is not None else [ip for ip in ips if ip not in blocked]
+        blocked.update(ips)
+        rules = build_target_rules(uid, target, ips) if name_rules else [build_address_rule(uid, ip) for ip in ips]
+        for family, args in rules:
+            ruleset[family].append((args, target))
+    return ruleset
+
+def render_restore_payload(rules, chains=(), table="filter"):
+    """
+    Render rules as an iptables-restore input for one table (filter by default).
+    Declared chains are created, or flushed if they already exist.
+    Returns (payload, line_map) where line_map maps payload line numbers to (args, target).
+    """
+    lines = [f"*{table}"]
+    lines.extend(f":{chain} - [0:0]" for chain in chains)
+    line_map = {}
+    for args, target in rules:
+        lines.append(" ".join(args))
+        line_map[len(lines)] = (args, target)
+    lines.append("COMMIT")
+    return "\n".join(lines) + "\n", line_map
+
+def explain_restore_error(stderr, line_map):
+    """Map an iptables-restore error message back to the rule and target that caused it."""
+    match = RESTORE_LINE_RE.search(stderr or "")
+    if match and int(match.group(1)) in line_map:
+        args, target = line_map[int(match.group(1))]
+        return f"rule '{' '.join(args)}' for target {target}"
+    return "commit of the ruleset"
+
+def restore_rules(family, rules, verbose=False, test=False, chains=(), table="filter"):
+    """
+    Commit all rules for one address family with a single `<family>-restore --noflush` call.
+    The kernel applies the whole batch or nothing. With test=True the batch is only parsed.
+    Returns True on success.
+    """
+    if not rules and not chains:
+        return True
+    payload, line_map = render_restore_payload(rules, chains=chains, table=table)
+    cmd = [f"{family}-restore", "--noflush"] + (["--test"] if test else [])
+    if verbose:
+        print(f"[{family}] {'Checking' if test else 'Committing'} {len(rules)} rule(s) with {' '.join(cmd)}")
+    try:
+        result = subprocess.run(cmd, input=payload, capture_output=True, text=True)
+    except FileNotFoundError:
+        print(f"❌ {cmd[0]} not found.")
+        return False
+    if result.returncode != 0:
+        culprit = explain_restore_error(result.stderr, line_map)
+        print(f"❌ [{family}] Ruleset rejected, nothing was applied. Failed at {culprit}.")
+        if verbose and result.stderr:
+            print(result.stderr.strip())
+        return False
+    return True
+
+def jump_rule_exists(family, uid, table="filter"):
+    """Return True if OUTPUT already jumps to the UID's chain."""
+    args = build_jump_rule(uid)
+    args[0] = "-C"
+    try:
+        result = subprocess.run([family, "-t", table] + args, capture_output=True, text=True)
+    except FileNotFoundError:
+        return False
+    return result.returncode == 0
+
+def restore_ruleset(uid, ruleset, verbose=False):
+    """
+    Replace the contents of the UID's chain with a ruleset built by build_ruleset,
+    using one restore call per address family. The chain is created or flushed and
+    refilled in the same transaction, and the jump from OUTPUT is added if missing.
+    Every family is checked with --test before anything is committed, and if a later
+    family still fails to commit the earlier ones are rolled back.
+    """
+    chain = user_chain(uid)
+    snapshots = {family: read_installed_rules(family, uid) for family in FAMILIES}
+    batches = {}
+    for family in FAMILIES:
+        batches[family] = list(ruleset[family])
+        if not snapshots[family][1]:
+            batches[family].append((build_jump_rule(uid), chain))
+    for family in FAMILIES:
+        if not restore_rules(family, batches[family], verbose=verbose, test=True, chains=[chain]):
+            return False
+    return commit_families(uid, batches, snapshots, verbose=verbose, chains=[chain])
+
+def rollback_chain(family, uid, snapshot, verbose=False):
+    """
+    Put the UID's chain back the way read_installed_rules found it, in one restore call:
+    the saved rules are reloaded, and a chain or jump that did not exist before is removed.
+    Returns True on success.
+    """
+    chain = user_chain(uid)
+    chain_existed, had_jump, rules = snapshot
+    batch = [(tokens, chain) for tokens in rules]
+    if not had_jump:
+        batch.append((["-D"] + build_jump_rule(uid)[1:], chain))
+    if not chain_existed:
+        batch.append((["-X", chain], chain))
+    return restore_rules(family, batch, verbose=verbose, chains=[chain])
+
+def commit_families(uid, batches, snapshots, verbose=False, chains=()):
+    """
+    Commit each family's batch in turn. If a family fails, the families already committed
+    are rolled back to their snapshot (see read_installed_rules), so IPv4 and IPv6 never
+    end up with different rulesets. Returns True if every family was committed.
+    """
+    committed = []
+    for family in FAMILIES:
+        if restore_rules(family, batches[family], verbose=verbose, chains=chains):
+            committed.append(family)
+            continue
+        for done in committed:
+            if rollback_chain(done, uid, snapshots[done], verbose=verbose):
+                print(f"↩️  [{done}] Rolled back to the previous rules.")
+            else:
+                print(f"❌ [{done}] Could not roll back, the new rules are still installed.")
+        return False
+    return True
+
+def parse_save_output(text):
+    """
+    Parse `<family>-save` output into {table: {chain: [rule token lists]}}.
+    Every declared chain is present, with an empty list if it holds no rules.
+    """
+    tables = {}
+    chains = {}
+    for line in text.splitlines():
+        if line.startswith("*"):
+            chains = tables.setdefault(line[1:].strip(), {})
+        elif line.startswith(":"):
+            chains.setdefault(line[1:].split()[0], [])
+        elif line.startswith("-A "):
+            tokens = line.split()
+            chains.setdefault(tokens[1], []).append(tokens)
+    return tables
+
+def read_saved_tables(family, table=None):
+    """Read every table (or just `table`) with a single `<family>-save` call. Returns parse_save_output's result."""
+    cmd = [f"{family}-save"] + (["-t", table] if table else [])
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True)
+    except FileNotFoundError:
+        return {}
+    return parse_save_output(result.stdout)
+
+def read_installed_rules(family, uid):
+    """
+    Read the UID's installed rules with a single `<family>-save -t filter` call.
+    Returns (chain_exists, has_jump, rules) where rules are the chain's `-A` lines as token lists.
+    """
+    chain = user_chain(uid)
+    chains = read_saved_tables(family, "filter").get("filter", {})
+    has_jump = build_jump_rule(uid) in chains.get("OUTPUT", [])
+    return chain in chains, has_jump, chains.get(chain, [])
+
+def normalize_rule(args):
+    """
+    Return a comparable key for a rule, ignoring the differences between how rules
+    are written here and how iptables-save prints them (quoting, implicit protocol
+    matches, default string-match range and host prefixes).
+    """
+    tokens = [token.strip('"') for token in args]
+    key = []
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        following = tokens[i + 1] if i + 1 < len(tokens) else None
+        if (token == "-m" and following in ("tcp", "udp")) or (token == "--to" and following == "65535"):
+            i += 2
+            continue
+        if token in ("-d", "-s") and following:
+            try:
+                following = str(ipaddress.ip_network(following, strict=False))
+            except ValueError:
+                pass
+            key.extend([token, following])
+            i += 2
+            continue
+        key.append(token)
+        i += 1
+    return tuple(key)
+
+def diff_rules(desired, installed):
+    """
+    Compare desired rules ([(args, target)]) with installed rule token lists.
+    Returns (to_add, to_remove, unchanged); to_remove holds `-D` rules built from the installed lines.
+    """
+    wanted = Counter(normalize_rule(args) for args, _ in desired)
+    remaining = Counter(wanted)
+    to_remove = []
+    for tokens in installed:
+        key = normalize_rule(tokens)
+        if remaining[key] > 0:
+            remaining[key] -= 1
+        else:
+            to_remove.append((["-D"] + [token.strip('"') for token in tokens[1:]], tokens[1]))
+    to_add = []
+    for args, target in desired:
+        key = normalize_rule(args)
+        if remaining[key] > 0:
+            remaining[key] -= 1
+            to_add.append((args, target))
+    unchanged = sum(wanted.values()) - len(to_add)
+    return to_add, to_remove, unchanged
+
+def compute_ruleset_delta(uid, ruleset):
+    """
+    Compute per-family changes that turn the installed chain into the desired ruleset.
+    Returns {family: (changes, added, removed, unchanged)} or None if the chain is missing
+    for any family, in which case a full apply is needed.
+    """
+    delta = {}
+    for family in FAMILIES:
+        chain_exists, has_jump, installed = read_installed_rules(family, uid)
+        if not chain_exists:
+            return None
+        to_add, to_remove, unchanged = diff_rules(ruleset[family], installed)
+        changes = to_remove + to_add
+        if not has_jump:
+            changes.append((build_jump_rule(uid), user_chain(uid)))
+        delta[family] = (changes, len(to_add), len(to_remove), unchanged)
+    return delta
+
+def delta_totals(delta):
+    """Return (added, removed, unchanged) summed over all families of a delta."""
+    return tuple(sum(delta[family][i] for family in FAMILIES) for i in (1, 2, 3))
+
+def restore_ruleset_delta(uid, ruleset, verbose=False):
+    """
+    Bring the UID's chain in line with the desired ruleset by adding and removing only
+    the rules that differ, with one restore call per address family.
+    Returns (added, removed, unchanged) totals, or None if the update failed.
+    """
+    delta = compute_ruleset_delta(uid, ruleset)
+    if delta is None:
+        if not restore_ruleset(uid, ruleset, verbose=verbose):
+            return None
+        return sum(len(rules) for rules in ruleset.values()), 0, 0
+    for family in FAMILIES:
+        if not restore_rules(family, delta[family][0], verbose=verbose, test=True):
+            return None
+    # Only the families committed before the last one can need a rollback
+    snapshots = {family: read_installed_rules(family, uid) for family in FAMILIES[:-1]}
+    batches = {family: delta[family][0] for family in FAMILIES}
+    if not commit_families(uid, batches, snapshots, verbose=verbose):
+        return None
+    return delta_totals(delta)
+
+def ensure_chain_individually(family, uid):
+    """Create the UID's chain and jump rule with plain iptables calls (legacy backend)."""
+    subprocess.run([family, "-N", user_chain(uid)], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    if not jump_rule_exists(family, uid):
+        subprocess.run([family] + build_jump_rule(uid), check=True)
+
+def list_rules(family, table="filter"):
+    """Return the `<family> -t <table> -S` listing as a list of lines."""
+    try:
+        result = subprocess.run([family, "-t", table, "-S"], capture_output=True, text=True)
+    except FileNotFoundError:
+        return []
+    return result.stdout.splitlines()
+
+def is_owner_rule(line, uid):
+    """Return True if an OUTPUT rule from `-S` output matches the given UID (or group owner) as owner."""
+    tokens = line.split()
+    option, value = owner_match(uid)[:2]
+    if tokens[:2] != ["-A", "OUTPUT"] or option not in tokens:
+        return False
+    index = tokens.index(option) + 1
+    return index < len(tokens) and tokens[index] == value
+
+def remove_user_rules(family, uid, verbose=False, table="filter"):
+    """
+    Remove the UID's chain, its jump rule and any older owner rules for the UID in OUTPUT
+    with one listing and one restore call. Returns the number of OUTPUT rules removed,
+    or None if nothing was removed.
+    """
+    chain = user_chain(uid)
+    lines = list_rules(family, table=table)
+    rules = [(["-D"] + line.split()[1:], chain) for line in lines if is_owner_rule(line, uid)]
+    output_rules = len(rules)
+    if f"-N {chain}" in lines:
+        rules.append((["-F", chain], chain))
+        rules.append((["-X", chain], chain))
+    if not rules or not restore_rules(family, rules, verbose=verbose, table=table):
+        return None
+    return output_rules
+
+def restore_redirect(uid, port, verbose=False):
+    """
+    Point the UID's DNS traffic at the local stub resolver: the UID's nat-table chain is
+    created or flushed and refilled with the redirect rules, and jumped to from nat OUTPUT,
+    in one restore call per address family.
+    """
+    chain = user_chain(uid)
+    batches = {family: [] for family in FAMILIES}
+    for family, args in build_redirect_rules(uid, port):
+        batches[family].append((args, "DNS redirect"))
+    for family in FAMILIES:
+        if not jump_rule_exists(family, uid, table="nat"):
+            batches[family].append((build_jump_rule(uid), chain))
+    for family in FAMILIES:
+        if not restore_rules(family, batches[family], verbose=verbose, chains=[chain], table="nat"):
+            return False
+    return True
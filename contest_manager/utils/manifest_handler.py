@@ -0,0 +1,245 @@
+"""
+Restriction manifests for contest-manager
+
+Every time restrictions are applied, a small JSON manifest is written for the owner
+(UID or group owner): backend, number of rules, a hash of the ruleset, a hash of the
+cache it was built from and the time it was applied. `status` reads the manifests and
+compares them against one `<family>-save` listing per address family (plus one
+`ipset save` for the ipset backend and one `nft -j list table` for the nftables backend),
+so every restricted owner on a machine can be verified without a per-rule check.
+"""
+
+import json
+import time
+import hashlib
+import ipaddress
+from pathlib import Path
+
+from contest_manager.utils.binary_cache_handler import write_atomic
+from contest_manager.utils.iptables_handler import (
+    FAMILIES, user_chain, build_jump_rule, build_redirect_rules, normalize_rule, read_saved_tables
+)
+from contest_manager.utils.ipset_handler import user_set_names, read_ip_sets
+from contest_manager.utils.nftables_handler import (
+    read_table, table_objects, format_element, owner_jumps, is_group, dispatch_chain, group_members
+)
+
+MANIFEST_VERSION = 1
+ACTIVE = "active"
+DRIFTED = "drifted"
+MISSING = "missing"
+
+def file_digest(path):
+    """Return the sha256 of a file's contents, or None if it cannot be read."""
+    digest = hashlib.sha256()
+    try:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+    except OSError:
+        return None
+    return digest.hexdigest()
+
+def rules_digest(rules):
+    """
+    Return an order-independent hash of {family: [rule args]}. Rules are normalized the
+    same way as for delta updates, so rules read back from `<family>-save` hash equally.
+    """
+    keys = sorted(f"{family} {' '.join(normalize_rule(args))}" for family in FAMILIES for args in rules.get(family, []))
+    return hashlib.sha256("\n".join(keys).encode('utf-8')).hexdigest()
+
+def normalize_block(block):
+    """Return a comparable form of an address, CIDR block or address range."""
+    if '-' in block:
+        return block
+    try:
+        return str(ipaddress.ip_network(block, strict=False))
+    except ValueError:
+        return block
+
+def blocks_digest(blocks):
+    """Return an order-independent hash of CIDR blocks (the contents of ipsets or nftables sets)."""
+    keys = sorted(normalize_block(block) for block in blocks)
+    return hashlib.sha256("\n".join(keys).encode('utf-8')).hexdigest()
+
+def build_manifest(owner, user, group, uids, backend, rules, blocks, cache_path, stub_port=None, options=None):
+    """
+    Build the manifest for an applied restriction.
+    `rules` is the ruleset from build_ruleset as {family: [(args, target)]}, or None for the
+    nftables backend, whose ruleset is described by the set contents (`blocks`) instead.
+    `options` are the remaining apply options (widen threshold, cache format, shared cache) and
+    where the cache comes from (bundle path or DNS settings), recorded so the restriction can
+    be refreshed and re-applied the same way (see daemon_handler).
+    """
+    if rules is None:
+        rule_count = len(blocks)
+        ruleset_hash = blocks_digest(blocks)
+    else:
+        rule_args = {family: [args for args, _ in rules[family]] for family in FAMILIES}
+        rule_count = sum(len(family_rules) for family_rules in rule_args.values())
+        ruleset_hash = rules_digest(rule_args)
+    return {
+        "version": MANIFEST_VERSION,
+        "owner": str(owner),
+        "user": user,
+        "group": group,
+        "uids": list(uids),
+        "backend": backend,
+        "chain": user_chain(owner),
+        "rule_count": rule_count,
+        "ruleset_hash": ruleset_hash,
+        "blocks": len(blocks),
+        "blocks_hash": blocks_digest(blocks),
+        "cache_path": str(cache_path),
+        "cache_hash": file_digest(cache_path),
+        "stub_port": stub_port,
+        "options": dict(options or {}),
+        "applied_at": int(time.time()),
+    }
+
+def save_manifest(path, manifest):
+    """Atomically write a manifest as JSON."""
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    write_atomic(path, json.dumps(manifest, indent=2).encode('utf-8'))
+
+def load_manifest(path):
+    """Load a manifest. Returns None if it is missing, unreadable or of another version."""
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return manifest if manifest.get("version") == MANIFEST_VERSION else None
+
+def load_manifests(manifest_dir):
+    """Load every manifest in a directory, ordered by owner."""
+    manifests = [load_manifest(path) for path in sorted(Path(manifest_dir).glob("*.json"))]
+    return [manifest for manifest in manifests if manifest]
+
+def remove_manifest(path):
+    """Delete a manifest if it exists."""
+    try:
+        Path(path).unlink()
+    except FileNotFoundError:
+        pass
+
+def read_installed_state(manifests):
+    """
+    Read everything needed to verify `manifests`: one `<family>-save` call per address
+    family, plus one `ipset save` if any manifest uses the ipset backend and one nft
+    listing if any uses the nftables backend.
+    """
+    state = {family: read_saved_tables(family) for family in FAMILIES}
+    state["ipset"] = read_ip_sets() if any(m["backend"] == "ipset" for m in manifests) else {}
+    state["nftables"] = read_table() if any(m["backend"] == "nftables" for m in manifests) else []
+    return state
+
+def verify_iptables(manifest, state):
+    """Return the list of differences between a manifest and the installed iptables/ip6tables rules."""
+    owner = manifest["owner"]
+    chain = manifest["chain"]
+    problems = []
+    installed = {}
+    for family in FAMILIES:
+        filter_chains = state[family].get("filter", {})
+        if chain not in filter_chains:
+            problems.append(f"[{family}] chain {chain} missing")
+        elif build_jump_rule(owner) not in filter_chains.get("OUTPUT", []):
+            problems.append(f"[{family}] OUTPUT jump to {chain} missing")
+        installed[family] = filter_chains.get(chain, [])
+    if problems:
+        return problems
+    rule_count = sum(len(rules) for rules in installed.values())
+    if rule_count != manifest["rule_count"]:
+        problems.append(f"{rule_count} rule(s) installed, {manifest['rule_count']} expected")
+    elif rules_digest(installed) != manifest["ruleset_hash"]:
+        problems.append("installed rules differ from the applied ruleset")
+    return problems
+
+def verify_ip_sets(manifest, state):
+    """Return the list of differences between a manifest and the members of the owner's ipsets."""
+    problems = []
+    members = []
+    for name in user_set_names(manifest["owner"]).values():
+        if name not in state["ipset"]:
+            problems.append(f"[ipset] set {name} missing")
+        members.extend(state["ipset"].get(name, []))
+    if problems or "blocks_hash" not in manifest:
+        return problems
+    if len(members) != manifest["blocks"]:
+        problems.append(f"{len(members)} set member(s) installed, {manifest['blocks']} expected")
+    elif blocks_digest(members) != manifest["blocks_hash"]:
+        problems.append("installed set members differ from the applied blocks")
+    return problems
+
+def verify_nftables(manifest, state):
+    """Return the list of differences between a manifest and the installed nftables ruleset."""
+    chain = manifest["chain"]
+    if chain not in table_objects(state["nftables"], "chain"):
+        return [f"[nftables] chain {chain} missing"]
+    problems = []
+    if is_group(manifest["owner"]):
+        if dispatch_chain(manifest["owner"]) not in table_objects(state["nftables"], "chain"):
+            problems.append(f"[nftables] chain {dispatch_chain(manifest['owner'])} missing")
+        members = set(group_members(state["nftables"], manifest["owner"]))
+        unmapped = [uid for uid in manifest["uids"] if uid not in members]
+    else:
+        jumps = owner_jumps(state["nftables"])
+        unmapped = [uid for uid in manifest["uids"] if jumps.get(uid) != chain]
+    if unmapped:
+        problems.append(f"[nftables] {len(unmapped)} UID(s) not mapped to {chain}")
+    sets = table_objects(state["nftables"], "set")
+    elements = [format_element(element) for name in user_set_names(manifest["owner"]).values()
+                for element in sets.get(name, {}).get("elem", [])]
+    if len(elements) != manifest["rule_count"]:
+        problems.append(f"{len(elements)} set element(s) installed, {manifest['rule_count']} expected")
+    elif blocks_digest(elements) != manifest["ruleset_hash"]:
+        problems.append("installed set elements differ from the applied blocks")
+    return problems
+
+def verify_redirect(manifest, state):
+    """Return the list of differences between a manifest's stub resolver redirect and the nat table."""
+    owner = manifest["owner"]
+    chain = manifest["chain"]
+    problems = []
+    for family, args in build_redirect_rules(owner, manifest["stub_port"]):
+        nat_chains = state[family].get("nat", {})
+        if normalize_rule(args) not in {normalize_rule(rule) for rule in nat_chains.get(chain, [])}:
+            problems.append(f"[{family}] DNS redirect rule missing")
+        elif build_jump_rule(owner) not in nat_chains.get("OUTPUT", []):
+            problems.append(f"[{family}] nat OUTPUT jump to {chain} missing")
+    return sorted(set(problems))
+
+def chain_installed(manifest, state):
+    """Return True if the owner's chain exists in any address family (or in the nftables table)."""
+    if manifest["backend"] == "nftables":
+        return manifest["chain"] in table_objects(state["nftables"], "chain")
+    return any(manifest["chain"] in state[family].get("filter", {}) for family in FAMILIES)
+
+def verify_manifest(manifest, state):
+    """
+    Compare a manifest with the installed state from read_installed_state.
+    Returns a report dict: status (ACTIVE, DRIFTED or MISSING), problems, and whether the
+    cache has changed since the restriction was applied.
+    """
+    if manifest["backend"] == "nftables":
+        problems = verify_nftables(manifest, state)
+    else:
+        problems = verify_iptables(manifest, state)
+        if manifest["backend"] == "ipset":
+            problems.extend(verify_ip_sets(manifest, state))
+    if manifest.get("stub_port"):
+        problems.extend(verify_redirect(manifest, state))
+    if not chain_installed(manifest, state):
+        status = MISSING
+    elif problems:
+        status = DRIFTED
+    else:
+        status = ACTIVE
+    report = {key: manifest[key] for key in ("owner", "user", "group", "uids", "backend", "rule_count", "applied_at", "stub_port")}
+    report.update({
+        "status": status,
+        "problems": problems,
+        "cache_current": file_digest(manifest["cache_path"]) == manifest["cache_hash"],
+    })
+    return report
@@ -0,0 +1,237 @@
+"""
+nftables ruleset utilities for contest-manager
+
+All restrictions live in one `inet contest` table. Its output base chain holds a single
+rule that dispatches on the socket owner's UID through the `owners` verdict map to a
+chain per restricted user (named like the iptables chains). A restricted group gets its
+own output base chain instead, jumping to the group's chain for sockets whose GID is the
+group (`meta skgid`) or whose UID is in the group's member set. Every base chain sees each
+packet, so a user restricted both alone and through groups goes through all their chains.
+Each restriction chain drops traffic to two interval sets holding the owner's IPv4 and
+IPv6 blocks.
+Restricting, updating and unrestricting are each one `nft -f` transaction, so the
+kernel switches from the old ruleset to the new one atomically.
+"""
+
+import pwd
+import json
+import ipaddress
+import subprocess
+
+from contest_manager.utils.iptables_handler import user_chain
+from contest_manager.utils.ipset_handler import user_set_names, split_by_family
+
+NFT_FAMILY = "inet"
+NFT_TABLE = "contest"
+OWNER_MAP = "owners"
+SET_TYPES = {"iptables": "ipv4_addr", "ip6tables": "ipv6_addr"}
+SET_MATCHES = {"iptables": "ip daddr", "ip6tables": "ip6 daddr"}
+ELEMENTS_PER_LINE = 1000
+
+def run_nft(args, payload=None, verbose=False):
+    """Run nft with the given arguments (and script on stdin). Returns the CompletedProcess or None if nft is missing."""
+    cmd = ["nft"] + args
+    try:
+        result = subprocess.run(cmd, input=payload, capture_output=True, text=True)
+    except FileNotFoundError:
+        print("❌ nft not found. Install the nftables package.")
+        return None
+    if result.returncode != 0 and verbose and result.stderr:
+        print(result.stderr.strip())
+    return result
+
+def read_table():
+    """
+    Read the contest table with a single `nft -j list table` call.
+    Returns the list of JSON objects it holds, or an empty list if the table does not exist.
+    """
+    try:
+        result = subprocess.run(["nft", "-j", "list", "table", NFT_FAMILY, NFT_TABLE], capture_output=True, text=True)
+    except FileNotFoundError:
+        return []
+    if result.returncode != 0:
+        return []
+    try:
+        return json.loads(result.stdout).get("nftables", [])
+    except ValueError:
+        return []
+
+def table_objects(state, kind):
+    """Return the {name: object} of one kind ("chain", "set", "map") from read_table output."""
+    return {item[kind]["name"]: item[kind] for item in state if kind in item}
+
+def format_element(element):
+    """Convert a set element from nft JSON (address, prefix or range) to the form used in the blocklist."""
+    if isinstance(element, dict) and "prefix" in element:
+        network = ipaddress.ip_network(f"{element['prefix']['addr']}/{element['prefix']['len']}", strict=False)
+        return str(network.network_address) if network.num_addresses == 1 else str(network)
+    if isinstance(element, dict) and "range" in element:
+        return "-".join(element["range"])
+    if isinstance(element, dict) and "elem" in element:
+        return format_element(element["elem"]["val"])
+    return str(element)
+
+def is_group(uid):
+    """Return True for a group owner (see iptables_handler.group_owner)."""
+    return str(uid).startswith("g")
+
+def dispatch_chain(uid):
+    """Return the name of a group owner's output base chain."""
+    return f"{user_chain(uid)}-OUTPUT"
+
+def member_set_name(uid):
+    """Return the name of the set holding a group owner's member UIDs."""
+    return f"contest-{uid}-uids"
+
+def uid_value(key):
+    """Convert a UID from nft JSON, printed as a number or a user name, to an int (None if unknown)."""
+    try:
+        return int(key)
+    except (TypeError, ValueError):
+        pass
+    try:
+        return pwd.getpwnam(str(key)).pw_uid
+    except KeyError:
+        return None
+
+def owner_jumps(state):
+    """Return {uid: chain} for the elements of the owners verdict map (user restrictions)."""
+    jumps = {}
+    owners = table_objects(state, "map").get(OWNER_MAP, {})
+    for key, verdict in owners.get("elem", []):
+        if isinstance(verdict, dict) and "jump" in verdict and uid_value(key) is not None:
+            jumps[uid_value(key)] = verdict["jump"]["target"]
+    return jumps
+
+def group_members(state, uid):
+    """Return the UIDs in a group owner's member set."""
+    members = table_objects(state, "set").get(member_set_name(uid), {}).get("elem", [])
+    return [value for value in (uid_value(format_element(member)) for member in members) if value is not None]
+
+def render_apply_payload(uid, uids, blocks, state=()):
+    """
+    Render the nft script that (re)installs an owner's chain and address sets and sends
+    the owner's traffic to it: a user's UID is mapped to it in the owners map, a group's
+    GID and member UIDs (`uids`) are matched by the group's base chain. Existing sets and
+    chains are flushed and refilled in the same transaction; owners map entries that point
+    to the chain but are no longer wanted are removed.
+    """
+    chain = user_chain(uid)
+    set_names = user_set_names(uid)
+    entries = split_by_family(blocks)
+    lines = [
+        f"table {NFT_FAMILY} {NFT_TABLE} {{",
+        f"    map {OWNER_MAP} {{ type uid : verdict; }}",
+        "    chain output { type filter hook output priority 0; policy accept; }",
+        "}",
+        f"flush chain {NFT_FAMILY} {NFT_TABLE} output",
+        f"add rule {NFT_FAMILY} {NFT_TABLE} output meta skuid vmap @{OWNER_MAP}",
+        f"add chain {NFT_FAMILY} {NFT_TABLE} {chain}",
+        f"flush chain {NFT_FAMILY} {NFT_TABLE} {chain}",
+    ]
+    for family, name in set_names.items():
+        lines.append(f"add set {NFT_FAMILY} {NFT_TABLE} {name} {{ type {SET_TYPES[family]}; flags interval; }}")
+        lines.append(f"flush set {NFT_FAMILY} {NFT_TABLE} {name}")
+        for start in range(0, len(entries[family]), ELEMENTS_PER_LINE):
+            chunk = entries[family][start:start + ELEMENTS_PER_LINE]
+            lines.append(f"add element {NFT_FAMILY} {NFT_TABLE} {name} {{ {', '.join(chunk)} }}")
+        lines.append(f"add rule {NFT_FAMILY} {NFT_TABLE} {chain} {SET_MATCHES[family]} @{name} drop")
+    group = is_group(uid)
+    # Group members mapped by earlier versions are dispatched by the group's base chain now
+    stale = [key for key, target in owner_jumps(state).items() if target == chain and (group or key not in uids)]
+    if stale:
+        lines.append(f"delete element {NFT_FAMILY} {NFT_TABLE} {OWNER_MAP} {{ {', '.join(str(key) for key in stale)} }}")
+    if not group:
+        if uids:
+            lines.append(f"add element {NFT_FAMILY} {NFT_TABLE} {OWNER_MAP} {{ {', '.join(f'{key} : jump {chain}' for key in uids)} }}")
+        return "\n".join(lines) + "\n"
+    dispatch = dispatch_chain(uid)
+    members = member_set_name(uid)
+    lines.extend([
+        f"add set {NFT_FAMILY} {NFT_TABLE} {members} {{ type uid; }}",
+        f"flush set {NFT_FAMILY} {NFT_TABLE} {members}",
+    ])
+    if uids:
+        lines.append(f"add element {NFT_FAMILY} {NFT_TABLE} {members} {{ {', '.join(str(key) for key in uids)} }}")
+    lines.extend([
+        f"add chain {NFT_FAMILY} {NFT_TABLE} {dispatch} {{ type filter hook output priority 0; policy accept; }}",
+        f"flush chain {NFT_FAMILY} {NFT_TABLE} {dispatch}",
+        f"add rule {NFT_FAMILY} {NFT_TABLE} {dispatch} meta skgid {str(uid)[1:]} jump {chain}",
+        f"add rule {NFT_FAMILY} {NFT_TABLE} {dispatch} meta skuid @{members} jump {chain}",
+    ])
+    return "\n".join(lines) + "\n"
+
+def apply_ruleset(uid, uids, blocks, verbose=False):
+    """
+    Install the blocklist for an owner with one nft transaction.
+    `uid` is the UID or group owner (see iptables_handler.group_owner) naming the chain and
+    sets; `uids` are the UIDs whose traffic goes through it (a group's members, matched
+    in addition to its GID).
+    Returns (added, removed, unchanged) set element counts, or None if nft rejected the ruleset.
+    """
+    state = read_table()
+    sets = table_objects(state, "set")
+    installed = set()
+    for name in user_set_names(uid).values():
+        installed.update(format_element(element) for element in sets.get(name, {}).get("elem", []))
+    payload = render_apply_payload(uid, uids, blocks, state)
+    if verbose:
+        print(f"[nft] Committing {len(blocks)} block(s) for {len(uids)} UID(s) with nft -f -")
+    result = run_nft(["-f", "-"], payload, verbose=verbose)
+    if result is None:
+        return None
+    if result.returncode != 0:
+        print("❌ [nft] Ruleset rejected, nothing was applied.")
+        return None
+    wanted = set(blocks)
+    return len(wanted - installed), len(installed - wanted), len(wanted & installed)
+
+def render_remove_payload(uid, state):
+    """
+    Render the nft script that removes an owner's chain, sets and owner map entries (and a
+    group's base chain and member set). Returns None if nothing is installed.
+    """
+    chain = user_chain(uid)
+    chains = table_objects(state, "chain")
+    sets = table_objects(state, "set")
+    lines = []
+    mapped = [key for key, target in owner_jumps(state).items() if target == chain]
+    if mapped:
+        lines.append(f"delete element {NFT_FAMILY} {NFT_TABLE} {OWNER_MAP} {{ {', '.join(str(key) for key in mapped)} }}")
+    for name in (dispatch_chain(uid), chain):
+        if name in chains:
+            lines.append(f"flush chain {NFT_FAMILY} {NFT_TABLE} {name}")
+            lines.append(f"delete chain {NFT_FAMILY} {NFT_TABLE} {name}")
+    names = list(user_set_names(uid).values()) + [member_set_name(uid)]
+    lines.extend(f"delete set {NFT_FAMILY} {NFT_TABLE} {name}" for name in names if name in sets)
+    return "\n".join(lines) + "\n" if lines else None
+
+def remove_ruleset(uid, verbose=False):
+    """
+    Remove an owner's chain, sets and owner map entries with one read and one nft transaction.
+    Returns the number of UIDs unmapped, or None if nothing was removed.
+    """
+    state = read_table()
+    payload = render_remove_payload(uid, state)
+    if payload is None:
+        return None
+    result = run_nft(["-f", "-"], payload, verbose=verbose)
+    if result is None or result.returncode != 0:
+        print("❌ [nft] Could not remove the ruleset.")
+        return None
+    chain = user_chain(uid)
+    return sum(1 for target in owner_jumps(state).values() if target == chain) + len(group_members(state, uid))
+
+def restricted_uids(state=None):
+    """
+    Return {uid: chain} for every UID currently dispatched to a restriction chain, through
+    the owners map or a group's member set (the user's own chain wins if both apply).
+    """
+    state = read_table() if state is None else state
+    jumps = {}
+    for name in table_objects(state, "set"):
+        if name.startswith("contest-g") and name.endswith("-uids"):
+            owner = name[len("contest-"):-len("-uids")]
+            jumps.update(dict.fromkeys(group_members(state, owner), user_chain(owner)))
+    jumps.update(owner_jumps(state))
+    return jumps
@@ -0,0 +1,323 @@
+"""
+Offline package bundles for contest-manager
+
+`bundle build` downloads everything `setup` installs into one directory, so a whole lab
+can be provisioned from a USB drive or file share instead of every PC downloading the
+same packages over the venue uplink:
+
+    <dir>/bundle.json              manifest (what is in the bundle, how to install it and the sha256 of every file)
+    <dir>/apt/*.deb, Packages      flat apt repository with the packages and their dependencies
+    <dir>/snap/*.snap, *.assert    snaps, their bases and their assertions
+    <dir>/flatpak/*.flatpak        single-file bundles of the apps and their runtimes
+    <dir>/vscode/*.vsix            VS Code extensions
+
+Build the bundle on a machine running the same release as the lab PCs, with the package
+sources of `setup` (PPAs included) configured. `setup --bundle <dir>` then installs from
+the directory without network access, after checking every file against its checksum.
+"""
+
+import json
+import time
+import shutil
+import tempfile
+import subprocess
+import urllib.request
+from pathlib import Path
+
+from contest_manager.utils.binary_cache_handler import write_atomic
+from contest_manager.utils.manifest_handler import file_digest
+from contest_manager.utils.software_installer import read_apt_packages, read_package_lines, snap_name, flatpak_id
+from contest_manager.utils.vscode_extensions_handler import read_extensions
+
+PACKAGE_BUNDLE_FORMAT = "contest-manager-packages"
+PACKAGE_BUNDLE_VERSION = 1
+MANIFEST_NAME = "bundle.json"
+# Always bundled so that setup can enable snap and flatpak on a machine without them
+BOOTSTRAP_APT_PACKAGES = ["snapd", "flatpak"]
+FLATPAK_SYSTEM_REPO = "/var/lib/flatpak/repo"
+MARKETPLACE_VSIX_URL = (
+    "https://marketplace.visualstudio.com/_apis/public/gallery/publishers/{publisher}/vsextensions/{name}/latest/vspackage"
+)
+VSIX_TARGET_PLATFORM = "linux-x64"
+DOWNLOAD_TIMEOUT = 120
+
+class PackageBundleError(ValueError):
+    """Raised when a directory does not hold a package bundle of a supported version or a file fails its checksum."""
+
+def load_package_bundle(bundle_dir, verify=True):
+    """
+    Read and check the manifest of a package bundle and, with verify, the checksum of every
+    file it lists. Raises PackageBundleError if it is missing, invalid or incomplete.
+    """
+    manifest_path = Path(bundle_dir) / MANIFEST_NAME
+    try:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        raise PackageBundleError(f"{manifest_path} not found, run `contest-manager bundle build` first")
+    except ValueError:
+        raise PackageBundleError(f"{manifest_path} is not valid JSON")
+    if not isinstance(manifest, dict) or manifest.get("format") != PACKAGE_BUNDLE_FORMAT:
+        raise PackageBundleError(f"{bundle_dir} is not a contest-manager package bundle")
+    if manifest.get("version") != PACKAGE_BUNDLE_VERSION:
+        raise PackageBundleError(f"unsupported package bundle version {manifest.get('version')} (expected {PACKAGE_BUNDLE_VERSION})")
+    if not isinstance(manifest.get("files"), dict):
+        raise PackageBundleError(f"{manifest_path} has no file checksums, rebuild the bundle with `contest-manager bundle build`")
+    if verify:
+        verify_package_bundle(bundle_dir, manifest)
+    return manifest
+
+def bundle_checksums(bundle_dir):
+    """Return {path relative to the bundle: sha256} for every file of a bundle but its manifest."""
+    bundle_dir = Path(bundle_dir)
+    return {
+        path.relative_to(bundle_dir).as_posix(): file_digest(path)
+        for path in sorted(bundle_dir.rglob('*')) if path.is_file() and path.relative_to(bundle_dir).as_posix() != MANIFEST_NAME
+    }
+
+def verify_package_bundle(bundle_dir, manifest):
+    """Check every file listed in the manifest against its sha256. Raises PackageBundleError on the first mismatch."""
+    for name, digest in manifest["files"].items():
+        actual = file_digest(Path(bundle_dir) / name)
+        if actual is None:
+            raise PackageBundleError(f"{name} is missing from the bundle, copy it again")
+        if actual != digest:
+            raise PackageBundleError(f"checksum mismatch for {name}, the bundle is truncated or corrupted")
+
+def save_package_bundle(bundle_dir, manifest):
+    write_atomic(Path(bundle_dir) / MANIFEST_NAME, json.dumps(manifest, indent=2).encode('utf-8'))
+
+# --- apt -------------------------------------------------------------------------------------
+
+def apt_dependency_closure(pkgs):
+    """Return pkgs and every package they depend on, recursively, as apt-get download names."""
+    result = subprocess.run(
+        ['apt-cache', 'depends', '--recurse', '--no-recommends', '--no-suggests', '--no-conflicts',
+         '--no-breaks', '--no-replaces', '--no-enhances'] + list(pkgs),
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+    )
+    # Top-level lines name real packages; indented lines are dependency edges and <name> are virtual
+    names = {line.strip() for line in result.stdout.splitlines() if line and not line[0].isspace() and not line.startswith('<')}
+    return sorted(names)
+
+def write_apt_index(apt_dir):
+    """Write the Packages index of a flat repository. Returns True on success."""
+    for cmd in (['dpkg-scanpackages', '--multiversion', '.', '/dev/null'], ['apt-ftparchive', 'packages', '.']):
+        try:
+            result = subprocess.run(cmd, cwd=str(apt_dir), stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        except OSError:
+            continue
+        if result.returncode == 0:
+            write_atomic(Path(apt_dir) / 'Packages', result.stdout.encode('utf-8'))
+            return True
+    return False
+
+def bundle_apt(apt_file, apt_dir, verbose=False):
+    """Download the apt.txt packages with all their dependencies into a flat repository. Returns (packages, failed)."""
+    pkgs = read_apt_packages(apt_file) if Path(apt_file).exists() else []
+    pkgs += [pkg for pkg in BOOTSTRAP_APT_PACKAGES if pkg not in pkgs]
+    names = apt_dependency_closure(pkgs)
+    print(f"[bundle] 📦 Downloading {len(names)} .deb file(s) for {len(pkgs)} apt package(s)...")
+    apt_dir.mkdir(parents=True, exist_ok=True)
+    failed = []
+    result = subprocess.run(['apt-get', 'download'] + names, cwd=str(apt_dir), stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    if result.returncode != 0:
+        # One unavailable package fails the whole download: retry the rest one by one
+        for name in names:
+            if subprocess.run(['apt-get', 'download', name], cwd=str(apt_dir), stdout=subprocess.DEVNULL,
+                              stderr=subprocess.DEVNULL).returncode != 0:
+                failed.append(name)
+    if verbose and failed:
+        print(f"[bundle] apt-get download failed for: {' '.join(failed)}")
+    if not write_apt_index(apt_dir):
+        print("[bundle] ❌ Could not index the apt repository (install dpkg-dev or apt-utils)")
+        return pkgs, failed + ['Packages']
+    return pkgs, failed
+
+# --- snap ------------------------------------------------------------------------------------
+
+def snap_base(snap_path):
+    """Return the base snap a .snap file needs, read from its meta/snap.yaml, or None if unknown."""
+    try:
+        result = subprocess.run(['unsquashfs', '-cat', str(snap_path), 'meta/snap.yaml'],
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    except OSError:
+        return None
+    if result.returncode != 0:
+        return None
+    snap_type = "app"
+    for line in result.stdout.splitlines():
+        key, _, value = line.partition(':')
+        if key == 'base':
+            return value.strip()
+        if key == 'type':
+            snap_type = value.strip()
+    # Snaps without a base run on core, except bases, snapd and the like themselves
+    return "core" if snap_type == "app" else None
+
+def download_snap(name, snap_dir, channel=None):
+    """Download a snap and its assertion. Returns {"file", "assert"} relative to the bundle, or None."""
+    cmd = ['snap', 'download', name] + ([f'--channel={channel}'] if channel else [])
+    if subprocess.run(cmd, cwd=str(snap_dir), stdout=subprocess.PIPE, stderr=subprocess.PIPE).returncode != 0:
+        return None
+    snaps = sorted(snap_dir.glob(f"{name}_*.snap"), key=lambda path: path.stat().st_mtime)
+    if not snaps or not snaps[-1].with_suffix('.assert').exists():
+        return None
+    return {"file": f"snap/{snaps[-1].name}", "assert": f"snap/{snaps[-1].with_suffix('.assert').name}"}
+
+def bundle_snaps(snap_file, snap_dir):
+    """Download the snap.txt snaps and the bases they need. Returns (entries, failed); bases come first."""
+    snap_dir.mkdir(parents=True, exist_ok=True)
+    entries = []
+    failed = []
+    bases = []
+    for line in read_package_lines(snap_file) if Path(snap_file).exists() else []:
+        name = snap_name(line)
+        args = line.split()
+        channel = next((arg.split('=', 1)[1] for arg in args if arg.startswith('--channel=')), None)
+        print(f"[bundle] 📦 Downloading snap: {name}")
+        files = download_snap(name, snap_dir, channel)
+        if files is None:
+            failed.append(name)
+            continue
+        options = [arg for arg in args if arg.startswith('-') and not arg.startswith('--channel')]
+        entries.append(dict(files, name=name, options=options))
+        base = snap_base(Path(snap_dir).parent / files["file"])
+        if base and base not in bases:
+            bases.append(base)
+    base_entries = []
+    for base in bases:
+        print(f"[bundle] 📦 Downloading base snap: {base}")
+        files = download_snap(base, snap_dir)
+        if files is None:
+            failed.append(base)
+            continue
+        base_entries.append(dict(files, name=base, options=[]))
+    return base_entries + entries, failed
+
+# --- flatpak ---------------------------------------------------------------------------------
+
+def flatpak_runtime(app_id):
+    """Return the runtime ref (id/arch/branch) of an installed flatpak app, or None."""
+    result = subprocess.run(['flatpak', 'info', '--show-runtime', app_id], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    ref = result.stdout.strip()
+    return ref if result.returncode == 0 and ref.count('/') == 2 else None
+
+def build_flatpak_bundle(flatpak_dir, ref_id, runtime=False, arch=None, branch=None):
+    """Export an installed app or runtime from the system repo as a single-file bundle. Returns its bundle path or None."""
+    file_name = f"{ref_id}.flatpak"
+    cmd = ['flatpak', 'build-bundle'] + (['--runtime'] if runtime else []) + ([f'--arch={arch}'] if arch else [])
+    cmd += [FLATPAK_SYSTEM_REPO, str(flatpak_dir / file_name), ref_id] + ([branch] if branch else [])
+    if subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE).returncode != 0:
+        return None
+    return f"flatpak/{file_name}"
+
+def bundle_flatpaks(flatpak_file, flatpak_dir):
+    """
+    Export the flatpak.txt apps and their runtimes as bundles, installing an app first if it
+    is missing on this machine. Returns (entries, failed); runtimes come first.
+    """
+    flatpak_dir.mkdir(parents=True, exist_ok=True)
+    apps = []
+    runtimes = []
+    failed = []
+    for line in read_package_lines(flatpak_file) if Path(flatpak_file).exists() else []:
+        app_id = flatpak_id(line)
+        print(f"[bundle] 📦 Exporting flatpak: {app_id}")
+        subprocess.run(['flatpak', 'install', '-y'] + line.split(), stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        path = build_flatpak_bundle(flatpak_dir, app_id)
+        if path is None:
+            failed.append(app_id)
+            continue
+        apps.append({"id": app_id, "file": path, "runtime": False})
+        runtime = flatpak_runtime(app_id)
+        if runtime and all(entry["ref"] != runtime for entry in runtimes):
+            runtime_id, arch, branch = runtime.split('/')
+            path = build_flatpak_bundle(flatpak_dir, runtime_id, runtime=True, arch=arch, branch=branch)
+            if path is None:
+                failed.append(runtime)
+            else:
+                runtimes.append({"id": runtime_id, "ref": runtime, "file": path, "runtime": True})
+    return runtimes + apps, failed
+
+# --- VS Code ---------------------------------------------------------------------------------
+
+def download_vsix(ext_id, vscode_dir):
+    """Download an extension from the VS Code Marketplace. Returns its bundle path or None."""
+    publisher, _, name = ext_id.partition('.')
+    url = MARKETPLACE_VSIX_URL.format(publisher=publisher, name=name) + f"?targetPlatform={VSIX_TARGET_PLATFORM}"
+    target = vscode_dir / f"{ext_id}.vsix"
+    try:
+        with urllib.request.urlopen(url, timeout=DOWNLOAD_TIMEOUT) as response, \
+                tempfile.NamedTemporaryFile(dir=str(vscode_dir), delete=False) as tmp:
+            shutil.copyfileobj(response, tmp)
+    except OSError:
+        return None
+    Path(tmp.name).replace(target)
+    return f"vscode/{target.name}"
+
+def bundle_vscode_extensions(ext_file, vscode_dir):
+    """Download the vscode-extensions.txt extensions as VSIX files. Returns (entries, failed)."""
+    vscode_dir.mkdir(parents=True, exist_ok=True)
+    entries = []
+    failed = []
+    for ext_id in read_extensions(ext_file):
+        print(f"[bundle] 📦 Downloading extension: {ext_id}")
+        path = download_vsix(ext_id, vscode_dir)
+        if path is None:
+            failed.append(ext_id)
+        else:
+            entries.append({"id": ext_id, "file": path})
+    return entries, failed
+
+# --- bundle ----------------------------------------------------------------------------------
+
+def build_package_bundle(config_dir, bundle_dir, verbose=False):
+    """
+    Download everything listed in config_dir into bundle_dir and write its manifest.
+    Returns the manifest; its "failed" entry lists what could not be bundled.
+    """
+    config_dir = Path(config_dir)
+    bundle_dir = Path(bundle_dir)
+    bundle_dir.mkdir(parents=True, exist_ok=True)
+    apt, apt_failed = bundle_apt(config_dir / 'apt.txt', bundle_dir / 'apt', verbose=verbose)
+    snaps, snap_failed = bundle_snaps(config_dir / 'snap.txt', bundle_dir / 'snap')
+    flatpaks, flatpak_failed = bundle_flatpaks(config_dir / 'flatpak.txt', bundle_dir / 'flatpak')
+    extensions, vscode_failed = bundle_vscode_extensions(config_dir / 'vscode-extensions.txt', bundle_dir / 'vscode')
+    manifest = {
+        "format": PACKAGE_BUNDLE_FORMAT,
+        "version": PACKAGE_BUNDLE_VERSION,
+        "created_at": int(time.time()),
+        "apt": apt,
+        "snaps": snaps,
+        "flatpaks": flatpaks,
+        "vscode": extensions,
+        "failed": {"apt": apt_failed, "snap": snap_failed, "flatpak": flatpak_failed, "vscode": vscode_failed},
+        "files": bundle_checksums(bundle_dir),
+    }
+    save_package_bundle(bundle_dir, manifest)
+    return manifest
+
+def write_bundle_apt_config(bundle_dir):
+    """
+    Write an apt configuration that reads packages only from the bundle's repository, with its
+    own package lists and no cache files so the system's lists and caches are left untouched.
+    Returns the path to export as APT_CONFIG.
+    """
+    state_dir = Path(tempfile.mkdtemp(prefix="contest-apt-"))
+    (state_dir / 'lists' / 'partial').mkdir(parents=True)
+    (state_dir / 'sources.list.d').mkdir()
+    (state_dir / 'sources.list').write_text(f"deb [trusted=yes] file:{Path(bundle_dir, 'apt').resolve()} ./\n")
+    config = state_dir / 'apt.conf'
+    config.write_text(
+        f'Dir::Etc::SourceList "{state_dir / "sources.list"}";\n'
+        f'Dir::Etc::SourceParts "{state_dir / "sources.list.d"}";\n'
+        f'Dir::State::Lists "{state_dir / "lists"}";\n'
+        'Dir::Cache::pkgcache "";\n'
+        'Dir::Cache::srcpkgcache "";\n'
+        'APT::Get::List-Cleanup "false";\n'
+        # The only source is the local, trusted bundle, which the unprivileged _apt user
+        # often cannot read (a USB drive or a copy made with a private umask)
+        'APT::Sandbox::User "root";\n'
+    )
+    return str(config)
@@ -75,4 +75,13 @@ def setup_package_sources(apt_txt):
     add_ppas(ppas)
     update_apt_repos()
     ensure_snap()
-    ensure_flatpak()
\ No newline at end of file
+    ensure_flatpak()
+
+def setup_bundle_sources():
+    """
+    Prepare package installs from an offline package bundle: refresh the apt lists of the
+    bundle repository (APT_CONFIG must point at write_bundle_apt_config) and enable snap and flatpak.
+    """
+    update_apt_repos()
+    ensure_snap()
+    ensure_flatpak()
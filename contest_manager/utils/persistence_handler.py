@@ -1,83 +1,96 @@
 import subprocess
 from pathlib import Path
 
-def start_persistence(user):
+def start_persistence(user, options=(), name=None, update_timer=True):
     """
     Set up systemd service and timer to persist contest restrictions for the given user.
     Uses global contest-manager CLI commands for start-restriction and update-restriction.
+    `options` (e.g. the firewall backend) are passed on to both commands.
+    The units are named after `name` if given (e.g. "group-contest"), otherwise after the user.
+    With update_timer=False only the boot service is installed (the daemon keeps the rules up to date).
     """
+    extra_opts = "".join(f" {option}" for option in options)
+    unit = name or user
+    label = name or f"user {user}"
     systemd_dir = Path('/etc/systemd/system')
     cli_cmd = 'contest-manager'
 
     # Service to run start-restriction at boot
     start_service = f"""
 [Unit]
-Description=Contest Start Restriction for user {user}
+Description=Contest Start Restriction for {label}
 DefaultDependencies=no
 After=basic.target
 
 [Service]
 Type=oneshot
-ExecStart=contest-manager start-restriction {user}
+ExecStart=contest-manager start-restriction {user}{extra_opts}
 RemainAfterExit=true
 
 [Install]
 WantedBy=multi-user.target
 """
-    start_service_path = systemd_dir / f"contest-start-restriction-{user}.service"
+    start_service_path = systemd_dir / f"contest-start-restriction-{unit}.service"
     with open(start_service_path, 'w') as f:
         f.write(start_service)
 
     # Service to run update-restriction
     update_service = f"""
 [Unit]
-Description=Contest Update Restriction for user {user}
+Description=Contest Update Restriction for {label}
 DefaultDependencies=no
 After=basic.target
 
 [Service]
 Type=oneshot
-ExecStart=contest-manager update-restriction {user}
+ExecStart=contest-manager update-restriction {user}{extra_opts}
 """
-    update_service_path = systemd_dir / f"contest-update-restriction-{user}.service"
+    update_service_path = systemd_dir / f"contest-update-restriction-{unit}.service"
     with open(update_service_path, 'w') as f:
         f.write(update_service)
 
     # Timer to run update-restriction every 30 minutes
     update_timer = f"""
 [Unit]
-Description=Contest Update Restriction Timer for user {user}
+Description=Contest Update Restriction Timer for {label}
 
 [Timer]
 OnBootSec=5min
 OnUnitActiveSec=30min
-Unit=contest-update-restriction-{user}.service
+Unit=contest-update-restriction-{unit}.service
 
 [Install]
 WantedBy=timers.target
 """
-    update_timer_path = systemd_dir / f"contest-update-restriction-{user}.timer"
+    update_timer_path = systemd_dir / f"contest-update-restriction-{unit}.timer"
     with open(update_timer_path, 'w') as f:
         f.write(update_timer)
 
     # Reload systemd and enable/start units
     subprocess.run(['systemctl', 'daemon-reload'], check=True)
-    subprocess.run(['systemctl', 'enable', f'contest-start-restriction-{user}.service'], check=True)
-    subprocess.run(['systemctl', 'start', f'contest-start-restriction-{user}.service'], check=True)
-    subprocess.run(['systemctl', 'enable', f'contest-update-restriction-{user}.timer'], check=True)
-    subprocess.run(['systemctl', 'start', f'contest-update-restriction-{user}.timer'], check=True)
+    subprocess.run(['systemctl', 'enable', f'contest-start-restriction-{unit}.service'], check=True)
+    subprocess.run(['systemctl', 'start', f'contest-start-restriction-{unit}.service'], check=True)
+    if update_timer:
+        subprocess.run(['systemctl', 'enable', f'contest-update-restriction-{unit}.timer'], check=True)
+        subprocess.run(['systemctl', 'start', f'contest-update-restriction-{unit}.timer'], check=True)
+    else:
+        subprocess.run(['systemctl', 'disable', '--now', f'contest-update-restriction-{unit}.timer'], check=False)
     # Disable ufw to prevent interference with iptables rules
     try:
         subprocess.run(['systemctl', 'disable', '--now', 'ufw'], check=True)
         print("✅ ufw disabled to ensure contest restrictions are enforced.")
     except Exception as e:
         print(f"⚠️  Could not disable ufw automatically: {e}\nPlease run: sudo systemctl disable --now ufw")
-    print(f"✅ Persistence enabled: start-restriction at boot, update-restriction every 30 min for user {user}")
+    if update_timer:
+        print(f"✅ Persistence enabled: start-restriction at boot, update-restriction every 30 min for {label}")
+    else:
+        print(f"✅ Persistence enabled: start-restriction at boot for {label}, updates by the contest-manager daemon")
 
 
 def remove_persistence(user):
     """
-    Remove systemd service and timer for contest restrictions for the given user.
+    Remove systemd service and timer for contest restrictions for the given user
+    (or unit name passed to start_persistence).
     """
     systemd_dir = Path('/etc/systemd/system')
     start_service_path = systemd_dir / f"contest-start-restriction-{user}.service"
@@ -101,4 +114,80 @@ def remove_persistence(user):
 
     # Reload systemd
     subprocess.run(['systemctl', 'daemon-reload'], check=True)
-    print(f"✅ Persistence removed for user {user}")
\ No newline at end of file
+    print(f"✅ Persistence removed for user {user}")
+
+def start_stub_resolver_service(options=()):
+    """
+    Install and start the systemd service running the local blocking stub resolver.
+    `options` (e.g. the port) are passed on to `contest-manager stub-resolver`.
+    """
+    extra_opts = "".join(f" {option}" for option in options)
+    service = f"""
+[Unit]
+Description=Contest blocking stub resolver
+After=network.target
+
+[Service]
+ExecStart=contest-manager stub-resolver{extra_opts}
+Restart=on-failure
+
+[Install]
+WantedBy=multi-user.target
+"""
+    service_path = Path('/etc/systemd/system') / "contest-stub-resolver.service"
+    with open(service_path, 'w') as f:
+        f.write(service)
+    subprocess.run(['systemctl', 'daemon-reload'], check=True)
+    subprocess.run(['systemctl', 'enable', 'contest-stub-resolver.service'], check=True)
+    subprocess.run(['systemctl', 'restart', 'contest-stub-resolver.service'], check=True)
+    print("✅ Stub resolver service enabled")
+
+
+def remove_stub_resolver_service():
+    """Stop and remove the stub resolver service."""
+    service_path = Path('/etc/systemd/system') / "contest-stub-resolver.service"
+    if not service_path.exists():
+        return
+    subprocess.run(['systemctl', 'disable', '--now', 'contest-stub-resolver.service'], check=False)
+    service_path.unlink()
+    subprocess.run(['systemctl', 'daemon-reload'], check=True)
+    print("✅ Stub resolver service removed")
+
+
+def start_daemon_service(options=()):
+    """
+    Install and start the systemd service running the restriction daemon (`contest-manager daemon`).
+    `options` (e.g. DNS settings) are passed on to the daemon.
+    """
+    extra_opts = "".join(f" {option}" for option in options)
+    service = f"""
+[Unit]
+Description=Contest restriction daemon
+After=network.target
+
+[Service]
+ExecStart=contest-manager daemon{extra_opts}
+ExecReload=/bin/kill -HUP $MAINPID
+Restart=on-failure
+
+[Install]
+WantedBy=multi-user.target
+"""
+    service_path = Path('/etc/systemd/system') / "contest-daemon.service"
+    with open(service_path, 'w') as f:
+        f.write(service)
+    subprocess.run(['systemctl', 'daemon-reload'], check=True)
+    subprocess.run(['systemctl', 'enable', 'contest-daemon.service'], check=True)
+    subprocess.run(['systemctl', 'restart', 'contest-daemon.service'], check=True)
+    print("✅ Restriction daemon service enabled")
+
+
+def remove_daemon_service():
+    """Stop and remove the restriction daemon service."""
+    service_path = Path('/etc/systemd/system') / "contest-daemon.service"
+    if not service_path.exists():
+        return
+    subprocess.run(['systemctl', 'disable', '--now', 'contest-daemon.service'], check=False)
+    service_path.unlink()
+    subprocess.run(['systemctl', 'daemon-reload'], check=True)
+    print("✅ Restriction daemon service removed")
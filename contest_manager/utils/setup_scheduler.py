@@ -0,0 +1,141 @@
+"""
+Dependency-aware scheduler for setup steps
+
+Each step runs in its own forked process with stdout and stderr (including those of the
+package managers it starts) redirected to a separate log file, so steps that do not
+depend on each other, such as apt, snap and flatpak installs which use different locks
+and spend most of their time downloading, run concurrently without mixing their output.
+A step starts once every step it runs `after` or `requires` has finished. If a step it
+`requires` failed or was skipped, the step is skipped too; `after` only orders the steps.
+
+A step's action returns False when it finished with failures (e.g. some packages could
+not be installed) and raises when it could not run at all.
+"""
+
+import os
+import sys
+import time
+import traceback
+import multiprocessing
+from collections import namedtuple
+from multiprocessing.connection import wait
+from pathlib import Path
+
+# `after` and `requires` list the names of the steps that must finish first;
+# a failed or skipped step in `requires` also skips this step
+SetupStep = namedtuple('SetupStep', 'name action after requires')
+SetupStep.__new__.__defaults__ = ((), ())
+
+OK = "ok"
+PARTIAL = "partial"
+FAILED = "failed"
+SKIPPED = "skipped"
+STATUS_LABELS = {
+    OK: "✅ Done",
+    PARTIAL: "⚠️  Done with failures",
+    FAILED: "❌ Failed",
+    SKIPPED: "⏭️  Skipped",
+}
+EXIT_STATUSES = {0: OK, 2: PARTIAL}
+# Lines of a failed step's log shown on the terminal
+FAILED_LOG_LINES = 15
+DEFAULT_LOG_DIR = Path('/var/log/contest-manager/setup')
+
+def get_log_dir(log_dir=None):
+    """Create and return the directory holding the setup step logs (DEFAULT_LOG_DIR unless given)."""
+    log_dir = Path(log_dir) if log_dir else DEFAULT_LOG_DIR
+    log_dir.mkdir(parents=True, exist_ok=True)
+    return log_dir
+
+def run_step(step, log_path):
+    """Child process body: redirect both output streams to the step's log and run its action."""
+    with open(log_path, 'w') as log:
+        os.dup2(log.fileno(), 1)
+        os.dup2(log.fileno(), 2)
+    sys.stdout = os.fdopen(1, 'w', buffering=1)
+    sys.stderr = os.fdopen(2, 'w', buffering=1)
+    try:
+        result = step.action()
+    except BaseException:
+        traceback.print_exc()
+        sys.stdout.flush()
+        os._exit(1)
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os._exit(2 if result is False else 0)
+
+def check_steps(steps):
+    """Raise ValueError if step names repeat, a dependency is unknown or the dependencies form a cycle."""
+    names = [step.name for step in steps]
+    if len(set(names)) != len(names):
+        raise ValueError("duplicate setup step names")
+    graph = {step.name: list(step.after) + list(step.requires) for step in steps}
+    for step in steps:
+        for dependency in graph[step.name]:
+            if dependency not in graph:
+                raise ValueError(f"setup step {step.name!r} runs after unknown step {dependency!r}")
+    done = set()
+    while len(done) < len(graph):
+        ready = [name for name, after in graph.items() if name not in done and all(d in done for d in after)]
+        if not ready:
+            raise ValueError("setup steps depend on each other in a cycle")
+        done.update(ready)
+
+def tail(path, lines=FAILED_LOG_LINES):
+    try:
+        with open(path, errors='replace') as f:
+            return f.read().splitlines()[-lines:]
+    except OSError:
+        return []
+
+def run_steps(steps, max_parallel=None, log_dir=None):
+    """
+    Run setup steps, each as soon as the steps it runs after are done, with at most
+    `max_parallel` (default: all ready steps) running at once.
+    Returns {name: {"status": ..., "seconds": ..., "log": ...}} in the order the steps were given.
+    """
+    check_steps(steps)
+    log_dir = get_log_dir(log_dir)
+    context = multiprocessing.get_context('fork')
+    results = {step.name: {"status": None, "seconds": 0.0, "log": str(log_dir / f"{step.name}.log")} for step in steps}
+    pending = list(steps)
+    running = {}
+    while pending or running:
+        for step in list(pending):
+            failed = [dependency for dependency in step.requires if results[dependency]["status"] in (FAILED, SKIPPED)]
+            if failed:
+                pending.remove(step)
+                results[step.name]["status"] = SKIPPED
+                print(f"⏭️  [{step.name}] skipped: {', '.join(failed)} did not complete")
+                continue
+            waiting = [d for d in list(step.after) + list(step.requires) if results[d]["status"] is None]
+            if waiting or (max_parallel and len(running) >= max_parallel):
+                continue
+            pending.remove(step)
+            sys.stdout.flush()
+            sys.stderr.flush()
+            process = context.Process(target=run_step, args=(step, results[step.name]["log"]), name=step.name)
+            process.start()
+            running[process.sentinel] = (step, process, time.monotonic())
+            print(f"▶️  [{step.name}] started (log: {results[step.name]['log']})")
+        if not running:
+            continue
+        for sentinel in wait(list(running)):
+            step, process, started = running.pop(sentinel)
+            process.join()
+            result = results[step.name]
+            result["seconds"] = round(time.monotonic() - started, 1)
+            result["status"] = EXIT_STATUSES.get(process.exitcode, FAILED)
+            print(f"{STATUS_LABELS[result['status']]}: [{step.name}] in {result['seconds']:.1f}s")
+            if result["status"] == FAILED:
+                for line in tail(result["log"]):
+                    print(f"    {line}")
+    return results
+
+def print_timing_summary(results):
+    """Print one line per step with its outcome, duration and log file."""
+    print("\n⏱️  Setup step timings\n" + ("="*40))
+    width = max((len(name) for name in results), default=0)
+    for name, result in results.items():
+        duration = f"{result['seconds']:7.1f}s" if result["status"] != SKIPPED else "       -"
+        print(f"  {name:<{width}}  {duration}  {STATUS_LABELS[result['status']]}  ({result['log']})")
@@ -1,45 +1,159 @@
+import re
 import tempfile
 import requests
 import subprocess
 from pathlib import Path
+from contest_manager.utils.setup_scheduler import SetupStep, run_steps, print_timing_summary
 
-def install_apt_softwares(apt_file, verbose=False):
-    print("\n==================== [APT INSTALL] ====================")
-    """Install apt packages listed in apt_file."""
-    if not Path(apt_file).exists():
-        print(f"[apt] Package list not found: {apt_file}")
-        return
+APT_LOCK_TIMEOUT = 300
+# apt-get messages naming a package that can never be installed
+APT_MISSING_PATTERNS = (
+    re.compile(r"Unable to locate package (\S+)"),
+    re.compile(r"Package '?([^' ]+)'? has no installation candidate"),
+    re.compile(r"Couldn't find any package by (?:glob|regex) '([^']+)'"),
+)
+
+def apt_install(pkgs):
+    """Run one `apt-get install` transaction for pkgs. Returns (succeeded, stderr)."""
+    # Wait for a dpkg lock held by e.g. unattended-upgrades instead of failing the whole batch
+    cmd = ['apt-get', 'install', '-y', '-o', f'DPkg::Lock::Timeout={APT_LOCK_TIMEOUT}'] + pkgs
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    return result.returncode == 0, result.stderr
+
+def unknown_apt_packages(stderr, pkgs):
+    """Return the packages of pkgs that apt reported as unknown or uninstallable."""
+    names = {match.group(1) for pattern in APT_MISSING_PATTERNS for match in pattern.finditer(stderr)}
+    return [pkg for pkg in pkgs if pkg in names]
+
+def install_apt_batch(pkgs, verbose=False):
+    """
+    Install pkgs in one apt transaction. If it fails, the packages apt names as unknown are
+    dropped and the rest retried; otherwise the list is split in halves until the failing
+    packages are isolated. Returns (installed, failed).
+    """
+    if not pkgs:
+        return [], []
+    print(f"[apt] 🛠️ Installing: {' '.join(pkgs)}")
+    succeeded, stderr = apt_install(pkgs)
+    if succeeded:
+        return list(pkgs), []
+    if verbose:
+        print(f"[apt] apt-get failed for {len(pkgs)} package(s):\n{stderr.strip()}")
+    unknown = unknown_apt_packages(stderr, pkgs)
+    if unknown:
+        for pkg in unknown:
+            print(f"[apt] ❌ Failed: {pkg} (package not found)")
+        installed, failed = install_apt_batch([pkg for pkg in pkgs if pkg not in unknown], verbose=verbose)
+        return installed, unknown + failed
+    if len(pkgs) == 1:
+        print(f"[apt] ❌ Failed: {pkgs[0]}")
+        return [], list(pkgs)
+    middle = len(pkgs) // 2
+    left_installed, left_failed = install_apt_batch(pkgs[:middle], verbose=verbose)
+    right_installed, right_failed = install_apt_batch(pkgs[middle:], verbose=verbose)
+    return left_installed + right_installed, left_failed + right_failed
+
+def installed_apt_packages():
+    """
+    Return the names of every installed dpkg package from one `dpkg-query -W` call, both
+    plain and architecture-qualified (e.g. libc6 and libc6:amd64), or None if it failed.
+    """
+    try:
+        result = subprocess.run(['dpkg-query', '-W', '-f=${db:Status-Abbrev}\t${Package}\t${binary:Package}\n'],
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    except OSError:
+        return None
+    if result.returncode != 0:
+        return None
+    installed = set()
+    for line in result.stdout.splitlines():
+        fields = line.split('\t')
+        if len(fields) == 3 and fields[0].startswith('ii'):
+            installed.update(fields[1:])
+    return installed
+
+def installed_snaps():
+    """Return the names of every installed snap from one `snap list` call, or None if it failed."""
+    try:
+        result = subprocess.run(['snap', 'list'], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    except OSError:
+        return None
+    if result.returncode != 0:
+        return None
+    return {line.split()[0] for line in result.stdout.splitlines()[1:] if line.strip()}
+
+def installed_flatpaks():
+    """Return the IDs of every installed flatpak app and runtime from one `flatpak list` call, or None if it failed."""
+    for cmd in (['flatpak', 'list', '--columns=application'], ['flatpak', 'list']):
+        try:
+            result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        except OSError:
+            return None
+        if result.returncode == 0:
+            # Flatpak before 1.2 has no --columns and lists refs such as org.example.App/x86_64/stable
+            return {line.split()[0].split('/')[0] for line in result.stdout.splitlines() if line.strip()}
+    return None
+
+def snap_name(line):
+    """Return the snap name of a snap.txt entry (`code --classic` -> code)."""
+    args = [arg for arg in line.split() if not arg.startswith('-')]
+    return args[0] if args else None
+
+def flatpak_id(line):
+    """Return the application ID of a flatpak.txt entry (`flathub org.vscode.Code` -> org.vscode.Code)."""
+    args = [arg for arg in line.split() if not arg.startswith('-')]
+    if not args:
+        return None
+    ref = args[-1].split('/')
+    if len(ref) >= 2 and ref[0] in ('app', 'runtime'):
+        ref = ref[1:]
+    return ref[0]
+
+def read_apt_packages(apt_file):
+    """Return the package names listed in apt.txt, without their `(ppa:...)` sources."""
     pkgs = []
-    ppas = []
     with open(apt_file) as f:
         for line in f:
             line = line.strip()
             if not line or line.startswith('#'):
                 continue
             if '(' in line and 'ppa:' in line:
-                pkg = line.split('(')[0].strip()
-                ppa = line.split('ppa:')[1].strip(') ')
-                ppas.append(ppa)
-                pkgs.append(pkg)
+                pkgs.append(line.split('(')[0].strip())
             else:
                 pkgs.append(line)
-    installed = []
-    failed = []
-    for pkg in pkgs:
-        try:
-            print(f"[apt] 🛠️ Installing: {pkg}")
-            subprocess.run(['apt-get', 'install', '-y', pkg], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            print(f"[apt] ✅ Installed: {pkg}")
-            installed.append(pkg)
-        except subprocess.CalledProcessError as e:
-            print(f"[apt] ❌ Failed: {pkg} ({e})")
-            failed.append(pkg)
-    print(f"[apt] Install summary: ✅ {len(installed)} succeeded, ❌ {len(failed)} failed.")
+    return pkgs
+
+def read_package_lines(list_file):
+    """Return the entries of snap.txt or flatpak.txt, one install command line each."""
+    with open(list_file) as f:
+        return [line.strip() for line in f if line.strip() and not line.strip().startswith('#')]
+
+def print_install_summary(tag, installed, present, failed):
+    print(f"[{tag}] Install summary: ✅ {len(installed)} succeeded, ⏭️ {len(present)} already installed, ❌ {len(failed)} failed.")
     if failed:
-        print("[apt] ❌ Failed packages:")
+        print(f"[{tag}] ❌ Failed packages:")
         for pkg in failed:
             print(f"  - {pkg}")
 
+def install_apt_softwares(apt_file, verbose=False):
+    print("\n==================== [APT INSTALL] ====================")
+    """Install apt packages listed in apt_file."""
+    if not Path(apt_file).exists():
+        print(f"[apt] Package list not found: {apt_file}")
+        return
+    pkgs = read_apt_packages(apt_file)
+    inventory = installed_apt_packages()
+    # Entries pinning a version (pkg=1.0) or release (pkg/jammy) are always left to apt
+    present = [pkg for pkg in pkgs if inventory is not None and pkg in inventory]
+    if present:
+        print(f"[apt] ⏭️ Already installed: {' '.join(present)}")
+    installed, failed = install_apt_batch([pkg for pkg in pkgs if pkg not in present], verbose=verbose)
+    for pkg in pkgs:
+        if pkg in installed:
+            print(f"[apt] ✅ Installed: {pkg}")
+    print_install_summary('apt', installed, present, failed)
+    return not failed
+
 def install_snap_softwares(snap_file, verbose=False):
     print("\n==================== [SNAP INSTALL] ===================")
     """Install snap packages listed in snap_file."""
@@ -48,26 +162,25 @@ def install_snap_softwares(snap_file, verbose=False):
         return
     installed = []
     failed = []
-    with open(snap_file) as f:
-        for line in f:
-            line = line.strip()
-            if not line or line.startswith('#'):
-                continue
-            cmd = ['snap', 'install'] + line.split()
-            pkg_name = ' '.join(cmd[2:])
-            try:
-                print(f"[snap] 🛠️ Installing: {pkg_name}")
-                subprocess.run(cmd, check=True)
-                print(f"[snap] ✅ Installed: {pkg_name}")
-                installed.append(pkg_name)
-            except subprocess.CalledProcessError as e:
-                print(f"[snap] ❌ Failed: {pkg_name} ({e})")
-                failed.append(pkg_name)
-    print(f"[snap] Install summary: ✅ {len(installed)} succeeded, ❌ {len(failed)} failed.")
-    if failed:
-        print("[snap] ❌ Failed packages:")
-        for pkg in failed:
-            print(f"  - {pkg}")
+    present = []
+    inventory = installed_snaps()
+    for line in read_package_lines(snap_file):
+        cmd = ['snap', 'install'] + line.split()
+        pkg_name = ' '.join(cmd[2:])
+        if inventory is not None and snap_name(line) in inventory:
+            print(f"[snap] ⏭️ Already installed: {pkg_name}")
+            present.append(pkg_name)
+            continue
+        try:
+            print(f"[snap] 🛠️ Installing: {pkg_name}")
+            subprocess.run(cmd, check=True)
+            print(f"[snap] ✅ Installed: {pkg_name}")
+            installed.append(pkg_name)
+        except subprocess.CalledProcessError as e:
+            print(f"[snap] ❌ Failed: {pkg_name} ({e})")
+            failed.append(pkg_name)
+    print_install_summary('snap', installed, present, failed)
+    return not failed
 
 def install_flatpak_softwares(flatpak_file, verbose=False):
     print("\n================= [FLATPAK INSTALL] ==================")
@@ -77,32 +190,98 @@ def install_flatpak_softwares(flatpak_file, verbose=False):
         return
     installed = []
     failed = []
-    with open(flatpak_file) as f:
-        for line in f:
-            line = line.strip()
-            if not line or line.startswith('#'):
-                continue
-            cmd = ['flatpak', 'install', '-y'] + line.split()
-            pkg_name = ' '.join(cmd[3:])
-            try:
-                print(f"[flatpak] 🛠️ Installing: {pkg_name}")
-                subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                print(f"[flatpak] ✅ Installed: {pkg_name}")
-                installed.append(pkg_name)
-            except subprocess.CalledProcessError as e:
-                print(f"[flatpak] ❌ Failed: {pkg_name} ({e})")
-                failed.append(pkg_name)
-    print(f"[flatpak] Install summary: ✅ {len(installed)} succeeded, ❌ {len(failed)} failed.")
-    if failed:
-        print("[flatpak] ❌ Failed packages:")
-        for pkg in failed:
-            print(f"  - {pkg}")
+    present = []
+    inventory = installed_flatpaks()
+    for line in read_package_lines(flatpak_file):
+        cmd = ['flatpak', 'install', '-y'] + line.split()
+        pkg_name = ' '.join(cmd[3:])
+        if inventory is not None and flatpak_id(line) in inventory:
+            print(f"[flatpak] ⏭️ Already installed: {pkg_name}")
+            present.append(pkg_name)
+            continue
+        try:
+            print(f"[flatpak] 🛠️ Installing: {pkg_name}")
+            subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            print(f"[flatpak] ✅ Installed: {pkg_name}")
+            installed.append(pkg_name)
+        except subprocess.CalledProcessError as e:
+            print(f"[flatpak] ❌ Failed: {pkg_name} ({e})")
+            failed.append(pkg_name)
+    print_install_summary('flatpak', installed, present, failed)
+    return not failed
+
+def install_bundle_snaps(bundle_dir, manifest, verbose=False):
+    """Install the snaps of a package bundle (see package_bundle_handler) from their files, bases first."""
+    print("\n================= [SNAP INSTALL (bundle)] =============")
+    installed = []
+    failed = []
+    present = []
+    inventory = installed_snaps()
+    for entry in manifest["snaps"]:
+        name = entry["name"]
+        if inventory is not None and name in inventory:
+            print(f"[snap] ⏭️ Already installed: {name}")
+            present.append(name)
+            continue
+        try:
+            print(f"[snap] 🛠️ Installing from bundle: {name}")
+            subprocess.run(['snap', 'ack', str(Path(bundle_dir) / entry["assert"])], check=True)
+            subprocess.run(['snap', 'install', str(Path(bundle_dir) / entry["file"])] + entry["options"], check=True)
+            print(f"[snap] ✅ Installed: {name}")
+            installed.append(name)
+        except subprocess.CalledProcessError as e:
+            print(f"[snap] ❌ Failed: {name} ({e})")
+            failed.append(name)
+    print_install_summary('snap', installed, present, failed)
+    return not failed
+
+def install_bundle_flatpaks(bundle_dir, manifest, verbose=False):
+    """Install the flatpaks of a package bundle from their single-file bundles, runtimes first."""
+    print("\n============== [FLATPAK INSTALL (bundle)] ============")
+    installed = []
+    failed = []
+    present = []
+    inventory = installed_flatpaks()
+    for entry in manifest["flatpaks"]:
+        ref_id = entry["id"]
+        if inventory is not None and ref_id in inventory:
+            print(f"[flatpak] ⏭️ Already installed: {ref_id}")
+            present.append(ref_id)
+            continue
+        try:
+            print(f"[flatpak] 🛠️ Installing from bundle: {ref_id}")
+            subprocess.run(['flatpak', 'install', '-y', '--noninteractive', '--bundle', str(Path(bundle_dir) / entry["file"])],
+                           check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            print(f"[flatpak] ✅ Installed: {ref_id}")
+            installed.append(ref_id)
+        except subprocess.CalledProcessError as e:
+            print(f"[flatpak] ❌ Failed: {ref_id} ({e})")
+            failed.append(ref_id)
+    print_install_summary('flatpak', installed, present, failed)
+    return not failed
+
+def software_steps(config_dir, verbose=False, requires=(), bundle_dir=None, manifest=None):
+    """
+    Return the setup steps installing the apt, snap and flatpak lists in config_dir.
+    With a package bundle, snaps and flatpaks are installed from its files; apt reads the
+    bundle's repository through APT_CONFIG (see package_bundle_handler.write_bundle_apt_config).
+    """
+    config_dir = Path(config_dir)
+    if bundle_dir:
+        snap = lambda: install_bundle_snaps(bundle_dir, manifest, verbose=verbose)
+        flatpak = lambda: install_bundle_flatpaks(bundle_dir, manifest, verbose=verbose)
+    else:
+        snap = lambda: install_snap_softwares(config_dir / 'snap.txt', verbose=verbose)
+        flatpak = lambda: install_flatpak_softwares(config_dir / 'flatpak.txt', verbose=verbose)
+    return [
+        SetupStep('apt', lambda: install_apt_softwares(config_dir / 'apt.txt', verbose=verbose), requires=tuple(requires)),
+        SetupStep('snap', snap, requires=tuple(requires)),
+        SetupStep('flatpak', flatpak, requires=tuple(requires)),
+    ]
 
 def install_all_softwares(verbose=False):
+    """Install the apt, snap and flatpak lists concurrently, each logging to its own file."""
     config_dir = Path(__file__).parent.parent.parent / 'config'
-    apt_file = config_dir / 'apt.txt'
-    snap_file = config_dir / 'snap.txt'
-    flatpak_file = config_dir / 'flatpak.txt'
-    install_apt_softwares(apt_file, verbose=verbose)
-    install_snap_softwares(snap_file, verbose=verbose)
-    install_flatpak_softwares(flatpak_file, verbose=verbose)
\ No newline at end of file
+    results = run_steps(software_steps(config_dir, verbose=verbose))
+    print_timing_summary(results)
+    return results
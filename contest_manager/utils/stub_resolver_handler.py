@@ -0,0 +1,113 @@
+"""
+Local blocking stub resolver for contest-manager
+
+The stub listens on loopback (UDP and TCP), answers NXDOMAIN for every name the
+blacklist matcher (see domain_matcher) blocks, and forwards all other queries to an
+upstream resolver.
+A nat-table redirect (see iptables_handler.restore_redirect) pins a contest user's
+DNS traffic to it, replacing the per-domain string-match rules on the packet path.
+"""
+
+import socket
+import struct
+import threading
+import socketserver
+import dns.query
+import dns.rcode
+import dns.message
+import dns.resolver
+
+from contest_manager.utils.domain_matcher import is_blocked
+
+DEFAULT_STUB_PORT = 5300
+STUB_ADDRESSES = ("127.0.0.1", "::1")
+DEFAULT_UPSTREAM_TIMEOUT = 3.0
+
+def default_upstream():
+    """Return the first nameserver from the system resolver configuration."""
+    nameservers = dns.resolver.Resolver().nameservers
+    return nameservers[0] if nameservers else "127.0.0.53"
+
+def answer_query(wire, matcher, upstream, upstream_port=53, timeout=DEFAULT_UPSTREAM_TIMEOUT, tcp=False):
+    """
+    Build the wire-format response to one query: NXDOMAIN for blocked names, otherwise the
+    upstream answer (SERVFAIL if the upstream does not respond). Returns None for garbage.
+    """
+    try:
+        query = dns.message.from_wire(wire)
+    except Exception:
+        return None
+    if query.question and is_blocked(matcher, query.question[0].name.to_text()):
+        response = dns.message.make_response(query)
+        response.set_rcode(dns.rcode.NXDOMAIN)
+        return response.to_wire()
+    try:
+        if tcp:
+            return dns.query.tcp(query, upstream, timeout=timeout, port=upstream_port).to_wire()
+        return dns.query.udp(query, upstream, timeout=timeout, port=upstream_port, ignore_unexpected=True).to_wire()
+    except Exception:
+        response = dns.message.make_response(query)
+        response.set_rcode(dns.rcode.SERVFAIL)
+        return response.to_wire()
+
+def make_servers(matcher, upstream, upstream_port=53, port=DEFAULT_STUB_PORT, addresses=STUB_ADDRESSES,
+                 timeout=DEFAULT_UPSTREAM_TIMEOUT):
+    """
+    Create UDP and TCP servers for every loopback address that can be bound.
+    With port=0 the first server picks a free port and the others listen on the same one
+    (server.server_address[1]), so tests can run the stub next to a local upstream stand-in.
+    `matcher` may be replaced on the returned servers (server.matcher) to reload the blacklist.
+    Returns the list of servers (not yet serving).
+    """
+
+    class UDPHandler(socketserver.BaseRequestHandler):
+        def handle(self):
+            data, sock = self.request
+            response = answer_query(data, self.server.matcher, upstream, upstream_port, timeout)
+            if response:
+                sock.sendto(response, self.client_address)
+
+    class TCPHandler(socketserver.BaseRequestHandler):
+        def handle(self):
+            header = self.request.recv(2)
+            if len(header) < 2:
+                return
+            (length,) = struct.unpack("!H", header)
+            data = b""
+            while len(data) < length:
+                chunk = self.request.recv(length - len(data))
+                if not chunk:
+                    return
+                data += chunk
+            response = answer_query(data, self.server.matcher, upstream, upstream_port, timeout, tcp=True)
+            if response:
+                self.request.sendall(struct.pack("!H", len(response)) + response)
+
+    servers = []
+    for address in addresses:
+        family = socket.AF_INET6 if ':' in address else socket.AF_INET
+        for base, handler in ((socketserver.ThreadingUDPServer, UDPHandler), (socketserver.ThreadingTCPServer, TCPHandler)):
+            server_class = type(base.__name__, (base,), {"address_family": family, "allow_reuse_address": True, "daemon_threads": True})
+            try:
+                server = server_class((address, port), handler)
+            except OSError as e:
+                print(f"⚠️  Stub resolver could not listen on {address}:{port}: {e}")
+                continue
+            server.matcher = matcher
+            servers.append(server)
+            port = server.server_address[1]
+    return servers
+
+def start_stub_resolver(matcher, upstream, upstream_port=53, port=DEFAULT_STUB_PORT, addresses=STUB_ADDRESSES,
+                        timeout=DEFAULT_UPSTREAM_TIMEOUT):
+    """Start the stub resolver in background threads. Returns the running servers (call shutdown() to stop)."""
+    servers = make_servers(matcher, upstream, upstream_port, port, addresses, timeout)
+    for server in servers:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    return servers
+
+def stop_stub_resolver(servers):
+    """Stop servers started by start_stub_resolver."""
+    for server in servers:
+        server.shutdown()
+        server.server_close()
@@ -1,8 +1,11 @@
 
 import os
+import pwd
+import json
 import shutil
 import subprocess
 from pathlib import Path
+from contest_manager.utils.software_installer import print_install_summary
 
 
 def get_target_user():
@@ -29,8 +32,39 @@ def is_vscode_installed():
     """Return True if VS Code CLI is available."""
     return find_vscode_cli() is not None
 
+def get_extensions_dir(code_path, target_user=None):
+    """Return the directory VS Code installs extensions into for target_user (or the current user)."""
+    home = Path(pwd.getpwnam(target_user).pw_dir) if target_user else Path(pwd.getpwuid(os.geteuid()).pw_dir)
+    data_dir = ".vscode-insiders" if Path(code_path).name == "code-insiders" else ".vscode"
+    return home / data_dir / "extensions"
+
+def read_extensions_inventory(extensions_dir):
+    """
+    Return the lower-case IDs of the extensions recorded in extensions_dir/extensions.json
+    whose folder still exists, or None if the inventory cannot be read from disk.
+    """
+    extensions_dir = Path(extensions_dir)
+    if not extensions_dir.exists():
+        # VS Code has never installed an extension for this user
+        return set()
+    try:
+        with open(extensions_dir / "extensions.json") as f:
+            entries = json.load(f)
+        installed = set()
+        for entry in entries:
+            location = entry.get("relativeLocation") or Path(entry["location"]["path"]).name
+            if (extensions_dir / location).is_dir():
+                installed.add(entry["identifier"]["id"].lower())
+        return installed
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        # Missing in VS Code releases before 1.74, or written in a format we do not know
+        return None
+
 def get_installed_extensions(code_path, target_user=None):
-    """Return a set of installed extension IDs."""
+    """Return a set of installed extension IDs (lower case), read from disk or else from the CLI."""
+    installed = read_extensions_inventory(get_extensions_dir(code_path, target_user))
+    if installed is not None:
+        return installed
     try:
         if target_user:
             result = subprocess.run(
@@ -42,13 +76,13 @@ def get_installed_extensions(code_path, target_user=None):
             )
         else:
             result = subprocess.run(
-                [code_path, "--list-extensions"],
+                [code_path, "--list-extensions"] + root_cli_options(),
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE,
                 text=True,
                 check=True,
             )
-        return set(result.stdout.strip().splitlines())
+        return {ext_id.lower() for ext_id in result.stdout.strip().splitlines()}
     except Exception:
         return set()
 
@@ -63,31 +97,43 @@ def read_extensions(ext_file):
                     ext_ids.append(line)
     return ext_ids
 
-def install_extension(code_path, ext_id, target_user=None):
-    """Install a single extension."""
-    try:
-        cmd = [code_path, "--install-extension", ext_id, "--force"]
+def root_cli_options():
+    """Options that keep the VS Code CLI from refusing to run as root."""
+    if os.geteuid() != 0:
+        return []
+    user_data_dir = "/tmp/vscode-root"
+    os.makedirs(user_data_dir, exist_ok=True)
+    return ["--no-sandbox", f"--user-data-dir={user_data_dir}"]
 
-        if target_user:
-            cmd = ["sudo", "-u", target_user] + cmd
-        elif os.geteuid() == 0:
-            # Fallback: avoid crashing when root runs code directly.
-            user_data_dir = "/tmp/vscode-root"
-            os.makedirs(user_data_dir, exist_ok=True)
-            cmd += ["--no-sandbox", f"--user-data-dir={user_data_dir}"]
+def find_vsix(vsix_dir, ext_id):
+    """Return the newest `<id>.vsix` or `<id>-<version>.vsix` file for ext_id in vsix_dir, or None."""
+    if not vsix_dir or not Path(vsix_dir).is_dir():
+        return None
+    ext_id = ext_id.lower()
+    matches = [
+        path for path in Path(vsix_dir).iterdir()
+        if path.suffix.lower() == ".vsix" and (path.stem.lower() == ext_id or path.stem.lower().startswith(ext_id + "-"))
+    ]
+    return max(matches, key=lambda path: path.stat().st_mtime) if matches else None
 
-        subprocess.run(cmd, check=True)
-        if target_user:
-            print(f"[vscode] ✅ Installed extension for {target_user}: {ext_id}")
-        else:
-            print(f"[vscode] ✅ Installed extension: {ext_id}")
-        return True
-    except subprocess.CalledProcessError as e:
-        print(f"[vscode] ❌ Failed to install {ext_id}: {e}")
-        return False
+def install_extensions(code_path, sources, target_user=None):
+    """Install several extensions (IDs or VSIX paths) with a single VS Code CLI run. Returns True on success."""
+    cmd = [code_path]
+    for source in sources:
+        cmd += ["--install-extension", source]
+    cmd.append("--force")
+    if target_user:
+        cmd = ["sudo", "-u", target_user] + cmd
+    else:
+        cmd += root_cli_options()
+    return subprocess.run(cmd).returncode == 0
 
-def install_vscode_extensions(ext_file):
-    """Main entry: install extensions from ext_file if VS Code is installed."""
+def install_vscode_extensions(ext_file, vsix_dir=None):
+    """
+    Main entry: install the extensions from ext_file that are missing, if VS Code is installed.
+    All of them are installed by one CLI run; extensions with a VSIX file in vsix_dir are
+    installed from that file instead of the Marketplace. Returns False if any failed.
+    """
     code_path = find_vscode_cli()
     if not code_path:
         print("[vscode] VS Code CLI not found. Skipping extension install.")
@@ -99,8 +145,31 @@ def install_vscode_extensions(ext_file):
 
     ext_ids = read_extensions(ext_file)
     installed_exts = get_installed_extensions(code_path, target_user)
+    present = []
+    missing = []
     for ext_id in ext_ids:
-        if ext_id in installed_exts:
-            print(f"[vscode] Already installed: {ext_id}")
+        if ext_id.lower() in installed_exts:
+            print(f"[vscode] ⏭️ Already installed: {ext_id}")
+            present.append(ext_id)
         else:
-            install_extension(code_path, ext_id, target_user)
+            missing.append(ext_id)
+    if not missing:
+        print_install_summary('vscode', [], present, [])
+        return True
+
+    sources = []
+    for ext_id in missing:
+        vsix = find_vsix(vsix_dir, ext_id)
+        print(f"[vscode] 🛠️ Installing: {ext_id}" + (f" (from {vsix})" if vsix else ""))
+        sources.append(str(vsix) if vsix else ext_id)
+    if install_extensions(code_path, sources, target_user):
+        failed = []
+    else:
+        # The CLI installs what it can and exits non-zero if any extension failed: check which
+        installed_exts = get_installed_extensions(code_path, target_user)
+        failed = [ext_id for ext_id in missing if ext_id.lower() not in installed_exts]
+    installed = [ext_id for ext_id in missing if ext_id not in failed]
+    for ext_id in installed:
+        print(f"[vscode] ✅ Installed extension{f' for {target_user}' if target_user else ''}: {ext_id}")
+    print_install_summary('vscode', installed, present, failed)
+    return not failed
@@ -0,0 +1,137 @@
+"""
+Shared fixtures: a local authoritative DNS server stand-in for resolution and stub resolver tests,
+and a per-test cache directory so no test writes into the repository's cache/
+"""
+
+import struct
+import threading
+import socketserver
+from collections import Counter
+
+import dns.flags
+import dns.rcode
+import dns.message
+import dns.rdatatype
+import dns.rrset
+import pytest
+
+from contest_manager.utils import internet_handler
+
+class FakeDNSServer:
+    """
+    Answer DNS queries over UDP and TCP on 127.0.0.1 from an in-memory zone.
+
+    `records` maps (name, rdtype) to a list of rdata strings; a "CNAME" entry is followed
+    within the zone. Names with a `*.` label match any name under them that has no record
+    of its own. Questions in `drop` ((name, rdtype) or name) are never answered. Every
+    question received is counted in `queries` as (name, rdtype).
+    """
+
+    def __init__(self, records=None, drop=(), ttl=300):
+        self.records = {(name.rstrip('.').lower(), rdtype): list(values) for (name, rdtype), values in (records or {}).items()}
+        self.drop = set(drop)
+        self.ttl = ttl
+        self.queries = Counter()
+        self.servers = []
+
+    def owner(self, name):
+        """Return the zone name holding name's records: the name itself, a covering wildcard, or None."""
+        if any(key == name for key, _ in self.records):
+            return name
+        labels = name.split('.')
+        for i in range(1, len(labels)):
+            wildcard = '*.' + '.'.join(labels[i:])
+            if any(key == wildcard for key, _ in self.records):
+                return wildcard
+        return None
+
+    def answer(self, wire):
+        query = dns.message.from_wire(wire)
+        question = query.question[0]
+        name = question.name.to_text(omit_final_dot=True).lower()
+        rdtype = dns.rdatatype.to_text(question.rdtype)
+        self.queries[name, rdtype] += 1
+        if (name, rdtype) in self.drop or name in self.drop:
+            return None
+        response = dns.message.make_response(query)
+        response.flags |= dns.flags.AA
+        current = name
+        for _ in range(8):
+            owner = self.owner(current)
+            if owner is None:
+                if current == name:
+                    response.set_rcode(dns.rcode.NXDOMAIN)
+                break
+            if (owner, "CNAME") in self.records and rdtype != "CNAME":
+                target = self.records[owner, "CNAME"][0].rstrip('.')
+                response.answer.append(dns.rrset.from_text(current + '.', self.ttl, 'IN', 'CNAME', target + '.'))
+                current = target
+                continue
+            values = self.records.get((owner, rdtype))
+            if values:
+                response.answer.append(dns.rrset.from_text_list(current + '.', self.ttl, 'IN', rdtype, values))
+            break
+        return response.to_wire()
+
+    def start(self):
+        fake = self
+
+        class UDPHandler(socketserver.BaseRequestHandler):
+            def handle(self):
+                data, sock = self.request
+                response = fake.answer(data)
+                if response:
+                    sock.sendto(response, self.client_address)
+
+        class TCPHandler(socketserver.BaseRequestHandler):
+            def handle(self):
+                header = self.request.recv(2)
+                if len(header) < 2:
+                    return
+                (length,) = struct.unpack("!H", header)
+                data = b""
+                while len(data) < length:
+                    chunk = self.request.recv(length - len(data))
+                    if not chunk:
+                        return
+                    data += chunk
+                response = fake.answer(data)
+                if response:
+                    self.request.sendall(struct.pack("!H", len(response)) + response)
+
+        udp = socketserver.ThreadingUDPServer(("127.0.0.1", 0), UDPHandler)
+        port = udp.server_address[1]
+        tcp_class = type("TCPServer", (socketserver.ThreadingTCPServer,), {"allow_reuse_address": True})
+        tcp = tcp_class(("127.0.0.1", port), TCPHandler)
+        for server in (udp, tcp):
+            server.daemon_threads = True
+            threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+        self.servers = [udp, tcp]
+        self.port = port
+        self.spec = f"127.0.0.1:{port}"
+        return self
+
+    def stop(self):
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    """Point get_cache_dir (IP caches, manifests, the compiled blacklist matcher) at the test's tmp_path."""
+    monkeypatch.setattr(internet_handler, "get_cache_dir", lambda: tmp_path)
+    return tmp_path
+
+@pytest.fixture
+def dns_server():
+    """Return a factory starting FakeDNSServer instances; they are stopped after the test."""
+    started = []
+
+    def start(records=None, drop=(), ttl=300):
+        server = FakeDNSServer(records, drop, ttl).start()
+        started.append(server)
+        return server
+
+    yield start
+    for server in started:
+        server.stop()
@@ -0,0 +1,68 @@
+"""
+Tests for loading IP caches: missing files read as empty, damaged ones raise CacheError
+"""
+
+import json
+
+import pytest
+
+from contest_manager.utils.cache_handler import CacheError, new_cache, load_cache, save_cache, merge_resolved
+
+def test_missing_cache_is_empty(tmp_path):
+    assert load_cache(tmp_path / "ip_cache.json") == new_cache()
+
+@pytest.mark.parametrize("suffix", [".json", ".bin"])
+def test_saved_cache_round_trips(tmp_path, suffix):
+    cache = merge_resolved(new_cache(), {"blocked.test": {"192.0.2.1": 300, "2001:db8::1": 60}}, now=1000)
+    save_cache(tmp_path / f"ip_cache{suffix}", cache)
+    assert load_cache(tmp_path / f"ip_cache{suffix}") == cache
+
+def test_binary_checksum_mismatch_raises(tmp_path):
+    path = tmp_path / "ip_cache.bin"
+    save_cache(path, merge_resolved(new_cache(), {"blocked.test": {"192.0.2.1": 300}}))
+    data = bytearray(path.read_bytes())
+    data[-1] ^= 0xff
+    path.write_bytes(bytes(data))
+    with pytest.raises(CacheError, match="checksum mismatch"):
+        load_cache(path)
+
+@pytest.mark.parametrize("content, message", [
+    ("{", "not valid JSON"),
+    ("[1, 2]", "not a cache in any known schema"),
+])
+def test_damaged_json_cache_raises(tmp_path, content, message):
+    path = tmp_path / "ip_cache.json"
+    path.write_text(content)
+    with pytest.raises(CacheError, match=message):
+        load_cache(path)
+
+def test_unreadable_cache_raises(tmp_path):
+    path = tmp_path / "ip_cache.json"
+    path.mkdir()
+    with pytest.raises(CacheError, match="cannot be read"):
+        load_cache(path)
+
+def test_legacy_cache_is_migrated(tmp_path):
+    path = tmp_path / "ip_cache.json"
+    path.write_text(json.dumps({"blocked.test": ["192.0.2.1"]}))
+    cache = load_cache(path)
+    assert cache["version"] == 2
+    assert list(cache["targets"]["blocked.test"]) == ["192.0.2.1"]
+
+@pytest.mark.parametrize("data, message", [
+    ({"version": 3, "targets": {}, "negative": {}}, "unknown schema version 3"),
+    ({"version": 2, "targets": ["blocked.test"]}, "not a valid version 2 cache"),
+    ({"version": 2, "targets": {}, "negative": []}, "not a valid version 2 cache"),
+    ({"blocked.test": "192.0.2.1"}, "not a cache in any known schema"),
+])
+def test_unknown_schema_raises(tmp_path, data, message):
+    path = tmp_path / "ip_cache.json"
+    path.write_text(json.dumps(data))
+    with pytest.raises(CacheError, match=message):
+        load_cache(path)
+
+def test_binary_cache_of_unknown_schema_raises(tmp_path):
+    path = tmp_path / "ip_cache.bin"
+    save_cache(path, dict(new_cache(), version=3))
+    with pytest.raises(CacheError, match="unknown schema version 3"):
+        load_cache(path)
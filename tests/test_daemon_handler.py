@@ -0,0 +1,72 @@
+"""
+Tests for the restriction daemon's resolution passes against a local DNS server stand-in
+"""
+
+import os
+import time
+
+from contest_manager.utils import internet_handler
+from contest_manager.utils.cache_handler import new_cache, save_cache, load_cache
+from contest_manager.utils.manifest_handler import build_manifest, save_manifest
+from contest_manager.utils.daemon_handler import RestrictionDaemon
+
+def record_restriction(owner, cache_path, options):
+    save_cache(cache_path, new_cache())
+    save_manifest(internet_handler.get_manifest_path(owner), build_manifest(
+        owner, f"user{owner}", None, [owner], "iptables-restore", {"iptables": [], "ip6tables": []}, [], cache_path,
+        options=options
+    ))
+
+def test_daemon_resolves_with_recorded_settings_and_skips_bundles(tmp_path, dns_server):
+    server = dns_server({
+        ("*.wild.test", "A"): ["192.0.2.50"],
+        ("wild.test", "A"): ["192.0.2.1"],
+        ("www.wild.test", "A"): ["192.0.2.10"],
+    })
+    blacklist = tmp_path / "blacklist.txt"
+    blacklist.write_text("wild.test(www,m)\n")
+    dns_cache = tmp_path / "ip_cache_user1000.json"
+    bundle_cache = tmp_path / "ip_cache_user1001.json"
+    resolution = internet_handler.resolution_options(max_workers=4, timeout=1, deadline=10, resolvers=[server.spec])
+    record_restriction(1000, dns_cache, dict(resolution, cache_format="json", shared=False))
+    record_restriction(1001, bundle_cache, dict(resolution, bundle=str(tmp_path / "lab.bundle"), cache_format="json", shared=False))
+
+    # The daemon's own settings point at nothing; the recorded ones must be used
+    daemon = RestrictionDaemon(blacklist, socket_path=str(tmp_path / "daemon.sock"), resolvers=["127.0.0.1:9"], timeout=0.2)
+    try:
+        daemon.load_manifests()
+        daemon.load_blacklist()
+        assert daemon.resolution_passes() == {(4, 1, 10, (server.spec,)): [str(dns_cache)]}
+        names = daemon.pop_due(time.time())
+        assert sorted(names) == ["m.wild.test", "wild.test", "www.wild.test"]
+        daemon.start_resolution(names)
+        daemon.worker.join()
+        assert daemon.finish_resolution()
+    finally:
+        for fd in daemon.wakeup:
+            os.close(fd)
+
+    targets = daemon.caches[str(dns_cache)]["targets"]
+    assert set(targets["www.wild.test"]) == {"192.0.2.10"}
+    assert set(targets["m.wild.test"]) == {"192.0.2.50"}
+    assert set(targets["wild.test"]) == {"192.0.2.1"}
+    # The wildcard probe ran, as in update-restriction
+    assert any(name.startswith("contest-probe-") for name, _ in server.queries)
+    assert load_cache(bundle_cache)["targets"] == {}
+    assert str(bundle_cache) not in daemon.dirty
+
+def test_reload_is_queued_and_answered_at_once(tmp_path, monkeypatch):
+    blacklist = tmp_path / "blacklist.txt"
+    blacklist.write_text("example.com\n")
+    daemon = RestrictionDaemon(blacklist, socket_path=str(tmp_path / "daemon.sock"))
+    reloads = []
+    monkeypatch.setattr(daemon, "reload", lambda: reloads.append(True))
+    try:
+        assert daemon.handle_command({"command": "reload"}) == {"ok": True, "accepted": True}
+        assert reloads == []
+        assert daemon.status()["reload_pending"]
+        # The main loop is woken up to run it
+        assert os.read(daemon.wakeup[0], 512) == b"\0"
+    finally:
+        for fd in daemon.wakeup:
+            os.close(fd)
@@ -0,0 +1,81 @@
+"""
+Tests for dns_handler.resolve_names against local DNS server stand-ins
+"""
+
+from contest_manager.utils.dns_handler import resolve_names
+
+def test_resolves_a_and_aaaa(dns_server):
+    server = dns_server({
+        ("site.test", "A"): ["192.0.2.1"],
+        ("site.test", "AAAA"): ["2001:db8::1"],
+    })
+    results, statuses, canonical = resolve_names(["site.test", "missing.test"], timeout=1, resolvers=[server.spec])
+    assert set(results["site.test"]) == {"192.0.2.1", "2001:db8::1"}
+    assert statuses == {"site.test": "ok", "missing.test": "nxdomain"}
+    assert canonical == {}
+    # NXDOMAIN covers every record type, so no AAAA query is sent for a missing name
+    assert server.queries["missing.test", "AAAA"] == 0
+
+def test_aaaa_is_queried_when_a_times_out(dns_server):
+    server = dns_server({("slow.test", "AAAA"): ["2001:db8::2"]}, drop=[("slow.test", "A")])
+    results, statuses, _ = resolve_names(["slow.test"], timeout=0.3, resolvers=[server.spec])
+    assert set(results["slow.test"]) == {"2001:db8::2"}
+    assert statuses["slow.test"] == "ok"
+
+def test_aliases_share_one_aaaa_query(dns_server):
+    server = dns_server({
+        ("www.site.test", "CNAME"): ["edge.cdn.test"],
+        ("m.site.test", "CNAME"): ["edge.cdn.test"],
+        ("edge.cdn.test", "A"): ["192.0.2.7"],
+        ("edge.cdn.test", "AAAA"): ["2001:db8::7"],
+    })
+    results, statuses, canonical = resolve_names(["www.site.test", "m.site.test"], timeout=1, resolvers=[server.spec])
+    assert canonical == {"www.site.test": "edge.cdn.test", "m.site.test": "edge.cdn.test"}
+    for name in ("www.site.test", "m.site.test"):
+        assert set(results[name]) == {"192.0.2.7", "2001:db8::7"}
+        assert statuses[name] == "ok"
+    assert server.queries["edge.cdn.test", "AAAA"] == 1
+
+def test_answers_of_every_resolver_are_merged(dns_server):
+    east = dns_server({("cdn.test", "A"): ["192.0.2.1"], ("shared.test", "A"): ["192.0.2.9"]})
+    west = dns_server({("cdn.test", "A"): ["192.0.2.2"], ("shared.test", "A"): ["192.0.2.9"]})
+    stats = {}
+    results, statuses, _ = resolve_names(["cdn.test", "shared.test"], timeout=1, stats=stats, resolvers=[east.spec, west.spec])
+    assert set(results["cdn.test"]) == {"192.0.2.1", "192.0.2.2"}
+    assert statuses == {"cdn.test": "ok", "shared.test": "ok"}
+    for spec in (east.spec, west.spec):
+        usage = stats["resolvers"][spec]
+        # One A and one AAAA query per name; the AAAA queries answer NODATA
+        assert (usage["queries"], usage["answers"], usage["timeouts"]) == (4, 2, 0)
+        assert (usage["ips"], usage["unique_ips"]) == (2, 1)
+        assert not usage["unreachable"]
+
+def test_timed_out_resolver_is_cut_off_while_another_answers(dns_server):
+    names = [f"site{i}.test" for i in range(6)]
+    up = dns_server({(name, "A"): [f"192.0.2.{i}"] for i, name in enumerate(names)})
+    down = dns_server(drop=names)
+    stats = {}
+    results, statuses, _ = resolve_names(names, max_workers=2, timeout=0.3, breaker_threshold=2, stats=stats,
+                                         resolvers=[up.spec, down.spec])
+    assert all(statuses[name] == "ok" and results[name] for name in names)
+    assert not stats["unreachable"]
+    assert not stats["deadline_hit"]
+    assert stats["resolvers"][up.spec]["answers"] == len(names)
+    assert not stats["resolvers"][up.spec]["unreachable"]
+    usage = stats["resolvers"][down.spec]
+    assert usage["unreachable"]
+    assert usage["timeouts"] >= 2
+    assert usage["answers"] == 0 and usage["ips"] == 0
+    # Once the breaker tripped the resolver was not queried any more
+    assert sum(down.queries.values()) < 2 * len(names)
+
+def test_every_resolver_unreachable_skips_the_rest(dns_server):
+    names = [f"site{i}.test" for i in range(8)]
+    down = dns_server(drop=names)
+    stats = {}
+    results, statuses, _ = resolve_names(names, max_workers=1, timeout=0.2, breaker_threshold=2, stats=stats,
+                                         resolvers=[down.spec])
+    assert stats["unreachable"]
+    assert set(statuses.values()) <= {"timeout", "skipped"}
+    assert stats["skipped"] > 0
+    assert all(not answers for answers in results.values())
@@ -0,0 +1,102 @@
+"""
+Tests for internet_handler with the firewall commands replaced by recorded fakes
+"""
+
+import os
+import json
+import pwd
+import subprocess
+
+import pytest
+
+from contest_manager.utils import internet_handler
+from contest_manager.utils.cache_handler import new_cache, save_cache, merge_resolved
+from contest_manager.utils.iptables_handler import group_owner, user_chain
+
+def fake_firewall(monkeypatch, saved):
+    """Answer `<family>-save` from `saved` ({family: text}) and fail every other command; returns the recorded calls."""
+    calls = []
+
+    def run(cmd, *args, **kwargs):
+        calls.append(cmd)
+        if cmd[0].endswith("-save"):
+            return subprocess.CompletedProcess(cmd, 0, saved.get(cmd[0][:-len("-save")], ""), "")
+        return subprocess.CompletedProcess(cmd, 1, "", "")
+
+    monkeypatch.setattr(subprocess, "run", run)
+    return calls
+
+def test_restriction_check_reads_each_family_once(monkeypatch):
+    entry = pwd.getpwuid(os.getuid())
+    gid = os.getgrouplist(entry.pw_name, entry.pw_gid)[-1]
+    owner = group_owner(gid)
+    saved = {"ip6tables": (
+        "*filter\n:OUTPUT ACCEPT [0:0]\n"
+        f":{user_chain(owner)} - [0:0]\n"
+        f"-A OUTPUT -m owner --gid-owner {gid} --suppl-groups -j {user_chain(owner)}\n"
+        "COMMIT\n"
+    )}
+    calls = fake_firewall(monkeypatch, saved)
+    assert internet_handler.internet_restriction_check(entry.pw_name)
+    assert [cmd[0] for cmd in calls] == ["iptables-save", "ip6tables-save"]
+
+def test_restriction_check_falls_back_to_nftables(monkeypatch):
+    entry = pwd.getpwuid(os.getuid())
+    calls = fake_firewall(monkeypatch, {})
+    assert not internet_handler.internet_restriction_check(entry.pw_name)
+    assert [cmd[0] for cmd in calls] == ["iptables-save", "ip6tables-save", "nft"]
+
+def test_generated_subdomain_with_own_record_is_resolved(dns_server):
+    server = dns_server({
+        ("*.wild.test", "A"): ["192.0.2.50"],
+        ("*.wild.test", "AAAA"): ["2001:db8::50"],
+        ("wild.test", "A"): ["192.0.2.1"],
+        ("www.wild.test", "A"): ["192.0.2.10"],
+        ("www.wild.test", "AAAA"): ["2001:db8::10"],
+    })
+    groups = [("wild.test", ["wild.test", "www.wild.test", "m.wild.test"])]
+    stats = {}
+    resolved, statuses = internet_handler.resolve_targets(
+        targets=["wild.test", "www.wild.test", "m.wild.test"], timeout=1, groups=groups, stats=stats,
+        resolvers=[server.spec], generated={"www.wild.test", "m.wild.test"}
+    )
+    assert set(resolved["www.wild.test"]) == {"192.0.2.10", "2001:db8::10"}
+    assert set(resolved["m.wild.test"]) == {"192.0.2.50", "2001:db8::50"}
+    assert set(resolved["wild.test"]) == {"192.0.2.1"}
+    assert all(status == "ok" for status in statuses.values())
+    assert stats["wildcard"] == 1
+    # The wildcard-answered name is looked up for A only; its AAAA comes from the probe
+    assert server.queries["m.wild.test", "A"] == 1
+    assert server.queries["m.wild.test", "AAAA"] == 0
+
+@pytest.mark.parametrize("incremental", [False, True], ids=["restrict", "update"])
+def test_corrupted_cache_keeps_the_installed_rules(monkeypatch, incremental):
+    user = pwd.getpwuid(os.getuid()).pw_name
+    cache_path = internet_handler.get_cache_path(user, "binary")
+    save_cache(cache_path, merge_resolved(new_cache(), {"blocked.test": {"192.0.2.1": 300}}))
+    data = bytearray(cache_path.read_bytes())
+    data[-1] ^= 0xff
+    cache_path.write_bytes(bytes(data))
+    commits = []
+    monkeypatch.setattr(internet_handler, "restore_ruleset", lambda *args, **kwargs: commits.append(args) or True)
+    monkeypatch.setattr(internet_handler, "restore_ruleset_delta", lambda *args, **kwargs: commits.append(args) or (0, 0, 0))
+    calls = fake_firewall(monkeypatch, {})
+    assert not internet_handler.apply_restrictions_from_cache(user, cache_format="binary", incremental=incremental)
+    assert commits == []
+    assert calls == []
+    assert not internet_handler.get_manifest_path(os.getuid()).exists()
+
+def test_update_leaves_a_cache_of_unknown_schema_alone(tmp_path):
+    blacklist = tmp_path / "blacklist.txt"
+    blacklist.write_text("blocked.test\n")
+    cache_path = internet_handler.get_cache_path("participant")
+    cache_path.write_text(json.dumps({"version": 3, "targets": {"blocked.test": {}}}))
+    before = cache_path.read_bytes()
+    assert internet_handler.update_ip_cache("participant", blacklist, timeout=0.1) == (False, None)
+    assert cache_path.read_bytes() == before
+
+def test_nftables_refuses_to_run_without_the_stub_resolver(monkeypatch, capsys):
+    calls = fake_firewall(monkeypatch, {})
+    assert not internet_handler.apply_restrictions_from_cache(pwd.getpwuid(os.getuid()).pw_name, backend="nftables")
+    assert calls == []
+    assert "--stub-resolver" in capsys.readouterr().out
@@ -0,0 +1,61 @@
+"""
+Tests for iptables_handler with iptables-save and iptables-restore replaced by recorded fakes
+"""
+
+import subprocess
+
+import pytest
+
+from contest_manager.utils.iptables_handler import (
+    build_jump_rule, build_ruleset, restore_ruleset, restore_ruleset_delta, user_chain,
+)
+
+UID = 1000
+CHAIN = user_chain(UID)
+OLD_RULE = f"-A {CHAIN} -d 192.0.2.1/32 -j DROP"
+
+def fake_restore(monkeypatch, saved):
+    """
+    Answer `<family>-save` from `saved` ({family: text}), accept every restore call except
+    the ip6tables commit, and return the recorded (cmd, payload) pairs.
+    """
+    calls = []
+
+    def run(cmd, *args, input=None, **kwargs):
+        calls.append((cmd, input))
+        if cmd[0].endswith("-save"):
+            return subprocess.CompletedProcess(cmd, 0, saved.get(cmd[0][:-len("-save")], ""), "")
+        failed = cmd[0] == "ip6tables-restore" and "--test" not in cmd
+        return subprocess.CompletedProcess(cmd, int(failed), "", "")
+
+    monkeypatch.setattr(subprocess, "run", run)
+    return calls
+
+def installed(jump=True):
+    jump_line = " ".join(build_jump_rule(UID)) + "\n" if jump else ""
+    return f"*filter\n:OUTPUT ACCEPT [0:0]\n:{CHAIN} - [0:0]\n{jump_line}{OLD_RULE}\nCOMMIT\n"
+
+def commits(calls, family):
+    return [payload for cmd, payload in calls if cmd[0] == f"{family}-restore" and "--test" not in cmd]
+
+@pytest.mark.parametrize("apply", [restore_ruleset, restore_ruleset_delta])
+def test_ipv4_is_rolled_back_when_the_ipv6_commit_fails(monkeypatch, apply):
+    calls = fake_restore(monkeypatch, {"iptables": installed(), "ip6tables": installed()})
+    ruleset = build_ruleset(UID, {"example.com": ["198.51.100.7", "2001:db8::7"]}, name_rules=False)
+
+    assert not apply(UID, ruleset)
+
+    new_rules, rollback = commits(calls, "iptables")
+    assert "198.51.100.7" in new_rules
+    assert OLD_RULE in rollback.splitlines()
+    assert "198.51.100.7" not in rollback
+
+def test_rollback_removes_a_chain_that_did_not_exist(monkeypatch):
+    calls = fake_restore(monkeypatch, {})
+    ruleset = build_ruleset(UID, {"example.com": ["198.51.100.7", "2001:db8::7"]}, name_rules=False)
+
+    assert not restore_ruleset(UID, ruleset)
+
+    rollback = commits(calls, "iptables")[-1].splitlines()
+    assert " ".join(["-D"] + build_jump_rule(UID)[1:]) in rollback
+    assert f"-X {CHAIN}" in rollback
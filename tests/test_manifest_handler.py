@@ -0,0 +1,65 @@
+"""
+Tests for verifying restriction manifests against a recorded firewall state
+"""
+
+import subprocess
+
+from contest_manager.utils.iptables_handler import FAMILIES, build_ruleset, build_jump_rule, user_chain
+from contest_manager.utils.ipset_handler import user_set_names, read_ip_sets
+from contest_manager.utils.manifest_handler import ACTIVE, DRIFTED, build_manifest, verify_manifest
+
+BLOCKS = ["192.0.2.0/24", "198.51.100.7", "2001:db8::/48"]
+
+def ipset_state(uid, members):
+    """Return the installed state of an applied ipset-backend restriction whose sets hold `members`."""
+    set_names = user_set_names(uid)
+    ruleset = build_ruleset(uid, {}, set_names=set_names, blocks=BLOCKS)
+    state = {}
+    for family in FAMILIES:
+        state[family] = {"filter": {
+            "OUTPUT": [build_jump_rule(uid)],
+            user_chain(uid): [args for args, _ in ruleset[family]],
+        }}
+    state["ipset"] = {name: [] for name in set_names.values()}
+    for member in members:
+        state["ipset"][set_names["ip6tables" if ':' in member else "iptables"]].append(member)
+    return state, ruleset
+
+def ipset_manifest(tmp_path, uid, ruleset):
+    cache_path = tmp_path / "ip_cache.json"
+    cache_path.write_text("{}")
+    return build_manifest(uid, "participant", None, [uid], "ipset", ruleset, BLOCKS, cache_path)
+
+def test_ipset_members_matching_the_blocks_are_active(tmp_path):
+    state, ruleset = ipset_state(1000, ["192.0.2.0/24", "198.51.100.7", "2001:db8::/48"])
+    report = verify_manifest(ipset_manifest(tmp_path, 1000, ruleset), state)
+    assert report["status"] == ACTIVE, report["problems"]
+
+def test_flushed_ipset_is_drifted(tmp_path):
+    state, ruleset = ipset_state(1000, [])
+    report = verify_manifest(ipset_manifest(tmp_path, 1000, ruleset), state)
+    assert report["status"] == DRIFTED
+    assert report["problems"] == ["0 set member(s) installed, 3 expected"]
+
+def test_stale_ipset_is_drifted(tmp_path):
+    state, ruleset = ipset_state(1000, ["192.0.2.0/24", "203.0.113.9", "2001:db8::/48"])
+    report = verify_manifest(ipset_manifest(tmp_path, 1000, ruleset), state)
+    assert report["status"] == DRIFTED
+    assert report["problems"] == ["installed set members differ from the applied blocks"]
+
+def test_read_ip_sets_parses_one_save_listing(monkeypatch):
+    output = (
+        "create contest-1000-v4 hash:net family inet hashsize 1024 maxelem 65536\n"
+        "add contest-1000-v4 192.0.2.0/24\n"
+        "add contest-1000-v4 198.51.100.7\n"
+        "create contest-1000-v6 hash:net family inet6 hashsize 1024 maxelem 65536\n"
+    )
+    calls = []
+
+    def run(cmd, *args, **kwargs):
+        calls.append(cmd)
+        return subprocess.CompletedProcess(cmd, 0, output, "")
+
+    monkeypatch.setattr(subprocess, "run", run)
+    assert read_ip_sets() == {"contest-1000-v4": ["192.0.2.0/24", "198.51.100.7"], "contest-1000-v6": []}
+    assert calls == [["ipset", "save"]]
@@ -0,0 +1,59 @@
+"""
+Tests for the nft scripts rendered by nftables_handler
+"""
+
+import re
+
+from contest_manager.utils.cidr_handler import compact_ip_map
+from contest_manager.utils.iptables_handler import build_ruleset
+from contest_manager.utils.ipset_handler import user_set_names
+from contest_manager.utils.nftables_handler import render_apply_payload, render_remove_payload, restricted_uids
+
+def owners_map(*pairs):
+    return {"map": {"name": "owners", "elem": [[uid, {"jump": {"target": chain}}] for uid, chain in pairs]}}
+
+def test_group_does_not_take_over_a_restricted_user():
+    state = [owners_map((1000, "CONTEST-1000"))]
+    payload = render_apply_payload("g1001", [1000, 1002], ["192.0.2.0/24"], state)
+    # The user's own owners map entry is left alone; the group dispatches from its own base chain
+    assert "delete element inet contest owners" not in payload
+    assert "add element inet contest owners" not in payload
+    assert "add element inet contest contest-g1001-uids { 1000, 1002 }" in payload
+    assert "meta skgid 1001 jump CONTEST-G1001" in payload
+    assert "meta skuid @contest-g1001-uids jump CONTEST-G1001" in payload
+
+def test_group_members_mapped_by_owners_map_are_moved():
+    state = [owners_map((1000, "CONTEST-G1001"), (1003, "CONTEST-1003"))]
+    payload = render_apply_payload("g1001", [1000], ["192.0.2.0/24"], state)
+    assert "delete element inet contest owners { 1000 }" in payload
+
+def test_user_and_group_restrictions_are_both_reported_and_removed():
+    state = [
+        owners_map((1000, "CONTEST-1000")),
+        {"chain": {"name": "CONTEST-G1001"}},
+        {"chain": {"name": "CONTEST-G1001-OUTPUT"}},
+        {"set": {"name": "contest-g1001-uids", "elem": [1000, 1002]}},
+    ]
+    assert restricted_uids(state) == {1000: "CONTEST-1000", 1002: "CONTEST-G1001"}
+    payload = render_remove_payload("g1001", state)
+    assert "delete chain inet contest CONTEST-G1001-OUTPUT" in payload
+    assert "delete set inet contest contest-g1001-uids" in payload
+    assert "owners" not in payload
+
+def test_blocks_the_same_targets_as_iptables():
+    ip_map = {
+        "site.test": ["192.0.2.1", "192.0.2.2", "2001:db8::1"],
+        "www.site.test": ["192.0.2.1"],
+        "cdn.test": ["198.51.100.7", "2001:db8:1::/48"],
+    }
+    blocks, _ = compact_ip_map(ip_map, ["203.0.113.0/24"])
+    # With the stub resolver blocking names, iptables keeps only the address rules
+    ruleset = build_ruleset(1000, ip_map, blocks=blocks, name_rules=False)
+    iptables = {args[args.index("-d") + 1] for rules in ruleset.values() for args, _ in rules}
+    assert not any("string" in args for rules in ruleset.values() for args, _ in rules)
+    payload = render_apply_payload(1000, [1000], blocks)
+    nftables = set()
+    for name in user_set_names(1000).values():
+        for elements in re.findall(rf"add element inet contest {name} {{ (.*) }}", payload):
+            nftables.update(elements.split(", "))
+    assert nftables == iptables == set(blocks)
@@ -0,0 +1,120 @@
+"""
+Tests for building, loading and installing from offline package bundles with fake packages
+"""
+
+import os
+import json
+import shutil
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from contest_manager.utils.package_bundle_handler import (
+    MANIFEST_NAME, PackageBundleError, build_package_bundle, load_package_bundle, write_apt_index, write_bundle_apt_config
+)
+
+def fake_packaging(monkeypatch, depends):
+    """Replace apt-cache and apt-get with fakes; `depends` maps a package to its dependency closure."""
+    run = subprocess.run
+
+    def fake_run(cmd, *args, cwd=None, **kwargs):
+        if cmd[:2] == ['apt-cache', 'depends']:
+            names = {dep for pkg in cmd if pkg in depends for dep in depends[pkg]}
+            return subprocess.CompletedProcess(cmd, 0, "".join(f"{name}\n  Depends: <virtual>\n" for name in sorted(names)), "")
+        if cmd[:2] == ['apt-get', 'download']:
+            for name in cmd[2:]:
+                (Path(cwd) / f"{name}_1.0_all.deb").write_bytes(f"fake package {name}".encode())
+            return subprocess.CompletedProcess(cmd, 0, "", "")
+        if cmd[0] in ('dpkg-scanpackages', 'apt-ftparchive'):
+            index = "".join(f"Package: {path.name.split('_')[0]}\nFilename: ./{path.name}\n\n" for path in sorted(Path(cwd).glob('*.deb')))
+            return subprocess.CompletedProcess(cmd, 0, index, "")
+        return run(cmd, *args, cwd=cwd, **kwargs)
+
+    monkeypatch.setattr(subprocess, "run", fake_run)
+
+@pytest.fixture
+def bundle(tmp_path, monkeypatch):
+    config_dir = tmp_path / "config"
+    config_dir.mkdir()
+    (config_dir / "apt.txt").write_text("# compilers\ngcc\n")
+    fake_packaging(monkeypatch, {"gcc": ["gcc", "libc6"], "snapd": ["snapd", "libc6"], "flatpak": ["flatpak"]})
+    bundle_dir = tmp_path / "bundle"
+    manifest = build_package_bundle(config_dir, bundle_dir)
+    return bundle_dir, manifest
+
+def test_built_bundle_loads_with_every_file_checksummed(bundle):
+    bundle_dir, manifest = bundle
+    assert manifest["apt"] == ["gcc", "snapd", "flatpak"]
+    assert all(not failed for failed in manifest["failed"].values())
+    assert sorted(manifest["files"]) == [
+        "apt/Packages", "apt/flatpak_1.0_all.deb", "apt/gcc_1.0_all.deb", "apt/libc6_1.0_all.deb", "apt/snapd_1.0_all.deb"
+    ]
+    assert load_package_bundle(bundle_dir) == manifest
+
+@pytest.mark.parametrize("content, message", [
+    (None, "not found"),
+    ("{", "not valid JSON"),
+    (json.dumps({"format": "something-else", "version": 1}), "is not a contest-manager package bundle"),
+    (json.dumps({"format": "contest-manager-packages", "version": 99}), "unsupported package bundle version 99"),
+    (json.dumps({"format": "contest-manager-packages", "version": 1}), "has no file checksums"),
+])
+def test_bad_header_is_rejected(tmp_path, content, message):
+    if content is not None:
+        (tmp_path / MANIFEST_NAME).write_text(content)
+    with pytest.raises(PackageBundleError, match=message):
+        load_package_bundle(tmp_path)
+
+def test_corrupted_package_fails_its_checksum(bundle):
+    bundle_dir, _ = bundle
+    deb = bundle_dir / "apt" / "gcc_1.0_all.deb"
+    deb.write_bytes(deb.read_bytes()[:-1])
+    with pytest.raises(PackageBundleError, match="checksum mismatch for apt/gcc_1.0_all.deb"):
+        load_package_bundle(bundle_dir)
+    # The header alone can still be read, e.g. to report what the bundle holds
+    assert load_package_bundle(bundle_dir, verify=False)["apt"] == ["gcc", "snapd", "flatpak"]
+
+def test_missing_package_is_rejected(bundle):
+    bundle_dir, _ = bundle
+    (bundle_dir / "apt" / "libc6_1.0_all.deb").unlink()
+    with pytest.raises(PackageBundleError, match="apt/libc6_1.0_all.deb is missing"):
+        load_package_bundle(bundle_dir)
+
+def test_apt_config_reads_only_the_bundle(tmp_path):
+    apt_dir = tmp_path / "bundle" / "apt"
+    apt_dir.mkdir(parents=True)
+    config = Path(write_bundle_apt_config(tmp_path / "bundle"))
+    try:
+        state_dir = config.parent
+        assert (state_dir / "sources.list").read_text() == f"deb [trusted=yes] file:{apt_dir.resolve()} ./\n"
+        assert (state_dir / "lists" / "partial").is_dir()
+        settings = config.read_text()
+        assert f'Dir::Etc::SourceList "{state_dir / "sources.list"}";' in settings
+        assert f'Dir::State::Lists "{state_dir / "lists"}";' in settings
+        assert 'APT::Sandbox::User "root";' in settings
+    finally:
+        shutil.rmtree(config.parent)
+
+@pytest.mark.skipif(not all(shutil.which(tool) for tool in ('dpkg-deb', 'dpkg-scanpackages', 'apt-get', 'apt-cache')),
+                    reason="needs dpkg-dev and apt")
+def test_apt_installs_from_a_tiny_local_bundle(tmp_path):
+    package = tmp_path / "contest-fake"
+    (package / "DEBIAN").mkdir(parents=True)
+    (package / "DEBIAN" / "control").write_text(
+        "Package: contest-fake\nVersion: 1.0\nArchitecture: all\nMaintainer: Lab <lab@example.com>\nDescription: fake package\n"
+    )
+    apt_dir = tmp_path / "bundle" / "apt"
+    apt_dir.mkdir(parents=True)
+    subprocess.run(['dpkg-deb', '--build', str(package), str(apt_dir / "contest-fake_1.0_all.deb")], check=True,
+                   stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    assert write_apt_index(apt_dir)
+    config = write_bundle_apt_config(tmp_path / "bundle")
+    env = dict(os.environ, APT_CONFIG=config)
+    try:
+        subprocess.run(['apt-get', 'update', '-q'], env=env, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        policy = subprocess.run(['apt-cache', 'policy', 'contest-fake'], env=env, check=True,
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True).stdout
+        assert "Candidate: 1.0" in policy
+        assert f"file:{apt_dir.resolve()} ./" in policy
+    finally:
+        shutil.rmtree(Path(config).parent)
@@ -0,0 +1,39 @@
+"""
+Tests for the blocking stub resolver against a local upstream stand-in
+"""
+
+import dns.query
+import dns.rcode
+import dns.message
+import pytest
+
+from contest_manager.utils.domain_matcher import build_matcher
+from contest_manager.utils.stub_resolver_handler import start_stub_resolver, stop_stub_resolver
+
+@pytest.fixture
+def stub(dns_server):
+    upstream = dns_server({
+        ("allowed.test", "A"): ["192.0.2.1"],
+        ("blocked.test", "A"): ["192.0.2.66"],
+    })
+    servers = start_stub_resolver(build_matcher(["blocked.test"]), "127.0.0.1", upstream_port=upstream.port, port=0,
+                                  addresses=("127.0.0.1",), timeout=1)
+    assert len(servers) == 2
+    yield upstream, servers[0].server_address[1]
+    stop_stub_resolver(servers)
+
+@pytest.mark.parametrize("send", [dns.query.udp, dns.query.tcp], ids=["udp", "tcp"])
+def test_blocked_names_get_nxdomain(stub, send):
+    upstream, port = stub
+    for name in ("blocked.test", "www.blocked.test"):
+        response = send(dns.message.make_query(name, "A"), "127.0.0.1", port=port, timeout=2)
+        assert response.rcode() == dns.rcode.NXDOMAIN
+        assert upstream.queries[name, "A"] == 0
+
+@pytest.mark.parametrize("send", [dns.query.udp, dns.query.tcp], ids=["udp", "tcp"])
+def test_allowed_names_are_forwarded(stub, send):
+    upstream, port = stub
+    response = send(dns.message.make_query("allowed.test", "A"), "127.0.0.1", port=port, timeout=2)
+    assert response.rcode() == dns.rcode.NOERROR
+    assert [rdata.to_text() for rdata in response.answer[0]] == ["192.0.2.1"]
+    assert upstream.queries["allowed.test", "A"] == 1